@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+勤怠データの書き込み (write_attendance_rows) のベンチマーク
+
+日ごとに DataFrame を絞り込んで書き込む従来の方法 (31回の比較と iloc[0]) と、
+対象月の日付に一度だけ並べてから列ごとのリストで書き込む現在の方法を比較する。
+31日の月で両者の書き込み結果が同じであることも確認する。
+
+使い方:
+    python benchmarks/bench_calendar_alignment.py [--repeat 200]
+"""
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import openpyxl  # noqa: E402
+import pandas as pd  # noqa: E402
+from loguru import logger  # noqa: E402
+
+from processors.csv_processor import process_data  # noqa: E402
+from processors.excel_processor import START_ROW, write_attendance_rows  # noqa: E402
+
+
+def make_month(year: int, month: int) -> pd.DataFrame:
+    """1か月分の勤怠データ (土日は所定休日、10日はデータなし) を作成して整形"""
+    dates = pd.date_range(f"{year}-{month:02d}-01", periods=pd.Period(f"{year}-{month:02d}").days_in_month)
+    dates = dates[dates.day != 10]
+    weekend = dates.dayofweek >= 5
+    raw = pd.DataFrame({
+        "日付": dates,
+        "始業時刻": ["" if w else "9:00" for w in weekend],
+        "終業時刻": ["" if w else "18:30" for w in weekend],
+        "総勤務時間": ["0:00" if w else "8:00" for w in weekend],
+        "法定内残業": "0:00",
+        "時間外労働": ["0:00" if w else "0:30" for w in weekend],
+        "深夜労働": "0:00",
+        "勤怠種別": ["所定休日" if w else "通常勤務" for w in weekend],
+    })
+    return process_data(raw)
+
+
+def write_rows_legacy(sheet, df: pd.DataFrame, year: int, month: int, start_row: int = START_ROW):
+    """従来の書き込み (日ごとに DataFrame を絞り込む)"""
+    for i in range(31):
+        row_idx = start_row + i
+        current_day = i + 1
+
+        day_data = df[df["日付"].dt.day == current_day]
+        sheet[f"A{row_idx}"] = f"=DATE({year},{month},{current_day})"
+
+        if not day_data.empty:
+            row = day_data.iloc[0]
+            if "始業時刻" in row and pd.notnull(row["始業時刻"]):
+                sheet[f"C{row_idx}"] = row["始業時刻"]
+            if "終業時刻" in row and pd.notnull(row["終業時刻"]):
+                sheet[f"D{row_idx}"] = row["終業時刻"]
+
+            is_workday = row.get("勤怠種別") not in ["未入力", "所定休日", "法定休日"]
+            sheet[f"E{row_idx}"] = "1:00" if is_workday else ""
+
+            if "総勤務時間" in row and pd.notnull(row["総勤務時間"]):
+                sheet[f"F{row_idx}"] = row["総勤務時間"]
+            if "時間外労働" in row and pd.notnull(row["時間外労働"]):
+                sheet[f"G{row_idx}"] = row["時間外労働"]
+            if "深夜労働" in row and pd.notnull(row["深夜労働"]):
+                sheet[f"H{row_idx}"] = row["深夜労働"]
+
+
+def sheet_values(sheet) -> list:
+    """書き込み範囲 (A〜H列、31日分) の値"""
+    return [[cell.value for cell in row] for row in sheet.iter_rows(min_row=START_ROW, max_row=START_ROW + 30, max_col=8)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=200, help="計測の繰り返し回数")
+    args = parser.parse_args()
+
+    logger.remove()
+    year, month = 2025, 3
+    df = make_month(year, month)
+
+    legacy_sheet = openpyxl.Workbook().active
+    current_sheet = openpyxl.Workbook().active
+    write_rows_legacy(legacy_sheet, df, year, month)
+    write_attendance_rows(current_sheet, df, year, month)
+    identical = sheet_values(legacy_sheet) == sheet_values(current_sheet)
+
+    legacy = timeit.timeit(lambda: write_rows_legacy(legacy_sheet, df, year, month), number=args.repeat)
+    current = timeit.timeit(lambda: write_attendance_rows(current_sheet, df, year, month), number=args.repeat)
+    legacy_ms = legacy / args.repeat * 1000
+    current_ms = current / args.repeat * 1000
+
+    print(f"{year}年{month}月 ({len(df)}行), {args.repeat}回の平均")
+    print(f"  従来 (日ごとの絞り込み): {legacy_ms:.2f} ms/人")
+    print(f"  現在 (カレンダーに整列): {current_ms:.2f} ms/人 ({legacy_ms / current_ms:.1f}倍)")
+    print(f"  書き込み結果の一致: {identical}")
+    return 0 if identical else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+CSVからkintoneレコードへの変換 (iter_csv_records) のベンチマーク
+
+ファイル全体を読み込んで iterrows() で1セルずつ変換する従来の方法と、
+chunk_size 行ずつ列単位で変換して1件ずつ返す現在の方法を比較する。
+処理時間と、変換したレコードを順に送信する (保持しない) 場合のメモリ使用量のピークを計測する。
+
+使い方:
+    python benchmarks/bench_csv_to_records.py [--rows 50000]
+"""
+import argparse
+import csv
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import pandas as pd  # noqa: E402
+from loguru import logger  # noqa: E402
+
+from processors.kintone_client import KintoneClient  # noqa: E402
+from utils import open_csv_buffer  # noqa: E402
+
+
+def make_csv(path: Path, rows: int):
+    """勤怠データ形式のCSV (備考は一部のみ入力) を作成"""
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["社員番号", "氏名", "日付", "始業時刻", "終業時刻", "総勤務時間", "時間外労働", "深夜労働", "勤怠種別", "備考"])
+        for i in range(rows):
+            writer.writerow([
+                f"{i % 500:05d}", f"社員{i % 500}", f"2025-03-{i % 31 + 1:02d}", "9:00", "18:00",
+                "8:00", "0:30", "0:00", "通常勤務", "出張" if i % 7 == 0 else "",
+            ])
+
+
+def csv_to_records_legacy(csv_file: str) -> list:
+    """従来の変換 (ファイル全体を読み込み、iterrows() で1セルずつ変換)"""
+    with open_csv_buffer(csv_file) as (buffer, encoding):
+        df = pd.read_csv(buffer, encoding=encoding)
+
+    records = []
+    for _, row in df.iterrows():
+        record = {}
+        for col in df.columns:
+            value = row[col]
+            if pd.isna(value):
+                continue
+            if isinstance(value, pd.Timestamp):
+                value = value.strftime("%Y-%m-%d")
+            record[col] = {"value": str(value)}
+        records.append(record)
+    return records
+
+
+def consume(records) -> int:
+    """レコードを保持せずに1件ずつ読み込む (送信処理の代わり)"""
+    count = 0
+    for _ in records:
+        count += 1
+    return count
+
+
+def measure(func) -> tuple:
+    """(処理時間 秒, 件数) と (メモリ使用量のピーク MB) を計測"""
+    start = time.perf_counter()
+    count = func()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    tracemalloc.stop()
+    return elapsed, count, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=50000, help="CSVの行数")
+    args = parser.parse_args()
+
+    logger.remove()
+    client = KintoneClient("example.cybozu.com", api_token="token")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_file = str(Path(tmp) / "records.csv")
+        make_csv(Path(csv_file), args.rows)
+
+        legacy = measure(lambda: consume(csv_to_records_legacy(csv_file)))
+        current = measure(lambda: consume(client.iter_csv_records(csv_file)))
+
+    print(f"{args.rows}行 x 10列")
+    print(f"  従来 (iterrows):       {legacy[0]:.2f} 秒, {legacy[1]}件, ピーク {legacy[2]:.1f} MB")
+    print(f"  現在 (列単位・逐次):   {current[0]:.2f} 秒, {current[1]}件, ピーク {current[2]:.1f} MB "
+          f"({legacy[0] / current[0]:.1f}倍)")
+    return 0 if legacy[1] == current[1] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,13 +5,14 @@
 """
 import os
 import sys
-from dataclasses import dataclass
+import threading
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 from dynaconf import Dynaconf
 from loguru import logger
-from dotenv import load_dotenv
+from dotenv import dotenv_values
 
 
 @dataclass
@@ -22,11 +23,31 @@ class Config:
     INPUT_DIR: str
     OUTPUT_DIR: str
     LOG_DIR: str
+    CACHE_DIR: str = "cache"
     KINTONE_DOMAIN: Optional[str] = None
     KINTONE_API_TOKEN: Optional[str] = None
     SLACK_WEBHOOK_URL: Optional[str] = None
     DEADLINE: Optional[str] = None
     REMIND_DAYS_BEFORE: int = 5
+    MAX_WORKERS: int = 4
+    CSV_ENGINE: str = "pandas"
+    WATCH_INTERVAL: float = 5.0
+    WATCH_PATTERNS: List[str] = field(default_factory=lambda: ["*.csv"])
+    WATCH_OBSERVER: str = "native"
+    WATCH_ROUTES: List[Dict[str, Any]] = field(default_factory=list)
+    KINTONE_CONNECT_TIMEOUT: float = 5.0
+    KINTONE_READ_TIMEOUT: float = 30.0
+    KINTONE_MAX_RETRIES: int = 3
+    KINTONE_CONCURRENCY: int = 4
+    KINTONE_CACHE_TTL: int = 86400
+    KINTONE_DAILY_LIMIT: int = 10000
+    KINTONE_RATE_LIMIT: float = 10.0
+    KINTONE_MAX_CONCURRENT: int = 10
+    KINTONE_INTERACTIVE_RESERVE: int = 1000
+    KINTONE_EMPLOYEE_FIELD: str = "従業員名"
+    KINTONE_DATE_FIELD: str = "日付"
+    KINTONE_UPDATED_FIELD: str = "更新日時"
+    KINTONE_UPSERT_KEY: Optional[List[str]] = None
 
 
 def get_base_path() -> Path:
@@ -41,22 +62,84 @@ def get_base_path() -> Path:
     return base_path
 
 
-def init_config() -> Config:
-    """設定を初期化して返す"""
+# 読み込み済みの設定 (設定ファイルが更新されるまで再利用する)
+_config_cache: Dict[str, Any] = {"stamp": None, "config": None}
+_config_lock = threading.Lock()
+
+# .envから設定した環境変数名
+_dotenv_keys = set()
+
+
+def _settings_stamp(paths: List[Path]) -> Tuple:
+    """設定ファイルの更新日時とサイズの組を取得 (存在しないファイルはNone)"""
+    stamp = []
+    for path in paths:
+        try:
+            stat = path.stat()
+            stamp.append((str(path), stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            stamp.append((str(path), None, None))
+    return tuple(stamp)
+
+
+def _load_dotenv(env_file: Path):
+    """
+    .envファイルを環境変数に読み込む
+
+    起動時から設定されている環境変数は上書きしない。
+    以前に.envから設定した値は、.envの変更に合わせて更新する。
+    """
+    for key, value in dotenv_values(str(env_file)).items():
+        if value is None:
+            continue
+        if key not in os.environ or key in _dotenv_keys:
+            os.environ[key] = value
+            _dotenv_keys.add(key)
+
+
+def init_config(reload: bool = False) -> Config:
+    """
+    設定を初期化して返す
+
+    settings.toml、.secrets.toml、.env の更新日時が前回の読み込み時から
+    変わっていなければ、読み込み済みの設定をそのまま返す。
+
+    Args:
+        reload: Trueの場合は常に設定ファイルを読み直す
+
+    Returns:
+        Config: 設定オブジェクト (プロセス内で共有されるため変更しないこと)
+    """
     # 基準パスの取得
     base_path = get_base_path()
 
-    # .envファイルを読み込み (存在する場合)
-    env_file = base_path / '.env'
-    if env_file.exists():
-        load_dotenv(dotenv_path=str(env_file))
-
     # 設定ファイルのパス
+    env_file = base_path / '.env'
     settings_files = [
         base_path / 'config' / 'settings.toml',
         base_path / '.secrets.toml',
     ]
 
+    with _config_lock:
+        stamp = _settings_stamp([env_file, *settings_files])
+        if not reload and _config_cache["config"] is not None and _config_cache["stamp"] == stamp:
+            return _config_cache["config"]
+
+        config = _load_config(base_path, env_file, settings_files)
+
+        # デフォルト設定ファイルを作成した場合に備えて読み込み後の状態を記録
+        _config_cache["stamp"] = _settings_stamp([env_file, *settings_files])
+        _config_cache["config"] = config
+
+    return config
+
+
+def _load_config(base_path: Path, env_file: Path, settings_files: List[Path]) -> Config:
+    """設定ファイルを読み込んでConfigを作成"""
+    # .envファイルを読み込み (存在する場合)
+    if env_file.exists():
+        _load_dotenv(env_file)
+
     # 存在確認
     config_dir = base_path / 'config'
     if not config_dir.exists():
@@ -82,22 +165,43 @@ def init_config() -> Config:
         INPUT_DIR=settings.get('input_dir', str(base_path / 'input')),
         OUTPUT_DIR=settings.get('output_dir', str(base_path / 'output')),
         LOG_DIR=settings.get('log_dir', str(base_path / 'logs')),
+        CACHE_DIR=settings.get('cache_dir', str(base_path / 'cache')),
         KINTONE_DOMAIN=settings.get('kintone_domain', os.getenv('KINTONE_DOMAIN')),
         KINTONE_API_TOKEN=settings.get('kintone_api_token', os.getenv('KINTONE_API_TOKEN')),
         SLACK_WEBHOOK_URL=settings.get('slack_webhook_url', os.getenv('SLACK_WEBHOOK_URL')),
         DEADLINE=settings.get('deadline', None),
         REMIND_DAYS_BEFORE=int(settings.get('remind_days_before', 5)),
+        MAX_WORKERS=int(settings.get('max_workers', 4)),
+        CSV_ENGINE=settings.get('csv_engine', 'pandas'),
+        WATCH_INTERVAL=float(settings.get('watch_interval', 5)),
+        WATCH_PATTERNS=list(settings.get('watch_patterns', ['*.csv']) or ['*.csv']),
+        WATCH_OBSERVER=settings.get('watch_observer', 'native'),
+        WATCH_ROUTES=[dict(route) for route in settings.get('watch_routes', []) or []],
+        KINTONE_CONNECT_TIMEOUT=float(settings.get('kintone_connect_timeout', 5.0)),
+        KINTONE_READ_TIMEOUT=float(settings.get('kintone_read_timeout', 30.0)),
+        KINTONE_MAX_RETRIES=int(settings.get('kintone_max_retries', 3)),
+        KINTONE_CONCURRENCY=int(settings.get('kintone_concurrency', 4)),
+        KINTONE_CACHE_TTL=int(settings.get('kintone_cache_ttl', 86400)),
+        KINTONE_DAILY_LIMIT=int(settings.get('kintone_daily_limit', 10000)),
+        KINTONE_RATE_LIMIT=float(settings.get('kintone_rate_limit', 10.0)),
+        KINTONE_MAX_CONCURRENT=int(settings.get('kintone_max_concurrent', 10)),
+        KINTONE_INTERACTIVE_RESERVE=int(settings.get('kintone_interactive_reserve', 1000)),
+        KINTONE_EMPLOYEE_FIELD=settings.get('kintone_employee_field', '従業員名'),
+        KINTONE_DATE_FIELD=settings.get('kintone_date_field', '日付'),
+        KINTONE_UPDATED_FIELD=settings.get('kintone_updated_field', '更新日時'),
+        KINTONE_UPSERT_KEY=list(settings.get('kintone_upsert_key', []) or []),
     )
 
     # 必要なディレクトリがなければ作成
     ensure_directories(config)
 
+    logger.debug("設定ファイルを読み込みました")
     return config
 
 
 def ensure_directories(config: Config):
     """必要なディレクトリを作成"""
-    dirs = [config.INPUT_DIR, config.OUTPUT_DIR, config.LOG_DIR, os.path.dirname(config.TEMPLATE_PATH)]
+    dirs = [config.INPUT_DIR, config.OUTPUT_DIR, config.LOG_DIR, config.CACHE_DIR, os.path.dirname(config.TEMPLATE_PATH)]
     for d in dirs:
         os.makedirs(d, exist_ok=True)
 
@@ -191,17 +295,18 @@ def get_deadline_date():
     return deadline.strftime("%Y-%m-%d")
 
 
-# エクスポート用の変数
-INPUT_DIR = None
-OUTPUT_DIR = None
-LOG_DIR = None
-TEMPLATE_PATH = None
-DEFAULT_EMPLOYEE_NAME = None
-
-# 初期化時に値を設定
-_config = init_config()
-INPUT_DIR = _config.INPUT_DIR
-OUTPUT_DIR = _config.OUTPUT_DIR
-LOG_DIR = _config.LOG_DIR
-TEMPLATE_PATH = _config.TEMPLATE_PATH
-DEFAULT_EMPLOYEE_NAME = _config.EMPLOYEE_NAME
\ No newline at end of file
+# エクスポート用の変数 (参照された時点で設定を読み込む)
+_EXPORTS = {
+    'INPUT_DIR': 'INPUT_DIR',
+    'OUTPUT_DIR': 'OUTPUT_DIR',
+    'LOG_DIR': 'LOG_DIR',
+    'TEMPLATE_PATH': 'TEMPLATE_PATH',
+    'DEFAULT_EMPLOYEE_NAME': 'EMPLOYEE_NAME',
+}
+
+
+def __getattr__(name: str):
+    """モジュール変数 (INPUT_DIR など) を遅延して設定から取得"""
+    if name in _EXPORTS:
+        return getattr(init_config(), _EXPORTS[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -15,11 +15,10 @@ from rich.traceback import install
 from loguru import logger
 
 # 自作モジュールのインポート
+# pandas/openpyxl/requests を使用する処理モジュールは、info や check の起動を
+# 遅くしないよう各コマンドの中でインポートする
 from config import Config, init_config
-from processors.csv_processor import read_csv, process_data
-from processors.excel_processor import write_to_excel
-from processors.kintone_client import KintoneClient
-from utils import setup_logging, ensure_directories, find_latest_file
+from utils import setup_logging, ensure_directories, find_latest_file, safe_filename
 
 # リッチなトレースバックを有効化
 install(show_locals=True)
@@ -32,6 +31,63 @@ conf = init_config()
 # ロギングの設定
 setup_logging()
 
+
+def create_kintone_cache():
+    """設定からkintoneのアプリID・フィールド設定のキャッシュを作成"""
+    from processors.kintone_cache import KintoneMetadataCache
+
+    return KintoneMetadataCache(conf.CACHE_DIR, conf.KINTONE_DOMAIN, conf.KINTONE_CACHE_TTL)
+
+
+def create_ledger():
+    """処理済みファイルの台帳を開く"""
+    from processors.ledger import ProcessingLedger, LEDGER_FILENAME
+
+    return ProcessingLedger(os.path.join(conf.LOG_DIR, LEDGER_FILENAME))
+
+
+_kintone_scheduler = None
+
+
+def create_kintone_scheduler():
+    """設定からkintone APIリクエストのスケジューラを作成 (プロセス内のクライアントで共有)"""
+    global _kintone_scheduler
+    from processors.kintone_budget import KintoneRequestScheduler
+
+    if _kintone_scheduler is None:
+        _kintone_scheduler = KintoneRequestScheduler(
+            conf.CACHE_DIR,
+            conf.KINTONE_DOMAIN,
+            daily_limit=conf.KINTONE_DAILY_LIMIT,
+            rate=conf.KINTONE_RATE_LIMIT,
+            max_concurrent=conf.KINTONE_MAX_CONCURRENT,
+            interactive_reserve=conf.KINTONE_INTERACTIVE_RESERVE,
+        )
+    return _kintone_scheduler
+
+
+def create_kintone_client(background: bool = False):
+    """
+    設定からkintoneクライアントを作成
+
+    Args:
+        background: バックグラウンドの同期かどうか (対話的な実行より後に送信し、1日の上限の一部を残す)
+    """
+    from processors.kintone_budget import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+    from processors.kintone_client import KintoneClient
+
+    return KintoneClient(
+        conf.KINTONE_DOMAIN,
+        conf.KINTONE_API_TOKEN,
+        timeout=(conf.KINTONE_CONNECT_TIMEOUT, conf.KINTONE_READ_TIMEOUT),
+        max_retries=conf.KINTONE_MAX_RETRIES,
+        concurrency=conf.KINTONE_CONCURRENCY,
+        cache=create_kintone_cache(),
+        scheduler=create_kintone_scheduler(),
+        priority=PRIORITY_BACKGROUND if background else PRIORITY_INTERACTIVE,
+    )
+
+
 @app.callback()
 def callback():
     """勤怠表自動変換ツール - 勤怠CSVをExcelに転記します"""
@@ -42,17 +98,27 @@ def callback():
 
 @app.command("run")
 def run(
-    file: str = typer.Option(..., "--file", "-f", help="処理するCSVファイルのパス"),
+    file: Optional[str] = typer.Option(None, "--file", "-f", help="処理するCSVファイルのパス (kintone_pull / kintone_sync では不要)"),
     template: Optional[str] = typer.Option(None, "--template", "-t", help="テンプレートExcelファイルのパス"),
     name: Optional[str] = typer.Option(None, "--name", "-n", help="従業員名を指定"),
-    mode: str = typer.Option("normal", "--mode", "-m", help="処理モード (normal, kintone_pull, kintone_push)"),
+    mode: str = typer.Option("normal", "--mode", "-m", help="処理モード (normal, kintone_pull, kintone_push, kintone_sync)"),
     app_name: Optional[str] = typer.Option(None, "--app_name", help="kintoneアプリ名"),
     out_file: Optional[str] = typer.Option(None, "--out_file", help="出力ファイル名"),
+    bulk: bool = typer.Option(False, "--bulk", help="kintone_pushで最大2,000件ずつ1トランザクションで送信 (bulkRequest)"),
+    key: Optional[List[str]] = typer.Option(None, "--key", help="kintone_pushでレコードを照合するキーのフィールド (複数指定可、省略時は設定値 kintone_upsert_key)"),
+    force: bool = typer.Option(False, "--force", help="同じ内容のCSVから作成済みの勤怠表があっても作り直す"),
 ):
     """CSVファイルをExcelの勤怠表に変換します"""
+    from processors.csv_processor import read_csv, process_data
+    from processors.excel_processor import write_to_excel
+
     try:
         # パスの正規化
-        file = Path(file).resolve()
+        if not file and mode not in ("kintone_pull", "kintone_sync"):
+            logger.error("処理するCSVファイルを --file で指定してください")
+            console.print("[bold red]エラー:[/] 処理するCSVファイルを --file で指定してください")
+            return 1
+        file = Path(file or ".").resolve()
 
         # テンプレートが指定されていない場合はデフォルトを使用
         if not template:
@@ -61,7 +127,7 @@ def run(
             template = Path(template).resolve()
 
         # ファイルの存在確認
-        if not file.exists() and mode != "kintone_pull":
+        if not file.exists() and mode not in ("kintone_pull", "kintone_sync"):
             logger.error(f"指定されたファイルが存在しません: {file}")
             console.print(f"[bold red]エラー:[/] 指定されたファイルが存在しません: {file}")
             return 1
@@ -76,6 +142,41 @@ def run(
             name = conf.EMPLOYEE_NAME
 
         # 処理モードに応じた処理を実行
+        if mode == "kintone_sync":
+            if not app_name:
+                logger.error("kintone_syncモードではapp_nameが必須です")
+                console.print("[bold red]エラー:[/] kintone_syncモードではapp_nameが必須です")
+                return 1
+
+            from processors.kintone_sync import KintoneSync
+
+            # 前回以降に更新されたレコードだけを取得し、該当する従業員・月の勤怠表を再作成
+            with create_kintone_client(background=True) as kintone:
+                syncer = KintoneSync(
+                    kintone,
+                    app_name,
+                    os.path.join(conf.CACHE_DIR, "kintone_sync"),
+                    employee_field=conf.KINTONE_EMPLOYEE_FIELD,
+                    date_field=conf.KINTONE_DATE_FIELD,
+                    updated_field=conf.KINTONE_UPDATED_FIELD,
+                )
+                with console.status("[bold green]kintoneと同期しています..."):
+                    result = syncer.sync(str(template), conf.OUTPUT_DIR, name, conf.MAX_WORKERS, conf.CSV_ENGINE)
+                logger.info(f"kintone通信統計: {kintone.stats}")
+
+            for item in result["results"]:
+                if item["success"]:
+                    console.print(f"  [green]作成:[/] {item['output']}")
+                else:
+                    console.print(f"  [red]失敗:[/] {os.path.basename(item['file'])}: {item['message']}")
+
+            if not result["success"]:
+                console.print(f"[bold red]エラー:[/] {result['message']}")
+                return 1
+
+            console.print(f"[bold green]成功:[/] {result['message']}")
+            return 0
+
         if mode == "kintone_pull":
             if not app_name:
                 logger.error("kintone_pullモードではapp_nameが必須です")
@@ -83,16 +184,21 @@ def run(
                 return 1
 
             # kintoneからデータを取得
-            kintone = KintoneClient(conf.KINTONE_DOMAIN, conf.KINTONE_API_TOKEN)
-            records = kintone.get_records(app_name)
-
             # 出力ファイル名が指定されていない場合はデフォルトを生成
             if not out_file:
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
                 out_file = os.path.join(conf.INPUT_DIR, f"kintone_data_{timestamp}.csv")
 
-            # CSVとして保存
-            kintone.save_as_csv(records, out_file)
+            # 取得しながらCSVとして保存 (列はフォームの定義に従う)
+            with create_kintone_client() as kintone:
+                fieldnames = kintone.get_record_fieldnames(app_name)
+                saved = kintone.save_as_csv(kintone.iter_records(app_name), out_file, fieldnames=fieldnames)
+                logger.info(f"kintone通信統計: {kintone.stats}")
+
+            if not saved:
+                logger.error(f"kintoneからデータを取得できませんでした: {app_name}")
+                console.print(f"[bold red]エラー:[/] kintoneからデータを取得できませんでした: {app_name}")
+                return 1
             logger.info(f"kintoneからデータを取得し、{out_file}に保存しました")
             console.print(f"[bold green]成功:[/] kintoneからデータを取得し、{out_file}に保存しました")
 
@@ -110,22 +216,58 @@ def run(
                 console.print("[bold red]エラー:[/] kintone_pushモードではapp_nameが必須です")
                 return 1
 
-            # CSVからデータを読み込みkintoneにアップロード
-            kintone = KintoneClient(conf.KINTONE_DOMAIN, conf.KINTONE_API_TOKEN)
-            records = kintone.csv_to_records(str(file))
-            result = kintone.add_records(app_name, records)
+            key_fields = key or conf.KINTONE_UPSERT_KEY
+
+            # CSVを読み込みながらkintoneにアップロード
+            with create_kintone_client() as kintone:
+                records = kintone.iter_csv_records(str(file))
+                if key_fields:
+                    # キーで照合し、新しいレコードと変更されたレコードだけを送信
+                    from processors.kintone_upsert import KintoneUpserter
+
+                    upserter = KintoneUpserter(
+                        kintone, app_name, key_fields, os.path.join(conf.CACHE_DIR, "kintone_push")
+                    )
+                    result = upserter.upsert(records, use_bulk=bulk)
+                else:
+                    result = kintone.add_records(app_name, records, use_bulk=bulk)
+                logger.info(f"kintone通信統計: {kintone.stats}")
+
+            if not result["success"]:
+                console.print(f"[bold red]エラー:[/] {result['message']}")
+                for chunk in result.get("chunks", []):
+                    if not chunk["success"]:
+                        operation = chunk.get("operation", "")
+                        console.print(
+                            f"  - {operation}{chunk['start'] + 1}〜{chunk['start'] + chunk['count']}件目: {chunk['message']}"
+                        )
+                if not key_fields and result.get("committed"):
+                    # キーがない場合は追加のみのため、そのまま再実行すると登録済みの行が重複する
+                    console.print(
+                        f"[yellow]注意:[/] {result['committed']}件は登録済みです。"
+                        "再実行する場合は --key で照合するか、登録済みの行を除いてください"
+                    )
+                return 1
 
-            logger.info(f"kintoneにデータをアップロードしました: {result}")
-            console.print(f"[bold green]成功:[/] kintoneにデータをアップロードしました")
+            logger.info(f"kintoneにデータをアップロードしました: {result['message']}")
+            console.print(f"[bold green]成功:[/] kintoneにデータをアップロードしました ({result['message']})")
             return 0
 
         # 通常の処理フロー
         logger.info(f"ファイル処理開始: {file}")
         console.print(f"[bold]処理開始:[/] {file}")
 
+        # 同じ内容のCSVから作成済みの勤怠表があればスキップ
+        with create_ledger() as ledger:
+            ledger_key, existing = ledger.check(str(file), str(template), name, conf.OUTPUT_DIR)
+        if existing and not force:
+            logger.info(f"変更がないためスキップしました: {file} -> {existing}")
+            console.print(f"[bold green]スキップ:[/] 同じ内容のCSVから作成済みです: {existing} (作り直す場合は --force)")
+            return 0
+
         # CSVデータを読み込み
         with console.status("[bold green]CSVファイルを読み込んでいます..."):
-            df = read_csv(str(file))
+            df = read_csv(str(file), engine=conf.CSV_ENGINE)
             logger.info(f"CSVファイル読み込み完了: {len(df)}行")
 
         # CSVから月情報を取得
@@ -146,6 +288,10 @@ def run(
             write_to_excel(str(template), output_path, df_processed, str(file))
             logger.info(f"Excelファイル書き込み完了: {output_path}")
 
+        if ledger_key:
+            with create_ledger() as ledger:
+                ledger.record(ledger_key, str(file), output_path)
+
         console.print(f"[bold green]✅ 処理完了:[/] 勤怠表を作成しました: {output_path}")
         return 0
 
@@ -155,21 +301,147 @@ def run(
         return 1
 
 
+@app.command("run-batch")
+def run_batch(
+    directory: Optional[str] = typer.Option(None, "--directory", "-d", help="処理するCSVファイルのディレクトリ (省略時は入力ディレクトリ)"),
+    pattern: str = typer.Option("*.csv", "--pattern", "-p", help="処理するファイルパターン"),
+    template: Optional[str] = typer.Option(None, "--template", "-t", help="テンプレートExcelファイルのパス"),
+    workers: Optional[int] = typer.Option(None, "--workers", "-w", help="並列ワーカー数 (省略時は設定値 max_workers)"),
+    force: bool = typer.Option(False, "--force", help="同じ内容のCSVから作成済みの勤怠表があっても作り直す"),
+):
+    """ディレクトリ内のCSVファイルをまとめてExcelの勤怠表に変換します"""
+    import glob
+    from rich.table import Table
+    from processors.pipeline import run_batch as run_batch_files
+
+    directory = Path(directory or conf.INPUT_DIR).resolve()
+    template = Path(template or conf.TEMPLATE_PATH).resolve()
+    max_workers = workers or conf.MAX_WORKERS
+
+    if not template.exists():
+        logger.error(f"指定されたテンプレートファイルが存在しません: {template}")
+        console.print(f"[bold red]エラー:[/] 指定されたテンプレートファイルが存在しません: {template}")
+        return 1
+
+    files = sorted(glob.glob(str(directory / pattern)))
+    if not files:
+        logger.warning(f"処理対象のファイルが見つかりません: {directory / pattern}")
+        console.print(f"[bold yellow]処理対象のファイルが見つかりません:[/] {directory / pattern}")
+        return 0
+
+    console.print(f"[bold]一括処理開始:[/] {len(files)}件 (ワーカー数: {max_workers})")
+
+    with console.status("[bold green]勤怠表を一括作成しています..."), create_ledger() as ledger:
+        results = run_batch_files(
+            files, str(template), conf.OUTPUT_DIR, conf.EMPLOYEE_NAME, max_workers, conf.CSV_ENGINE,
+            ledger=ledger, force=force,
+        )
+
+    # 処理結果の一覧
+    table = Table(title="一括処理結果")
+    table.add_column("ファイル")
+    table.add_column("結果")
+    table.add_column("行数", justify="right")
+    table.add_column("処理時間", justify="right")
+    table.add_column("出力 / エラー")
+
+    for result in results:
+        table.add_row(
+            os.path.basename(result["file"]),
+            "[yellow]スキップ[/]" if result["skipped"] else "[green]成功[/]" if result["success"] else "[red]失敗[/]",
+            str(result["rows"]),
+            f"{result['elapsed']:.2f}秒",
+            os.path.basename(result["output"]) if result["success"] else result["message"],
+        )
+
+    console.print(table)
+
+    failed = [r for r in results if not r["success"]]
+    skipped = [r for r in results if r["skipped"]]
+    console.print(
+        f"[bold]成功:[/] {len(results) - len(failed) - len(skipped)}件  [bold]スキップ:[/] {len(skipped)}件  "
+        f"[bold]失敗:[/] {len(failed)}件"
+    )
+
+    return 1 if failed else 0
+
+
+@app.command("kintone-pull-apps")
+def kintone_pull_apps(
+    app_names: List[str] = typer.Argument(..., help="取得するkintoneアプリ名 (複数指定可)"),
+    out_dir: Optional[str] = typer.Option(None, "--out_dir", help="出力ディレクトリ (省略時は入力ディレクトリ)"),
+):
+    """複数のkintoneアプリのレコードを並行して取得し、アプリごとにCSVに保存します"""
+    import asyncio
+    from processors.kintone_async import AsyncKintoneClient
+
+    out_dir = Path(out_dir or conf.INPUT_DIR).resolve()
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    out_files = {name: str(out_dir / f"kintone_{safe_filename(name)}_{timestamp}.csv") for name in app_names}
+
+    async def pull_all():
+        async with AsyncKintoneClient(
+            conf.KINTONE_DOMAIN,
+            conf.KINTONE_API_TOKEN,
+            timeout=(conf.KINTONE_CONNECT_TIMEOUT, conf.KINTONE_READ_TIMEOUT),
+            max_retries=conf.KINTONE_MAX_RETRIES,
+            concurrency=conf.KINTONE_CONCURRENCY,
+            cache=create_kintone_cache(),
+            scheduler=create_kintone_scheduler(),
+        ) as kintone:
+            results = await asyncio.gather(*(kintone.pull_to_csv(name, out_files[name]) for name in app_names))
+            logger.info(f"kintone通信統計: {kintone.stats}")
+            return results
+
+    with console.status("[bold green]kintoneからデータを取得しています..."):
+        results = asyncio.run(pull_all())
+
+    for name, saved in zip(app_names, results):
+        if saved:
+            console.print(f"[bold green]成功:[/] {name} → {out_files[name]}")
+        else:
+            console.print(f"[bold red]失敗:[/] {name}")
+
+    return 0 if all(results) else 1
+
+
 @app.command("watch")
 def watch(
-    directory: str = typer.Option("input", "--directory", "-d", help="監視するディレクトリ"),
-    pattern: str = typer.Option("*.csv", "--pattern", "-p", help="監視するファイルパターン"),
+    directory: Optional[str] = typer.Option(None, "--directory", "-d", help="監視するディレクトリ (省略時は設定値 watch_routes のすべてのディレクトリ、未設定の場合は input)"),
+    pattern: Optional[List[str]] = typer.Option(None, "--pattern", "-p", help="監視するファイルパターン (複数指定可、省略時は設定値 watch_patterns)"),
     hours: int = typer.Option(8, "--hours", "-h", help="監視を継続する時間（時間）。デフォルトは8時間（業務時間）"),
+    force: bool = typer.Option(False, "--force", help="同じ内容のCSVから作成済みの勤怠表があっても作り直す"),
+    observer: Optional[str] = typer.Option(None, "--observer", help="監視方式 native / polling (省略時は設定値 watch_observer)"),
+    interval: Optional[float] = typer.Option(None, "--interval", help="pollingの間隔（秒、省略時は設定値 watch_interval）"),
 ):
     """指定されたディレクトリを監視し、新しいファイルが追加されたら自動的に処理します"""
-    from watcher import start_watching
-
-    logger.info(f"ディレクトリの監視を開始します: {directory}, パターン: {pattern}, 時間: {hours}時間")
-    console.print(f"[bold]ディレクトリの監視を開始します:[/] {directory}, パターン: {pattern}, 時間: {hours}時間")
+    from watcher import load_routes, start_watching
+
+    # ディレクトリの指定がなければ、設定の振り分け表のすべてのディレクトリを監視
+    routes = None
+    if directory is None and conf.WATCH_ROUTES:
+        try:
+            routes = load_routes(conf.WATCH_ROUTES, conf)
+        except ValueError as e:
+            logger.error(f"監視ディレクトリの振り分け設定が不正です: {str(e)}")
+            console.print(f"[bold red]エラー:[/] 監視ディレクトリの振り分け設定が不正です: {str(e)}")
+            return 1
+        if pattern:
+            for route in routes:
+                route.patterns = list(pattern)
+    directory = directory or "input"
+    patterns = pattern or conf.WATCH_PATTERNS
+
+    if routes:
+        logger.info(f"ディレクトリの監視を開始します: {len(routes)}件の振り分け, 時間: {hours}時間")
+        console.print(f"[bold]ディレクトリの監視を開始します:[/] {len(routes)}件の振り分け, 時間: {hours}時間")
+    else:
+        logger.info(f"ディレクトリの監視を開始します: {directory}, パターン: {', '.join(patterns)}, 時間: {hours}時間")
+        console.print(f"[bold]ディレクトリの監視を開始します:[/] {directory}, パターン: {', '.join(patterns)}, 時間: {hours}時間")
     console.print("監視を停止するには Ctrl+C を押してください")
 
     try:
-        start_watching(directory, pattern, hours)
+        start_watching(directory, patterns, hours, force=force, observer_mode=observer, interval=interval, routes=routes)
     except KeyboardInterrupt:
         logger.info("ユーザーによって監視が停止されました")
         console.print("[bold yellow]監視を停止しました[/]")
@@ -222,6 +494,19 @@ def info():
     console.print(f"  kintoneドメイン: {conf.KINTONE_DOMAIN if conf.KINTONE_DOMAIN else '未設定'}")
     console.print(f"  kintone APIトークン: {'設定済み' if conf.KINTONE_API_TOKEN else '未設定'}")
 
+    # 本日のkintone APIリクエスト数と残り
+    if conf.KINTONE_DOMAIN:
+        usage = create_kintone_scheduler().usage()
+        app_names = create_kintone_cache().app_names()
+        limit = f"{usage['limit']}件/アプリ" if usage["limit"] else "上限なし"
+        console.print(f"  kintone APIリクエスト数 ({usage['date']}, {limit}):")
+        if not usage["apps"]:
+            console.print("    まだリクエストしていません")
+        for app_id, count in sorted(usage["apps"].items(), key=lambda item: -item[1]):
+            label = f"{app_names[app_id]} (ID: {app_id})" if app_id in app_names else f"ID: {app_id}"
+            remaining = f" (残り {max(0, usage['limit'] - count)}件)" if usage["limit"] else ""
+            console.print(f"    {label}: {count}件{remaining}")
+
     # 最新のCSVファイルを検索
     latest_csv = find_latest_file(conf.INPUT_DIR, "*.csv")
     if latest_csv:
@@ -4,21 +4,108 @@
 CSV処理モジュール
 """
 import os
+import io
+import csv
+import codecs
+import numpy as np
 import pandas as pd
 from datetime import datetime
 from pathlib import Path
+from typing import Tuple
 from loguru import logger
 from tqdm import tqdm
 
-from utils import detect_csv_encoding, parse_time_str
+from utils import open_csv_buffer
 
+# 時間表記 (HH:MM) のパターン
+TIME_PATTERN = r"^\s*([+-]?\d+)\s*:\s*([+-]?\d+)\s*$"
 
-def read_csv(csv_path: str) -> pd.DataFrame:
+# 必須カラム
+REQUIRED_COLUMNS = ["日付", "始業時刻", "終業時刻", "総勤務時間"]
+
+# 処理で使用するカラム
+TARGET_COLUMNS = [
+    "日付", "始業時刻", "終業時刻", "総勤務時間",
+    "法定内残業", "時間外労働", "深夜労働", "勤怠種別"
+]
+
+
+def _has_pyarrow() -> bool:
+    """pyarrowが利用可能か確認"""
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        logger.warning("pyarrowがインストールされていないため、pandasでCSVを読み込みます")
+        return False
+
+
+def _read_header(data, encoding: str) -> list:
+    """CSVの先頭行からカラム名を取得"""
+    head = codecs.getincrementaldecoder(encoding)().decode(bytes(data[:64 * 1024]), final=False)
+    return next(csv.reader(io.StringIO(head)), [])
+
+
+def _read_csv_arrow(buffer, encoding: str) -> pd.DataFrame:
+    """
+    pyarrowのCSVリーダーで処理に必要なカラムだけを読み込む
+
+    時間のカラムは文字列、勤怠種別はカテゴリ型として読み込み、日付は読み込み時に変換する。
+
+    Args:
+        buffer: open_csv_buffer が返すバッファ
+        encoding: エンコーディング
+
+    Returns:
+        DataFrame: 読み込んだデータ
+    """
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+
+    # メモリマップの場合はデコード前のバッファを使用
+    raw = getattr(buffer, "stream", None)
+    data = raw if raw is not None else buffer.getbuffer()
+
+    # 存在するカラムのみを読み込み対象にする
+    header = _read_header(data, encoding)
+    include_columns = [col for col in TARGET_COLUMNS if col in header]
+
+    column_types = {col: pa.string() for col in include_columns}
+    if "勤怠種別" in column_types:
+        column_types["勤怠種別"] = pa.dictionary(pa.int32(), pa.string())
+
+    def read(date_type):
+        if "日付" in column_types:
+            column_types["日付"] = date_type
+        return pa_csv.read_csv(
+            pa.py_buffer(data),
+            read_options=pa_csv.ReadOptions(encoding=encoding),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=include_columns,
+                column_types=column_types,
+                strings_can_be_null=True,
+                timestamp_parsers=[pa_csv.ISO8601, "%Y/%m/%d", "%Y/%m/%d %H:%M:%S"],
+            ),
+        )
+
+    try:
+        table = read(pa.timestamp("s"))
+    except pa.ArrowInvalid as e:
+        # 日付の書式が想定外の場合は文字列で読み込み、後でpandasで変換する
+        logger.debug(f"日付カラムを読み込み時に変換できませんでした: {str(e)}")
+        table = read(pa.string())
+
+    return table.to_pandas()
+
+
+def read_csv(csv_path: str, engine: str = "pandas") -> pd.DataFrame:
     """
     CSVファイルを読み込み、DataFrameとして返す
 
     Args:
         csv_path: CSVファイルのパス
+        engine: 読み込みエンジン ("pandas" または "pyarrow")。
+            "pyarrow" の場合は処理に必要なカラムのみを型指定して読み込む
 
     Returns:
         DataFrame: 読み込んだデータ
@@ -32,17 +119,17 @@ def read_csv(csv_path: str) -> pd.DataFrame:
         logger.error(f"ファイルが存在しません: {csv_path}")
         raise FileNotFoundError(f"ファイルが存在しません: {csv_path}")
 
-    # エンコーディングを自動検出
-    encoding = detect_csv_encoding(csv_path)
-    logger.info(f"CSVエンコーディング: {encoding}")
-
     try:
-        # CSVを読み込み
-        df = pd.read_csv(csv_path, encoding=encoding)
+        # ファイルを一度だけ読み込み、エンコーディングを自動検出してからCSVとして解析
+        with open_csv_buffer(csv_path) as (buffer, encoding):
+            logger.info(f"CSVエンコーディング: {encoding}")
+            if engine == "pyarrow" and _has_pyarrow():
+                df = _read_csv_arrow(buffer, encoding)
+            else:
+                df = pd.read_csv(buffer, encoding=encoding)
 
         # 必須カラムの確認
-        required_columns = ["日付", "始業時刻", "終業時刻", "総勤務時間"]
-        missing_columns = [col for col in required_columns if col not in df.columns]
+        missing_columns = [col for col in REQUIRED_COLUMNS if col not in df.columns]
 
         if missing_columns:
             logger.error(f"必須カラムがありません: {', '.join(missing_columns)}")
@@ -65,12 +152,106 @@ def read_csv(csv_path: str) -> pd.DataFrame:
         raise
 
 
-def process_data(df: pd.DataFrame) -> pd.DataFrame:
+def read_year_month(csv_path: str) -> str:
+    """
+    CSVの日付カラムだけを読み込み、対象年月を取得
+
+    一括変換で出力先 (勤怠表_YYYYMM_氏名.xlsx) を事前に求めるために使用する。
+
+    Args:
+        csv_path: CSVファイルのパス
+
+    Returns:
+        str: 対象年月 (YYYYMM、日付の最小値の年月)
+
+    Raises:
+        ValueError: 日付カラムがない場合、日付に変換できない場合
+    """
+    with open_csv_buffer(csv_path) as (buffer, encoding):
+        try:
+            dates = pd.read_csv(buffer, encoding=encoding, usecols=["日付"])["日付"]
+        except ValueError as e:
+            raise ValueError(f"日付カラムを読み込めませんでした: {str(e)}")
+
+    return pd.to_datetime(dates).min().strftime("%Y%m")
+
+
+def _parse_time_values(values: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """
+    時間表記の値を小数時間に変換
+
+    Args:
+        values: 時間表記の値
+
+    Returns:
+        tuple: (小数時間のSeries, 変換できなかった値のマスク)
+    """
+    text = values.astype("string")
+    hours = pd.Series(0.0, index=values.index)
+
+    # HH:MM形式
+    has_colon = text.str.contains(":", regex=False).fillna(False).astype(bool)
+    parts = text[has_colon].str.extract(TIME_PATTERN)
+    is_time = parts[0].notna()
+    hours[is_time[is_time].index] = (
+        parts.loc[is_time, 0].astype(int) + parts.loc[is_time, 1].astype(int) / 60
+    )
+
+    # 数値のみの場合は時間とみなす
+    is_number = text.notna() & (text != "") & ~has_colon
+    numbers = pd.to_numeric(text[is_number], errors="coerce")
+    hours[numbers.index] = numbers.fillna(0.0)
+
+    invalid = pd.Series(False, index=values.index)
+    invalid[is_time[~is_time].index] = True
+    invalid[numbers[numbers.isna()].index] = True
+
+    return hours, invalid
+
+
+def parse_time_column(series: pd.Series) -> Tuple[pd.Series, int]:
+    """
+    時間表記 (HH:MM または小数時間) の列をまとめて小数時間に変換
+
+    utils.parse_time_str と同じ規則で変換する (空欄・欠損は0、"8" は8時間、
+    変換できない値は0)。数値型の列は小数時間としてそのまま使用する。
+    勤怠データの時間表記は種類が少ないため、重複を除いた値だけを変換して列全体に展開する。
+
+    Args:
+        series: 時間表記の列
+
+    Returns:
+        tuple: (小数時間のSeries, 変換できなかった値の件数)
+    """
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return series.astype(float).fillna(0.0), 0
+
+    # 値ごとのコードに置き換え (欠損値は -1)
+    codes, uniques = pd.factorize(series)
+    hours, invalid = _parse_time_values(pd.Series(uniques, dtype=object))
+
+    present = codes >= 0
+    result = np.zeros(len(series))
+    result[present] = hours.to_numpy()[codes[present]]
+
+    # 変換できなかった値
+    counts = np.bincount(codes[present], minlength=len(uniques))
+    invalid_mask = invalid.to_numpy()
+    invalid_count = int(counts[invalid_mask].sum())
+    if invalid_count:
+        samples = ", ".join(str(value) for value in uniques[invalid_mask][:3])
+        logger.warning(f"時間文字列のパースに失敗しました: {series.name} {invalid_count}件 (例: {samples})")
+
+    return pd.Series(result, index=series.index, name=series.name), invalid_count
+
+
+def process_data(df: pd.DataFrame, show_progress: bool = False) -> pd.DataFrame:
     """
     勤怠データを整形する
 
     Args:
         df: 元のDataFrame
+        show_progress: 時間変換の進捗バーを表示するかどうか
 
     Returns:
         DataFrame: 整形後のDataFrame
@@ -80,17 +261,11 @@ def process_data(df: pd.DataFrame) -> pd.DataFrame:
     # カラム一覧をログ
     logger.debug(f"入力データのカラム: {df.columns.tolist()}")
 
-    # 必要なカラムの選択
-    columns_to_keep = [
-        "日付", "始業時刻", "終業時刻", "総勤務時間",
-        "法定内残業", "時間外労働", "深夜労働", "勤怠種別"
-    ]
-
     # 存在するカラムのみを使用
-    available_columns = [col for col in columns_to_keep if col in df.columns]
+    available_columns = [col for col in TARGET_COLUMNS if col in df.columns]
 
     # 存在しないカラムをログ
-    missing_columns = [col for col in columns_to_keep if col not in df.columns]
+    missing_columns = [col for col in TARGET_COLUMNS if col not in df.columns]
     if missing_columns:
         logger.warning(f"以下のカラムが存在しないため、処理から除外します: {', '.join(missing_columns)}")
 
@@ -99,6 +274,10 @@ def process_data(df: pd.DataFrame) -> pd.DataFrame:
 
     # 勤怠種別の欠損値を処理
     if "勤怠種別" in df_filtered.columns:
+        # カテゴリ型で読み込んだ場合は補完値をカテゴリに追加
+        if isinstance(df_filtered["勤怠種別"].dtype, pd.CategoricalDtype) \
+                and "未入力" not in df_filtered["勤怠種別"].cat.categories:
+            df_filtered["勤怠種別"] = df_filtered["勤怠種別"].cat.add_categories("未入力")
         df_filtered["勤怠種別"] = df_filtered["勤怠種別"].fillna("未入力")
     else:
         df_filtered["勤怠種別"] = "通常勤務"
@@ -106,16 +285,15 @@ def process_data(df: pd.DataFrame) -> pd.DataFrame:
     # 時間を小数時間に変換
     logger.info("時間データを変換しています")
 
-    # 進捗バーに対応
-    tqdm.pandas(desc="時間変換")
-
     # 時間フィールドの変換
-    time_fields = ["総勤務時間", "法定内残業", "時間外労働", "深夜労働"]
-    for field in time_fields:
-        if field in df_filtered.columns:
-            df_filtered[field] = df_filtered[field].progress_apply(
-                lambda x: parse_time_str(x) / 3600 if pd.notnull(x) else 0
-            )
+    time_fields = [field for field in ["総勤務時間", "法定内残業", "時間外労働", "深夜労働"] if field in df_filtered.columns]
+    invalid_count = 0
+    for field in tqdm(time_fields, desc="時間変換", disable=not show_progress):
+        df_filtered[field], invalid = parse_time_column(df_filtered[field])
+        invalid_count += invalid
+
+    if invalid_count:
+        logger.warning(f"変換できなかった時間データ: {invalid_count}件 (0時間として扱います)")
 
     # 始業・終業時刻の欠損値を処理
     if "始業時刻" in df_filtered.columns:
@@ -5,6 +5,7 @@ Excel処理モジュール
 """
 import os
 import re
+import calendar
 from datetime import datetime
 from pathlib import Path
 
@@ -13,10 +14,110 @@ import openpyxl
 from openpyxl.utils import get_column_letter
 from loguru import logger
 
+from processors.template_cache import TemplateCache, get_template_cache
 from utils import backup_file, extract_employee_name_from_filename
 
+# 休憩時間を記入しない勤怠種別
+NON_WORKING_TYPES = ["未入力", "所定休日", "法定休日"]
 
-def write_to_excel(template_path: str, output_path: str, df: pd.DataFrame, csv_filename: str):
+# 勤怠データを書き込む開始行 (1日の行)
+START_ROW = 11
+
+# 勤怠データの書き込み先の列
+CELL_COLUMNS = {
+    "始業時刻": "C",
+    "終業時刻": "D",
+    "総勤務時間": "F",
+    "時間外労働": "G",
+    "深夜労働": "H",
+}
+
+
+def align_to_calendar(df: pd.DataFrame, year: int, month: int) -> pd.DataFrame:
+    """
+    勤怠データを対象月の日付順に並べる
+
+    日 (1日〜月末) をインデックスとし、データのない日は欠損値となる。
+    同じ日のデータが複数ある場合は先頭の行を使用する。
+
+    Args:
+        df: 日付カラムを含む勤怠データ
+        year: 対象年
+        month: 対象月
+
+    Returns:
+        DataFrame: 月の日数分の行を持つDataFrame (_has_data列でデータの有無を示す)
+    """
+    days_in_month = calendar.monthrange(year, month)[1]
+
+    aligned = (
+        df.assign(_day=df["日付"].dt.day, _has_data=True)
+        .drop_duplicates("_day", keep="first")
+        .set_index("_day")
+        .reindex(range(1, days_in_month + 1))
+    )
+    aligned["_has_data"] = aligned["_has_data"].notna()
+
+    return aligned
+
+
+def write_attendance_rows(sheet, df: pd.DataFrame, year: int, month: int, start_row: int = START_ROW):
+    """
+    勤怠データを1日1行でシートに書き込む
+
+    対象月の日付に合わせて並べたデータを列ごとのリストにしてから書き込む。
+    月の日数を超える行 (2月の29〜31日など) は日付を空欄にする。
+
+    Args:
+        sheet: 書き込み先のワークシート
+        df: 日付カラムを含む勤怠データ (31行以内)
+        year: 対象年
+        month: 対象月
+        start_row: 1日の行番号
+    """
+    # 対象月の日付に合わせてデータを並べる
+    aligned = align_to_calendar(df, year, month)
+    days_in_month = len(aligned)
+
+    # 列ごとの値と欠損判定をまとめて取得
+    has_data = aligned["_has_data"].tolist()
+    columns = {}
+    for field in CELL_COLUMNS:
+        if field in aligned.columns:
+            columns[field] = (aligned[field].tolist(), aligned[field].notna().tolist())
+
+    if "勤怠種別" in aligned.columns:
+        is_workday = (~aligned["勤怠種別"].isin(NON_WORKING_TYPES)).tolist()
+    else:
+        is_workday = [True] * days_in_month
+
+    for i in range(31):
+        row_idx = start_row + i
+        current_day = i + 1
+
+        # 月の日数を超える行は日付を空欄にする
+        if current_day > days_in_month:
+            sheet[f"A{row_idx}"] = None
+            continue
+
+        # 日付列に日付数式を設定
+        sheet[f"A{row_idx}"] = f"=DATE({year},{month},{current_day})"
+
+        # その日のデータがある場合のみ書き込み
+        if not has_data[i]:
+            continue
+
+        # 休憩時間
+        sheet[f"E{row_idx}"] = "1:00" if is_workday[i] else ""
+
+        # 始業・終業時刻、総勤務時間、時間外・深夜労働
+        for field, (values, notnull) in columns.items():
+            if notnull[i]:
+                sheet[f"{CELL_COLUMNS[field]}{row_idx}"] = values[i]
+
+
+def write_to_excel(template_path: str, output_path: str, df: pd.DataFrame, csv_filename: str,
+                   template_cache: TemplateCache = None):
     """
     ひな型Excelに勤怠データを書き込む
 
@@ -25,6 +126,7 @@ def write_to_excel(template_path: str, output_path: str, df: pd.DataFrame, csv_f
         output_path: 出力先パス
         df: 書き込むデータ
         csv_filename: 元のCSVファイル名
+        template_cache: テンプレートキャッシュ (Noneの場合はプロセス共有のキャッシュ)
 
     Raises:
         FileNotFoundError: テンプレートファイルが存在しない場合
@@ -47,103 +149,56 @@ def write_to_excel(template_path: str, output_path: str, df: pd.DataFrame, csv_f
             backup_path = backup_file(output_path)
             logger.info(f"既存ファイルをバックアップしました: {backup_path}")
 
-        # テンプレートを読み込み
-        logger.info(f"テンプレートを読み込んでいます: {template_path}")
-        wb = openpyxl.load_workbook(template_path)
-
-        # 勤務表シートが存在するか確認
-        if "勤務表" not in wb.sheetnames:
-            logger.error("テンプレートに「勤務表」シートがありません")
-            raise ValueError("テンプレートに「勤務表」シートがありません")
-
-        sheet = wb["勤務表"]
-
-        # 従業員名をCSVファイル名から取得
-        employee_name = extract_employee_name_from_filename(os.path.basename(csv_filename))
-        if employee_name:
-            logger.info(f"従業員名を検出しました: {employee_name}")
-            sheet["G1"] = employee_name
-        else:
-            logger.warning("ファイル名から従業員名を検出できませんでした")
-
-        # CSVから月情報を取得
-        if "日付" not in df.columns:
-            logger.error("データに日付カラムがありません")
-            raise ValueError("データに日付カラムがありません")
-
-        if len(df) == 0:
-            logger.error("データが空です")
-            raise ValueError("データが空です")
-
-        # 年月を取得
-        try:
-            first_date = df["日付"].min()
-            month_value = first_date.month
-            year_value = first_date.year
-
-            # シートに年月を設定
-            sheet["F5"] = year_value
-            sheet["H5"] = month_value
-
-            logger.info(f"年月を設定しました: {year_value}年{month_value}月")
-        except Exception as e:
-            logger.error(f"年月の取得に失敗しました: {str(e)}")
-            raise ValueError(f"年月の取得に失敗しました: {str(e)}")
-
-        # 勤怠データを書き込み
-        logger.info("勤怠データを書き込んでいます...")
-
-        # 書き込み開始行
-        start_row = 11
-
-        # データの件数によって処理
-        if len(df) > 31:
-            logger.warning(f"データが31日分を超えています: {len(df)}行, 最初の31行のみを処理します")
-            df = df.sort_values("日付").iloc[:31]
-
-        # 日数に合わせて行を調整（必要に応じて）
-        date_range = pd.date_range(start=f"{year_value}-{month_value}-01", periods=31, freq='D')
-
-        for i, date in enumerate(date_range, start=0):
-            row_idx = start_row + i
-            current_day = i + 1
-
-            # その日のデータを抽出
-            day_data = df[df["日付"].dt.day == current_day]
-
-            # 日付列に日付数式を設定
-            sheet[f"A{row_idx}"] = f"=DATE({year_value},{month_value},{current_day})"
-
-            # その日のデータがある場合のみ書き込み
-            if not day_data.empty:
-                row = day_data.iloc[0]
-
-                # 始業時刻
-                if "始業時刻" in row and pd.notnull(row["始業時刻"]):
-                    sheet[f"C{row_idx}"] = row["始業時刻"]
-
-                # 終業時刻
-                if "終業時刻" in row and pd.notnull(row["終業時刻"]):
-                    sheet[f"D{row_idx}"] = row["終業時刻"]
-
-                # 休憩時間
-                is_workday = row.get("勤怠種別") not in ["未入力", "所定休日", "法定休日"]
-                sheet[f"E{row_idx}"] = "1:00" if is_workday else ""
-
-                # 総勤務時間
-                if "総勤務時間" in row and pd.notnull(row["総勤務時間"]):
-                    sheet[f"F{row_idx}"] = row["総勤務時間"]
-
-                # その他のカラムがあれば追加
-                if "時間外労働" in row and pd.notnull(row["時間外労働"]):
-                    sheet[f"G{row_idx}"] = row["時間外労働"]
-
-                if "深夜労働" in row and pd.notnull(row["深夜労働"]):
-                    sheet[f"H{row_idx}"] = row["深夜労働"]
-
-        # ファイルの保存
-        wb.save(output_path)
-        logger.info(f"Excelファイルを保存しました: {output_path}")
+        # テンプレートを取得 (解析済みのブックをキャッシュから借り受ける)
+        cache = template_cache or get_template_cache()
+        with cache.checkout(template_path) as wb:
+            sheet = wb["勤務表"]
+
+            # 従業員名をCSVファイル名から取得
+            employee_name = extract_employee_name_from_filename(os.path.basename(csv_filename))
+            if employee_name:
+                logger.info(f"従業員名を検出しました: {employee_name}")
+                sheet["G1"] = employee_name
+            else:
+                logger.warning("ファイル名から従業員名を検出できませんでした")
+
+            # CSVから月情報を取得
+            if "日付" not in df.columns:
+                logger.error("データに日付カラムがありません")
+                raise ValueError("データに日付カラムがありません")
+
+            if len(df) == 0:
+                logger.error("データが空です")
+                raise ValueError("データが空です")
+
+            # 年月を取得
+            try:
+                first_date = df["日付"].min()
+                month_value = first_date.month
+                year_value = first_date.year
+
+                # シートに年月を設定
+                sheet["F5"] = year_value
+                sheet["H5"] = month_value
+
+                logger.info(f"年月を設定しました: {year_value}年{month_value}月")
+            except Exception as e:
+                logger.error(f"年月の取得に失敗しました: {str(e)}")
+                raise ValueError(f"年月の取得に失敗しました: {str(e)}")
+
+            # 勤怠データを書き込み
+            logger.info("勤怠データを書き込んでいます...")
+
+            # データの件数によって処理
+            if len(df) > 31:
+                logger.warning(f"データが31日分を超えています: {len(df)}行, 最初の31行のみを処理します")
+                df = df.sort_values("日付").iloc[:31]
+
+            write_attendance_rows(sheet, df, year_value, month_value)
+
+            # ファイルの保存
+            wb.save(output_path)
+            logger.info(f"Excelファイルを保存しました: {output_path}")
 
         return True
 
@@ -0,0 +1,474 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+kintone API連携クライアント (asyncio版)
+
+複数のアプリやクエリのレコードを並行して取得するためのクライアント。
+メソッドは KintoneClient と同じ構成で、リトライの判定やページング、カーソルの読み込み、
+チャンクの書き込みは KintoneClientBase の処理の流れを httpx で送信して実行する。
+"""
+import asyncio
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+from loguru import logger
+
+from processors.kintone_client import (
+    Flow,
+    HttpCall,
+    HttpReply,
+    KintoneAPIError,
+    KintoneClientBase,
+    RecordCsvWriter,
+    RecordSpool,
+    Sleep,
+    StopReading,
+    TransportError,
+    WriteGroups,
+    CSV_WRITE_BATCH_SIZE,
+    auth_headers,
+    form_fieldnames,
+    log_saved_csv,
+    write_result,
+    BUDGET_EXHAUSTED_CODE,
+)
+from processors.kintone_budget import (
+    BudgetExhaustedError,
+    KintoneRequestScheduler,
+    PRIORITY_INTERACTIVE,
+)
+from processors.kintone_cache import KintoneMetadataCache
+
+# 同時に開けるカーソル数の上限 (kintoneの制限は1ドメインあたり10個)
+MAX_OPEN_CURSORS = 10
+
+
+class AsyncKintoneClient(KintoneClientBase):
+    """kintone APIクライアント (asyncio版)"""
+
+    def __init__(self, domain: str, api_token: str = None, username: str = None, password: str = None,
+                 timeout: Tuple[float, float] = (5.0, 30.0), max_retries: int = 3, backoff_factor: float = 0.5,
+                 concurrency: int = 4, cache: Optional[KintoneMetadataCache] = None,
+                 scheduler: Optional[KintoneRequestScheduler] = None, priority: int = PRIORITY_INTERACTIVE,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        """
+        初期化
+
+        Args:
+            domain: kintoneドメイン (例: example.cybozu.com、検証用に http:// も指定可)
+            api_token: APIトークン (優先的に使用)
+            username: ユーザー名 (APIトークンがない場合)
+            password: パスワード (APIトークンがない場合)
+            timeout: (接続タイムアウト, 読み込みタイムアウト) 秒
+            max_retries: 一時的なエラー (429/5xx/接続エラー) の最大リトライ回数
+            backoff_factor: リトライ間隔の基準秒数 (backoff_factor * 2^n 秒待機)
+            concurrency: 同時に送信するリクエスト数の上限 (クライアント全体で共有)
+            cache: アプリIDとフィールド設定のファイルキャッシュ (Noneの場合はこのオブジェクト内のみ)
+            scheduler: リクエストの流量・1日の上限を制御するスケジューラ (Noneの場合は制御しない)
+            priority: スケジューラでの優先度 (PRIORITY_INTERACTIVE / PRIORITY_BACKGROUND)
+            transport: httpxのトランスポート (テスト用の httpx.MockTransport など、Noneの場合は通常の通信)
+        """
+        super().__init__(domain, max_retries, backoff_factor, cache, scheduler, priority)
+
+        # 通信設定
+        self.concurrency = max(1, concurrency)
+
+        # 同時接続数の上限 (kintoneの同時接続数の制限を超えないようにする)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._cursor_semaphore = asyncio.Semaphore(MAX_OPEN_CURSORS)
+
+        connect_timeout, read_timeout = timeout
+        self.client = httpx.AsyncClient(
+            headers=auth_headers(api_token, username, password),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+            transport=transport,
+        )
+
+        logger.info(f"kintoneクライアント (asyncio) を初期化しました: {self.domain}")
+
+    async def close(self):
+        """クライアントを閉じる"""
+        await self.client.aclose()
+        if self.scheduler:
+            # ファイルの読み書きでイベントループを止めないように別スレッドで保存
+            await asyncio.to_thread(self.scheduler.flush)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def _acquire(self, app_id: Optional[str], priority: int) -> bool:
+        """
+        スケジューラの送信枠を確保できるまで待機
+
+        Returns:
+            bool: 送信枠を確保したかどうか (スケジューラがない場合はFalse)
+        """
+        if self.scheduler is None:
+            return False
+
+        try:
+            while True:
+                delay = self.scheduler.try_acquire(app_id, priority)
+                if not delay:
+                    return True
+                await asyncio.sleep(delay)
+        except BudgetExhaustedError as e:
+            self._count(errors=1)
+            raise KintoneAPIError(str(e), code=BUDGET_EXHAUSTED_CODE) from e
+
+    async def _send(self, call: HttpCall) -> HttpReply:
+        """
+        HTTPリクエストを1回送信 (送信中のリクエストは concurrency 件までに制限する)
+
+        Raises:
+            TransportError: 接続エラー・タイムアウトの場合
+            KintoneAPIError: その日のリクエスト数の上限に達した場合
+        """
+        try:
+            async with self._semaphore:
+                acquired = await self._acquire(call.app_id, call.priority)
+                try:
+                    response = await self.client.request(
+                        call.method, call.url, params=call.params, content=call.body, headers=call.headers
+                    )
+                finally:
+                    if acquired:
+                        self.scheduler.release()
+        except httpx.TransportError as e:
+            sent = not isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+            raise TransportError(str(e), sent=sent) from e
+        return HttpReply(response.status_code, response.content, response.headers.get("Retry-After"))
+
+    async def _drive(self, flow: Flow, error: Optional[BaseException] = None,
+                     result: Optional[List[Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        処理の流れを実行し、流れが yield するレコードを返す非同期ジェネレータ (KintoneClient._drive と同じ)
+
+        リトライの待機中は同時送信数の枠を空ける。
+        """
+        reply = None
+        while True:
+            try:
+                step = flow.throw(error) if error is not None else flow.send(reply)
+            except StopIteration as stop:
+                if result is not None:
+                    result.append(stop.value)
+                return
+            reply = error = None
+
+            if isinstance(step, HttpCall):
+                try:
+                    reply = await self._send(step)
+                except (TransportError, KintoneAPIError) as e:
+                    error = e
+            elif isinstance(step, Sleep):
+                await asyncio.sleep(step.seconds)
+            else:
+                try:
+                    yield step
+                except GeneratorExit:
+                    await self._abandon(flow)
+                    raise
+
+    async def _abandon(self, flow: Flow):
+        """読み込みを途中でやめた処理の流れの後始末を実行"""
+        try:
+            async for _ in self._drive(flow, StopReading()):
+                pass
+        except StopReading:
+            pass
+
+    async def _run(self, flow: Flow) -> Any:
+        """レコードを返さない処理の流れを実行し、戻り値を返す"""
+        result = []
+        async for _ in self._drive(flow, result=result):
+            pass
+        return result[0]
+
+    async def _request(self, method: str, path: str, params: Dict[str, Any] = None,
+                       payload: Dict[str, Any] = None, app_id: Optional[str] = None,
+                       priority: Optional[int] = None) -> Dict[str, Any]:
+        """
+        APIを呼び出す (リトライの条件は KintoneClientBase._api)
+
+        Returns:
+            dict: API応答
+
+        Raises:
+            KintoneAPIError: リトライしても成功しなかった場合、その日のリクエスト数の上限に達した場合
+        """
+        return await self._run(self._api(method, path, params, payload, app_id, priority))
+
+    async def get_app_id(self, app_name: str) -> Optional[str]:
+        """
+        アプリ名からアプリIDを取得
+
+        Args:
+            app_name: アプリ名
+
+        Returns:
+            str or None: アプリID (見つからない場合はNone)
+
+        Raises:
+            KintoneAPIError: API呼び出しに失敗した場合
+        """
+        return await self._run(self._app_id_flow(app_name))
+
+    async def get_form_fields(self, app_name: str) -> Dict[str, Any]:
+        """
+        アプリのフォームのフィールド設定を取得
+
+        Args:
+            app_name: アプリ名
+
+        Returns:
+            dict: フィールド設定 ({フィールドコード: {"type": ..., "code": ..., ...}})
+
+        Raises:
+            KintoneAPIError: API呼び出しに失敗した場合
+        """
+        return await self._run(self._form_fields_flow(app_name))
+
+    async def get_record_fieldnames(self, app_name: str) -> List[str]:
+        """
+        フォームのフィールド設定からCSVに出力する列 (フィールドコード) を取得
+
+        Args:
+            app_name: アプリ名
+
+        Returns:
+            list: フィールドコードのリスト
+
+        Raises:
+            KintoneAPIError: API呼び出しに失敗した場合
+        """
+        return form_fieldnames(await self.get_form_fields(app_name))
+
+    async def iter_records(self, app_name: str, query: str = "", fields: List[str] = None,
+                           max_records: Optional[int] = None, page_size: int = 500) -> AsyncIterator[Dict[str, Any]]:
+        """
+        カーソルAPIを使用してレコードを1件ずつ取得する非同期ジェネレータ
+
+        途中で読み込みをやめた場合もカーソルは削除される。
+
+        Args:
+            app_name: アプリ名
+            query: クエリ文字列 (limit / offset は指定不可)
+            fields: 取得するフィールド名のリスト
+            max_records: 最大取得レコード数 (Noneの場合は全件)
+            page_size: 1回のリクエストで取得する件数 (最大500件)
+
+        Yields:
+            dict: レコード
+
+        Raises:
+            KintoneAPIError: API呼び出しに失敗した場合
+        """
+        app_id = await self._run(self._require_app_id_flow(app_name))
+        records = self._drive(self._cursor_flow(app_name, app_id, query, fields, max_records, page_size))
+
+        # 開いているカーソルが上限に達している場合は他の取得の完了を待つ
+        async with self._cursor_semaphore:
+            try:
+                async for record in records:
+                    yield record
+            finally:
+                # 読み込みを途中でやめた場合もカーソルを削除させる
+                await records.aclose()
+
+    async def get_records(self, app_name: str, query: str = "", fields: List[str] = None,
+                          max_records: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        レコードを取得
+
+        Args:
+            app_name: アプリ名
+            query: クエリ文字列
+            fields: 取得するフィールド名のリスト
+            max_records: 最大取得レコード数 (Noneの場合は全件)
+
+        Returns:
+            list: レコードのリスト
+
+        Raises:
+            KintoneAPIError: API呼び出しに失敗した場合
+        """
+        try:
+            return [record async for record in self.iter_records(app_name, query, fields, max_records)]
+
+        except KintoneAPIError as e:
+            logger.error(f"レコード取得エラー: {str(e)}")
+            raise
+
+    async def get_records_many(self, requests: Iterable[Dict[str, Any]]) -> List[Any]:
+        """
+        複数のアプリ・クエリのレコードを並行して取得
+
+        同時に送信するリクエストは concurrency 件までに制限される。
+        取得に失敗したものは結果にKintoneAPIErrorが入る (他の取得は継続する)。
+
+        Args:
+            requests: get_records の引数の辞書のリスト
+                      (例: [{"app_name": "勤怠アプリ", "query": '社員番号 = "001"'}, ...])
+
+        Returns:
+            list: 各要素に対応するレコードのリスト (またはKintoneAPIError)
+        """
+        requests = list(requests)
+
+        # アプリIDは先に1回ずつ取得しておく (同じアプリの一覧取得が重複しないように)
+        for app_name in dict.fromkeys(r["app_name"] for r in requests):
+            try:
+                await self.get_app_id(app_name)
+            except KintoneAPIError as e:
+                logger.error(f"アプリIDの取得に失敗しました: {app_name}: {str(e)}")
+
+        tasks = [self.get_records(**r) for r in requests]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        for result in results:
+            if isinstance(result, BaseException) and not isinstance(result, KintoneAPIError):
+                raise result
+        return results
+
+    async def _write_records(self, method: str, app_name: str, key: str, items: Iterable[Any],
+                             use_bulk: bool = False, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        レコードを100件ずつのチャンクに分割して書き込む (KintoneClient._write_records と同じ)
+
+        Returns:
+            dict: 処理結果 (success, message, count, committed, chunks, data)
+        """
+        try:
+            app_id = await self._run(self._require_app_id_flow(app_name))
+        except KintoneAPIError as e:
+            logger.error(str(e))
+            return {"success": False, "message": str(e), "count": 0, "committed": 0, "chunks": []}
+
+        async def send(first_index: int, start: int, chunks: List[List[Any]]) -> List[Dict[str, Any]]:
+            return await self._run(
+                self._write_chunks_flow(method, app_id, key, first_index, start, chunks, use_bulk, options)
+            )
+
+        # チャンクを順に読み込みながら、送信待ちのタスクが concurrency 件を超えないように作成
+        groups = WriteGroups(items, use_bulk)
+        reports = []
+        pending = set()
+        for first_index, start, chunks in groups:
+            if len(pending) >= self.concurrency:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    reports.extend(task.result())
+
+            pending.add(asyncio.create_task(send(first_index, start, chunks)))
+
+        for report in await asyncio.gather(*pending):
+            reports.extend(report)
+
+        return write_result(method, app_name, reports, groups.error)
+
+    async def add_records(self, app_name: str, records: Iterable[Dict[str, Any]],
+                          use_bulk: bool = False) -> Dict[str, Any]:
+        """
+        レコードを追加 (100件ずつに分割して送信)
+
+        Returns:
+            dict: 処理結果 (KintoneClient.add_records と同じ)
+        """
+        return await self._write_records("POST", app_name, "records", records, use_bulk)
+
+    async def update_records(self, app_name: str, records: Iterable[Dict[str, Any]],
+                             use_bulk: bool = False, upsert: bool = False) -> Dict[str, Any]:
+        """
+        レコードを更新 (100件ずつに分割して送信)
+
+        Returns:
+            dict: 処理結果 (KintoneClient.update_records と同じ)
+        """
+        options = {"upsert": True} if upsert else None
+        return await self._write_records("PUT", app_name, "records", records, use_bulk, options)
+
+    async def delete_records(self, app_name: str, record_ids: Iterable[str],
+                             use_bulk: bool = False) -> Dict[str, Any]:
+        """
+        レコードを削除 (100件ずつに分割して送信)
+
+        Returns:
+            dict: 処理結果 (KintoneClient.delete_records と同じ)
+        """
+        return await self._write_records("DELETE", app_name, "ids", record_ids, use_bulk)
+
+    async def save_as_csv(self, records: AsyncIterator[Dict[str, Any]], output_file: str, encoding: str = 'utf-8',
+                          fieldnames: Optional[List[str]] = None, batch_size: int = CSV_WRITE_BATCH_SIZE) -> bool:
+        """
+        取得中のレコードをCSVとして保存
+
+        fieldnames を省略した場合は全レコードを一時ファイルに退避し、フィールドの和集合を列とする
+        (KintoneClient.save_as_csv と同じく、全レコードをメモリに載せない)。
+
+        Args:
+            records: レコードの非同期イテレータ (iter_records など)
+            output_file: 出力ファイルパス
+            encoding: エンコーディング
+            fieldnames: 出力する列 (フィールドコード) のリスト
+            batch_size: まとめて書き込む行数
+
+        Returns:
+            bool: 保存成功かどうか
+        """
+        spool = None
+
+        try:
+            # 列が指定されていない場合は全レコードから求める
+            if fieldnames is None:
+                spool = RecordSpool()
+                async for record in records:
+                    spool.write(record)
+                fieldnames, records = spool.fieldnames, _aiter(spool)
+
+            with RecordCsvWriter(output_file, fieldnames, encoding, batch_size) as writer:
+                async for record in records:
+                    writer.write(record)
+                count = writer.commit()
+
+            return log_saved_csv(output_file, count)
+
+        except Exception as e:
+            logger.exception(f"CSV保存エラー: {str(e)}")
+            return False
+
+        finally:
+            if spool is not None:
+                spool.close()
+
+    async def pull_to_csv(self, app_name: str, output_file: str, query: str = "",
+                          encoding: str = 'utf-8') -> bool:
+        """
+        アプリのレコードを取得しながらCSVに保存 (列はフォームの定義に従う)
+
+        Args:
+            app_name: アプリ名
+            output_file: 出力ファイルパス
+            query: クエリ文字列
+            encoding: エンコーディング
+
+        Returns:
+            bool: 保存成功かどうか
+        """
+        try:
+            fieldnames = await self.get_record_fieldnames(app_name)
+        except KintoneAPIError as e:
+            logger.error(f"フィールド設定の取得に失敗しました: {app_name}: {str(e)}")
+            return False
+
+        return await self.save_as_csv(self.iter_records(app_name, query), output_file, encoding, fieldnames)
+
+
+async def _aiter(items: Iterable[Any]) -> AsyncIterator[Any]:
+    """イテレータを非同期イテレータに変換"""
+    for item in items:
+        yield item
@@ -0,0 +1,369 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+kintone APIリクエストのスケジューラ
+
+kintoneにはアプリごとの1日のAPIリクエスト数の上限と、同時接続数の上限がある。
+すべてのリクエストをこのスケジューラに通し、次の制御を行う。
+
+- トークンバケットで1秒あたりのリクエスト数を平準化する
+- 同時に送信するリクエスト数を max_concurrent 件までに制限する
+- アプリごとのその日のリクエスト数をファイルに保存し、上限に達したら送信しない
+  (プロセスごとに別のファイルに保存し、同時に実行している別のプロセスの分も合算する)
+- 対話的なCLIの呼び出し (PRIORITY_INTERACTIVE) を
+  バックグラウンドの同期 (PRIORITY_BACKGROUND) より先に送信し、
+  バックグラウンドの同期は interactive_reserve 件を残して停止する
+"""
+import glob
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional
+
+from loguru import logger
+
+from utils import safe_filename
+
+# リクエストの優先度 (値が小さいほど優先)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+# アプリごとの1日のAPIリクエスト数の上限 (kintoneの標準の制限)
+DEFAULT_DAILY_LIMIT = 10000
+
+# リクエスト数をファイルに書き込む間隔 (秒)
+FLUSH_INTERVAL = 5.0
+
+# 同時接続数の上限に達している場合に再確認するまでの秒数 (asyncio版)
+POLL_INTERVAL = 0.05
+
+
+class BudgetExhaustedError(Exception):
+    """その日のAPIリクエスト数の上限に達した"""
+
+    def __init__(self, message: str, app_id: Optional[str] = None):
+        super().__init__(message)
+        self.app_id = app_id
+
+
+class KintoneRequestScheduler:
+    """kintone APIリクエストの流量・同時接続数・1日の上限を制御する"""
+
+    def __init__(self, state_dir: str, domain: str, daily_limit: int = DEFAULT_DAILY_LIMIT,
+                 rate: float = 10.0, max_concurrent: int = 10, interactive_reserve: int = 1000):
+        """
+        初期化
+
+        Args:
+            state_dir: リクエスト数を保存するディレクトリ
+            domain: kintoneドメイン (ドメインごとにファイルを分ける)
+            daily_limit: アプリごとの1日のリクエスト数の上限 (0の場合は制限しない)
+            rate: 1秒あたりのリクエスト数 (0の場合は制限しない、同数までのバーストを許可)
+            max_concurrent: 同時に送信するリクエスト数の上限
+            interactive_reserve: バックグラウンドの同期が使用せずに残すリクエスト数
+        """
+        domain = (domain or "").split("://")[-1].rstrip("/")
+        name = f"kintone_budget_{safe_filename(domain) or 'default'}"
+
+        # リクエスト数はプロセスごとのファイルに保存する (同時に実行するプロセスが互いの加算を上書きしないように)
+        self.state_dir = os.path.join(state_dir, name)
+        self.state_file = os.path.join(self.state_dir, f"{os.getpid()}_{uuid.uuid4().hex[:8]}.json")
+        # 以前の形式 (全プロセスで共有する1ファイル) のリクエスト数も合算する
+        self.legacy_state_file = os.path.join(state_dir, f"{name}.json")
+        self.daily_limit = daily_limit
+        self.rate = rate
+        self.burst = max(1.0, rate)
+        self.max_concurrent = max(1, max_concurrent)
+        self.interactive_reserve = min(interactive_reserve, daily_limit)
+
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._active = 0
+        self._tokens = self.burst
+        self._refilled_at = time.monotonic()
+
+        # その日のリクエスト数 ({アプリID: 件数})
+        # (このプロセスの件数と、最後に読み込んだ別のプロセスの件数を分けて持つ)
+        self._date = None
+        self._own = {}
+        self._others = {}
+        self._dirty = False
+        self._flushed_at = time.monotonic()
+        self._flushing = False
+        self._flush_lock = threading.Lock()
+
+        self.stats = {"requests": 0, "waited": 0.0, "rejected": 0}
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.now().strftime("%Y-%m-%d")
+
+    def _read_counts(self, path: str, date: str) -> Dict[str, int]:
+        """保存されたその日のリクエスト数を読み込む (日付が異なる場合は空)"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"APIリクエスト数を読み込めませんでした: {path}: {str(e)}")
+            return {}
+        return dict(data.get("apps", {})) if data.get("date") == date else {}
+
+    def _read_others(self, date: str) -> Dict[str, int]:
+        """
+        別のプロセスのその日のリクエスト数を合算して読み込む
+
+        前日以前のファイルは削除する。
+        """
+        counts = {}
+        paths = glob.glob(os.path.join(self.state_dir, "*.json")) + [self.legacy_state_file]
+        for path in paths:
+            if path == self.state_file:
+                continue
+            app_counts = self._read_counts(path, date)
+            if not app_counts and path != self.legacy_state_file:
+                self._remove_stale(path, date)
+            for app_id, count in app_counts.items():
+                counts[app_id] = counts.get(app_id, 0) + count
+        return counts
+
+    @staticmethod
+    def _remove_stale(path: str, date: str):
+        """前日以前のリクエスト数のファイルを削除 (書き込み中のファイルは残す)"""
+        try:
+            if datetime.fromtimestamp(os.path.getmtime(path)).strftime("%Y-%m-%d") < date:
+                os.remove(path)
+        except OSError:
+            pass
+
+    def _count(self, app_id: str) -> int:
+        """その日のリクエスト数 (全プロセスの合計)"""
+        return self._own.get(app_id, 0) + self._others.get(app_id, 0)
+
+    def _roll_day(self):
+        """日付が変わった場合はリクエスト数を読み込み直す"""
+        today = self._today()
+        if self._date != today:
+            self._date = today
+            self._own = {}
+            self._others = self._read_others(today)
+            self._dirty = False
+
+    def flush(self):
+        """
+        このプロセスのリクエスト数をファイルに保存し、別のプロセスのリクエスト数を読み込み直す
+
+        ファイルの読み書きはロックの外で行うため、送信枠の確保を待たせない。
+        """
+        with self._flush_lock:
+            with self._cond:
+                self._roll_day()
+                self._flushed_at = time.monotonic()
+                date, own, dirty = self._date, dict(self._own), self._dirty
+                self._dirty = False
+
+            if dirty and not self._write_own(date, own):
+                with self._cond:
+                    self._dirty = True
+
+            others = self._read_others(date)
+            with self._cond:
+                if self._date == date:
+                    self._others = others
+
+    def _write_own(self, date: str, own: Dict[str, int]) -> bool:
+        """このプロセスのリクエスト数をファイルに保存"""
+        os.makedirs(self.state_dir, exist_ok=True)
+        temp_file = f"{self.state_file}.tmp"
+        try:
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump({"date": date, "apps": own}, f, ensure_ascii=False)
+            os.replace(temp_file, self.state_file)
+        except OSError as e:
+            logger.warning(f"APIリクエスト数を保存できませんでした: {self.state_file}: {str(e)}")
+            return False
+        return True
+
+    def _flush_in_background(self):
+        """別スレッドでファイルに保存 (送信のたびにファイルの読み書きで待たせない)"""
+        try:
+            self.flush()
+        finally:
+            with self._cond:
+                self._flushing = False
+
+    def _limit(self, priority: int) -> int:
+        if priority == PRIORITY_INTERACTIVE:
+            return self.daily_limit
+        return self.daily_limit - self.interactive_reserve
+
+    def remaining(self, app_id: str, priority: int = PRIORITY_INTERACTIVE) -> Optional[int]:
+        """
+        その日に送信できる残りのリクエスト数
+
+        Args:
+            app_id: アプリID
+            priority: 優先度 (バックグラウンドの場合は interactive_reserve 件を除く)
+
+        Returns:
+            int or None: 残りのリクエスト数 (上限を設定していない場合はNone)
+        """
+        if not self.daily_limit:
+            return None
+        with self._cond:
+            self._roll_day()
+            return max(0, self._limit(priority) - self._count(str(app_id)))
+
+    def usage(self) -> Dict[str, Any]:
+        """
+        その日のアプリごとのリクエスト数
+
+        Returns:
+            dict: date (日付), limit (上限), apps ({アプリID: 件数})
+        """
+        self.flush()
+        with self._cond:
+            apps = {app_id: self._count(app_id) for app_id in {**self._others, **self._own}}
+            return {"date": self._date, "limit": self.daily_limit, "apps": apps}
+
+    def _check_budget(self, app_id: Optional[str], priority: int):
+        if not self.daily_limit or app_id is None:
+            return
+        self._roll_day()
+        limit = self._limit(priority)
+        if self._count(app_id) >= limit:
+            self.stats["rejected"] += 1
+            kind = "" if priority == PRIORITY_INTERACTIVE else "、対話的な実行のために残す分を除く"
+            raise BudgetExhaustedError(
+                f"本日のAPIリクエスト数の上限 ({limit}件{kind}) に達しました: アプリID {app_id}", app_id
+            )
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _token_delay(self) -> float:
+        """トークンが1つ貯まるまでの秒数 (すぐに送信できる場合は0)"""
+        if not self.rate:
+            return 0.0
+        self._refill()
+        return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    def _take(self, app_id: Optional[str]):
+        """送信枠を確保し、リクエスト数を加算"""
+        if self.rate:
+            self._tokens -= 1
+        self._active += 1
+        self.stats["requests"] += 1
+        if app_id is not None:
+            self._own[app_id] = self._own.get(app_id, 0) + 1
+            self._dirty = True
+
+    def acquire(self, app_id: Optional[str] = None, priority: int = PRIORITY_INTERACTIVE):
+        """
+        リクエストを送信できるまで待機して送信枠を確保 (送信後は release を呼ぶ)
+
+        待機中のリクエストは優先度順 (同じ優先度は到着順) に送信する。
+
+        Args:
+            app_id: リクエストの対象のアプリID (アプリ以外のAPIの場合はNone)
+            priority: 優先度
+
+        Raises:
+            BudgetExhaustedError: その日のリクエスト数の上限に達している場合
+        """
+        app_id = None if app_id is None else str(app_id)
+        started = time.monotonic()
+
+        with self._cond:
+            self._check_budget(app_id, priority)
+
+            entry = (priority, next(self._sequence))
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    timeout = None
+                    if self._waiters[0] == entry and self._active < self.max_concurrent:
+                        timeout = self._token_delay()
+                        if not timeout:
+                            break
+                    self._cond.wait(timeout)
+            finally:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+            # 待機中に別のリクエストが上限に達した場合
+            self._check_budget(app_id, priority)
+            self._take(app_id)
+            self.stats["waited"] += time.monotonic() - started
+
+    def try_acquire(self, app_id: Optional[str] = None, priority: int = PRIORITY_INTERACTIVE) -> float:
+        """
+        待機せずに送信枠の確保を試みる (asyncio版のクライアント用)
+
+        同じか高い優先度のリクエストが待機している場合は確保しない。
+
+        Returns:
+            float: 確保できた場合は0、できなかった場合は再試行までの秒数
+
+        Raises:
+            BudgetExhaustedError: その日のリクエスト数の上限に達している場合
+        """
+        app_id = None if app_id is None else str(app_id)
+        with self._cond:
+            self._check_budget(app_id, priority)
+            if self._active >= self.max_concurrent or (self._waiters and self._waiters[0][0] <= priority):
+                return POLL_INTERVAL
+            delay = self._token_delay()
+            if delay:
+                return delay
+            self._take(app_id)
+            return 0.0
+
+    def release(self):
+        """
+        送信枠を解放
+
+        FLUSH_INTERVAL 秒ごとに別スレッドでリクエスト数をファイルに保存する
+        (asyncio版のクライアントからも呼ばれるため、この中ではファイルを読み書きしない)。
+        """
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+            if self._flushing or time.monotonic() - self._flushed_at < FLUSH_INTERVAL:
+                return
+            self._flushing = True
+            self._flushed_at = time.monotonic()
+
+        threading.Thread(target=self._flush_in_background, name="kintone-budget-flush", daemon=True).start()
+
+    @contextmanager
+    def slot(self, app_id: Optional[str] = None, priority: int = PRIORITY_INTERACTIVE) -> Iterator[None]:
+        """送信枠を確保して解放するコンテキストマネージャ"""
+        self.acquire(app_id, priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+def request_app_id(params: Optional[Dict[str, Any]], payload: Optional[Dict[str, Any]]) -> Optional[str]:
+    """リクエストのパラメータまたはボディから対象のアプリIDを取得 (アプリ以外のAPIの場合はNone)"""
+    for data in (params, payload):
+        if data and data.get("app") is not None:
+            return str(data["app"])
+    # bulkRequest.json の場合は最初のリクエストのアプリ
+    requests = (payload or {}).get("requests")
+    if requests:
+        return request_app_id(None, requests[0].get("payload"))
+    return None
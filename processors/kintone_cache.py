@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+kintoneメタデータキャッシュモジュール
+
+アプリ名 → アプリID の対応と、アプリごとのフォームのフィールド設定をファイルに保存し、
+有効期限内であればAPIを呼び出さずに使用する。
+CLIの実行ごとにアプリ一覧やフィールド設定を取得し直す往復を省くためのもの。
+"""
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from loguru import logger
+
+from utils import safe_filename
+
+# キャッシュの有効期限 (秒)
+DEFAULT_CACHE_TTL = 24 * 60 * 60
+
+
+class KintoneMetadataCache:
+    """kintoneのアプリIDとフィールド設定のファイルキャッシュ"""
+
+    def __init__(self, cache_dir: str, domain: str, ttl: float = DEFAULT_CACHE_TTL):
+        """
+        初期化
+
+        Args:
+            cache_dir: キャッシュファイルを保存するディレクトリ
+            domain: kintoneドメイン (ドメインごとにキャッシュファイルを分ける)
+            ttl: 有効期限 (秒)
+        """
+        domain = (domain or "").split("://")[-1].rstrip("/")
+        self.cache_file = os.path.join(cache_dir, f"kintone_{safe_filename(domain) or 'default'}.json")
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = None
+        self.stats = {"hits": 0, "misses": 0}
+
+    def _load(self) -> Dict[str, Any]:
+        """キャッシュファイルを読み込む (読み込めない場合は空)"""
+        if self._data is None:
+            try:
+                with open(self.cache_file, "r", encoding="utf-8") as f:
+                    self._data = json.load(f)
+            except FileNotFoundError:
+                self._data = {}
+            except (OSError, ValueError) as e:
+                logger.warning(f"kintoneキャッシュを読み込めませんでした: {self.cache_file}: {str(e)}")
+                self._data = {}
+
+            self._data.setdefault("apps", {})
+            self._data.setdefault("fields", {})
+        return self._data
+
+    def _save(self):
+        """キャッシュファイルに保存 (一時ファイルに書き込んでから置き換える)"""
+        os.makedirs(os.path.dirname(self.cache_file) or ".", exist_ok=True)
+        temp_file = f"{self.cache_file}.tmp"
+        try:
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump(self._data, f, ensure_ascii=False)
+            os.replace(temp_file, self.cache_file)
+        except OSError as e:
+            logger.warning(f"kintoneキャッシュを保存できませんでした: {self.cache_file}: {str(e)}")
+
+    def _get(self, section: str, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._load()[section].get(key)
+            if entry and time.time() - entry.get("cached_at", 0) < self.ttl:
+                self.stats["hits"] += 1
+                return entry["value"]
+            self.stats["misses"] += 1
+            return None
+
+    def _set(self, section: str, key: str, value: Any):
+        with self._lock:
+            self._load()[section][key] = {"value": value, "cached_at": time.time()}
+            self._save()
+
+    def get_app_id(self, app_name: str) -> Optional[str]:
+        """キャッシュ済みのアプリIDを取得 (ない場合・期限切れの場合はNone)"""
+        return self._get("apps", app_name)
+
+    def set_app_id(self, app_name: str, app_id: str):
+        """アプリIDを保存"""
+        self._set("apps", app_name, app_id)
+
+    def get_form_fields(self, app_id: str) -> Optional[Dict[str, Any]]:
+        """キャッシュ済みのフィールド設定を取得 (ない場合・期限切れの場合はNone)"""
+        return self._get("fields", str(app_id))
+
+    def set_form_fields(self, app_id: str, properties: Dict[str, Any]):
+        """フィールド設定を保存"""
+        self._set("fields", str(app_id), properties)
+
+    def app_names(self) -> Dict[str, str]:
+        """キャッシュ済みのアプリIDとアプリ名の対応 ({アプリID: アプリ名}、期限切れのものも含む)"""
+        with self._lock:
+            return {str(entry["value"]): name for name, entry in self._load()["apps"].items()}
+
+    def invalidate(self, app_name: str = None):
+        """
+        キャッシュを破棄
+
+        Args:
+            app_name: 破棄するアプリ名 (Noneの場合はすべて)
+        """
+        with self._lock:
+            data = self._load()
+            if app_name is None:
+                data["apps"].clear()
+                data["fields"].clear()
+            else:
+                entry = data["apps"].pop(app_name, None)
+                if entry:
+                    data["fields"].pop(str(entry["value"]), None)
+            self._save()
@@ -2,25 +2,859 @@
 # -*- coding: utf-8 -*-
 """
 kintone API連携クライアント
+
+API呼び出しを含む処理 (リトライ、アプリ一覧のページング、カーソルの読み込み、チャンクの書き込み) は
+KintoneClientBase に通信を行わないジェネレータ (処理の流れ) として実装し、
+KintoneClient (requests) と AsyncKintoneClient (httpx, asyncio) は送信と待機だけを行う。
 """
 import os
 import json
+import tempfile
+import time
+import random
 import base64
-from typing import Dict, List, Any, Optional
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+from typing import Dict, Generator, Iterable, Iterator, List, Any, Optional, Tuple
 import csv
 from datetime import datetime
 
 import requests
 import pandas as pd
+from requests.adapters import HTTPAdapter
 from loguru import logger
 
-from utils import safe_filename
+from processors.kintone_budget import (
+    BudgetExhaustedError,
+    KintoneRequestScheduler,
+    PRIORITY_INTERACTIVE,
+    request_app_id,
+)
+from processors.kintone_cache import KintoneMetadataCache
+from utils import safe_filename, open_csv_buffer
+
+# リトライ対象のHTTPステータス
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# 非冪等なリクエスト (POST) でもリトライするHTTPステータス (処理されていないことが確実なもの)
+SAFE_RETRY_STATUS_CODES = (429, 503)
+
+# アプリ一覧の1回の取得件数 (apps.json の上限)
+APPS_PAGE_SIZE = 100
+
+# アプリが存在しない場合のエラーコード
+APP_NOT_FOUND_CODE = "GAIA_AP01"
+
+# その日のAPIリクエスト数の上限に達したため送信しなかった場合のエラーコード
+BUDGET_EXHAUSTED_CODE = "BUDGET_EXHAUSTED"
+
+# 1回のリクエストで登録・更新・削除できるレコード数の上限
+RECORDS_PER_REQUEST = 100
+
+# bulkRequest.json にまとめられるリクエスト数の上限
+BULK_REQUESTS_MAX = 20
+
+# CSV出力時にまとめて書き込む行数
+CSV_WRITE_BATCH_SIZE = 1000
+
+# CSVからレコードに変換する際に一度に読み込む行数
+CSV_READ_CHUNK_SIZE = 5000
+
+# レコードに値を持たないフィールドの種類 (CSVの列にしない)
+NON_VALUE_FIELD_TYPES = ("GROUP", "REFERENCE_TABLE", "LABEL", "SPACER", "HR")
+
+
+def format_field_value(value: Any) -> str:
+    """
+    レコードのフィールド値をCSV出力用の文字列に変換
+
+    複数選択やユーザー選択、テーブルなどのリスト・辞書の値はJSON文字列にする。
+    """
+    if value is None:
+        return ""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+def record_to_row(record: Dict[str, Any], fieldnames: List[str]) -> List[str]:
+    """
+    kintoneレコードをCSVの1行 (fieldnames の順) に変換
+
+    Args:
+        record: kintoneレコード ({フィールドコード: {"type": ..., "value": ...}})
+        fieldnames: 出力するフィールドコードのリスト
+
+    Returns:
+        list: 値のリスト (レコードにないフィールドは空文字)
+    """
+    row = []
+    for field_name in fieldnames:
+        field_data = record.get(field_name)
+        if isinstance(field_data, dict):
+            row.append(format_field_value(field_data.get("value")))
+        else:
+            row.append("")
+    return row
+
+
+def record_fieldnames(record: Dict[str, Any]) -> List[str]:
+    """レコードに含まれる値を持つフィールドコードのリスト"""
+    return [name for name, data in record.items() if isinstance(data, dict) and "value" in data]
+
+
+def form_fieldnames(properties: Dict[str, Any]) -> List[str]:
+    """
+    フォームのフィールド設定からCSVに出力する列を作成
+
+    レコードIDとリビジョンを先頭に、値を持つフィールドをフォームの定義順に並べる。
+    """
+    fieldnames = ["$id", "$revision"]
+    for code, field in properties.items():
+        if field.get("type") not in NON_VALUE_FIELD_TYPES and code not in fieldnames:
+            fieldnames.append(code)
+    return fieldnames
+
+
+def dataframe_to_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """
+    DataFrameをkintoneレコード形式に変換
+
+    欠損値の判定と文字列化は列単位でまとめて行い、行ごとの処理は辞書の作成のみとする。
+    欠損値のフィールドはレコードに含めない。
+
+    Args:
+        df: 変換するDataFrame
+
+    Returns:
+        list: kintoneレコード形式のリスト
+    """
+    columns = []
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            values = series.dt.strftime("%Y-%m-%d")
+        elif series.dtype == object or pd.api.types.is_string_dtype(series):
+            values = series
+        else:
+            values = series.astype(str)
+        columns.append(values.astype(object).where(series.notna(), None).tolist())
+
+    names = [str(col) for col in df.columns]
+    return [
+        {name: {"value": value} for name, value in zip(names, row) if value is not None}
+        for row in zip(*columns)
+    ]
+
+
+class KintoneAPIError(Exception):
+    """kintone API呼び出しのエラー"""
+
+    def __init__(self, message: str, status: Optional[int] = None, code: Optional[str] = None):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
+
+def normalize_domain(domain: str) -> str:
+    """
+    ドメインをURLの形式に変換 (スキームがなければ https:// を付ける)
+
+    http:// を明示した場合はそのまま使用する (検証用のスタブサーバーなど)。
+    """
+    domain = domain.rstrip('/')
+    if not domain.startswith(('https://', 'http://')):
+        domain = f"https://{domain}"
+    return domain
+
+
+def auth_headers(api_token: str = None, username: str = None, password: str = None) -> Dict[str, str]:
+    """
+    API呼び出し用の認証ヘッダーを作成
+
+    Returns:
+        dict: ヘッダー情報
+    """
+    headers = {}
+
+    # API トークン認証
+    if api_token:
+        headers["X-Cybozu-API-Token"] = api_token
+
+    # Basic 認証
+    elif username and password:
+        auth = f"{username}:{password}"
+        encoded_auth = base64.b64encode(auth.encode()).decode()
+        headers["Authorization"] = f"Basic {encoded_auth}"
+
+    else:
+        logger.warning("認証情報が設定されていません")
+
+    return headers
+
+
+def find_app_id(apps: List[Dict[str, Any]], app_name: str) -> Optional[str]:
+    """アプリ一覧から名前が完全一致するアプリのIDを取得"""
+    for app in apps:
+        if app.get("name") == app_name:
+            return str(app.get("appId"))
+    return None
+
+
+def backoff_delay(backoff_factor: float, attempt: int, retry_after: Optional[str] = None) -> float:
+    """
+    リトライまでの待機秒数 (指数バックオフ + ジッター)
+
+    Args:
+        backoff_factor: 基準秒数
+        attempt: 何回目のリトライか (0始まり)
+        retry_after: Retry-Afterヘッダーの値 (秒)
+    """
+    delay = backoff_factor * (2 ** attempt)
+    if retry_after and retry_after.isdigit():
+        delay = max(delay, float(retry_after))
+    return delay + random.uniform(0, backoff_factor)
+
+
+def is_retryable_status(status: int, retry_ambiguous: bool) -> bool:
+    """
+    リトライしてよいHTTPステータスかどうか
+
+    Args:
+        status: HTTPステータス
+        retry_ambiguous: 処理されたかどうか分からないエラー (500/502/504) もリトライするかどうか
+                         (POST は二重登録を避けるため、処理されていないことが確実な場合のみ)
+    """
+    retry_codes = RETRY_STATUS_CODES if retry_ambiguous else SAFE_RETRY_STATUS_CODES
+    return status in retry_codes
+
+
+def api_error(status: int, method: str, path: str, body: bytes) -> KintoneAPIError:
+    """エラー応答からKintoneAPIErrorを作成"""
+    try:
+        error = json.loads(body)
+    except ValueError:
+        error = {}
+    if not isinstance(error, dict):
+        error = {}
+
+    message = error.get("message") or body[:200].decode("utf-8", errors="replace")
+    return KintoneAPIError(
+        f"kintone APIエラー: {status} {method} {path}: {message}",
+        status=status,
+        code=error.get("code"),
+    )
+
+
+class HttpCall:
+    """処理の流れがクライアントに送信を依頼するHTTPリクエスト"""
+
+    def __init__(self, method: str, url: str, params: Optional[Dict[str, Any]], body: Optional[bytes],
+                 headers: Dict[str, str], app_id: Optional[str], priority: int):
+        self.method = method
+        self.url = url
+        self.params = params
+        self.body = body
+        self.headers = headers
+        self.app_id = app_id
+        self.priority = priority
+
+
+class HttpReply:
+    """クライアントが処理の流れに返すHTTP応答"""
+
+    def __init__(self, status: int, content: bytes, retry_after: Optional[str] = None):
+        self.status = status
+        self.content = content
+        self.retry_after = retry_after
+
+
+class Sleep:
+    """処理の流れがクライアントに依頼する待機 (リトライ前のバックオフ)"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+
+class TransportError(Exception):
+    """クライアントが処理の流れに送る通信エラー"""
+
+    def __init__(self, message: str, sent: bool):
+        """
+        Args:
+            message: エラーメッセージ
+            sent: リクエストがサーバーに届いた可能性があるかどうか (接続できなかった場合はFalse)
+        """
+        super().__init__(message)
+        self.sent = sent
+
 
+class StopReading(Exception):
+    """レコードの読み込みを途中でやめた (処理の流れに後始末を実行させる)"""
 
-class KintoneClient:
+
+# 処理の流れ: HttpCall / Sleep / レコードを yield し、HttpReply を受け取るジェネレータ
+Flow = Generator[Any, Optional[HttpReply], Any]
+
+
+# 書き込み処理の名称 (ログ出力用)
+WRITE_LABELS = {"POST": "追加", "PUT": "更新", "DELETE": "削除"}
+
+
+def chunked(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """要素を size 件ずつのリストに分割 (入力は先頭から順に読み込む)"""
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_write_groups(items: Iterable[Any], use_bulk: bool) -> Iterator[Tuple[int, int, List[List[Any]]]]:
+    """
+    書き込むレコードを100件ずつのチャンクに分割し、1リクエストで送る単位にまとめる
+
+    use_bulk の場合は最大20チャンクを1つの bulkRequest にまとめる。
+
+    Yields:
+        tuple: (グループ番号, 先頭のレコード位置, チャンクのリスト)
+    """
+    group_size = BULK_REQUESTS_MAX if use_bulk else 1
+    start = 0
+    for group_index, group in enumerate(chunked(chunked(items, RECORDS_PER_REQUEST), group_size)):
+        yield group_index * group_size, start, group
+        start += sum(len(chunk) for chunk in group)
+
+
+class WriteGroups:
+    """
+    書き込むレコードを送信単位 (iter_write_groups) で返し、入力の読み込みエラーを記録する
+
+    CSVを読み込みながら送信する場合、途中の行で読み込みに失敗しても例外を送出せずに読み込みを終える。
+    呼び出し元は送信済みのチャンクの完了を待ってから、error を含めた結果を返す。
+    """
+
+    def __init__(self, items: Iterable[Any], use_bulk: bool):
+        self.items = items
+        self.use_bulk = use_bulk
+        self.error = None
+
+    def __iter__(self) -> Iterator[Tuple[int, int, List[List[Any]]]]:
+        try:
+            yield from iter_write_groups(self.items, self.use_bulk)
+        except Exception as e:
+            logger.exception(f"書き込むレコードの読み込みに失敗しました: {str(e)}")
+            self.error = e
+
+
+def write_request(method: str, app_id: str, key: str, chunks: List[List[Any]],
+                  use_bulk: bool, options: Optional[Dict[str, Any]] = None) -> Tuple[str, str, Dict[str, Any]]:
+    """
+    チャンクを送信するリクエストを作成
+
+    Args:
+        options: リクエストボディに追加する項目 (例: {"upsert": True})
+
+    Returns:
+        tuple: (HTTPメソッド, APIのパス, リクエストボディ)
+    """
+    options = options or {}
+    if not use_bulk:
+        return method, "records.json", {"app": app_id, key: chunks[0], **options}
+
+    requests_data = [
+        {"method": method, "api": "/k/v1/records.json", "payload": {"app": app_id, key: chunk, **options}}
+        for chunk in chunks
+    ]
+    return "POST", "bulkRequest.json", {"requests": requests_data}
+
+
+def chunk_reports(first_index: int, start: int, chunks: List[List[Any]], response: Optional[Dict[str, Any]],
+                  use_bulk: bool, error: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    リクエスト1件分のチャンクごとの結果を作成
+
+    Args:
+        first_index: 先頭のチャンク番号
+        start: 先頭のレコード位置
+        chunks: 送信したチャンクのリスト
+        response: API応答 (失敗した場合はNone)
+        use_bulk: bulkRequest.json で送信したかどうか
+        error: エラーメッセージ
+
+    Returns:
+        list: チャンクごとの結果 (index, start, count, success, message, data)
+    """
+    if response is None:
+        results = []
+    elif use_bulk:
+        results = response.get("results", [])
+    else:
+        results = [response]
+
+    reports = []
+    for i, chunk in enumerate(chunks):
+        reports.append({
+            "index": first_index + i,
+            "start": start,
+            "count": len(chunk),
+            "success": error is None,
+            "message": error or "",
+            "data": results[i] if i < len(results) else None,
+        })
+        start += len(chunk)
+    return reports
+
+
+def write_result(method: str, app_name: str, reports: List[Dict[str, Any]],
+                 read_error: Optional[Exception] = None) -> Dict[str, Any]:
+    """
+    チャンクごとの結果をまとめて書き込み処理の結果を作成
+
+    Args:
+        read_error: 書き込むレコードの読み込み中に発生したエラー (途中で送信を中止した場合)
+
+    Returns:
+        dict: 処理結果 (success, message, count, committed, chunks, data)
+              count は送信したレコード数、committed はそのうち書き込みに成功したレコード数
+              data は追加の場合 ids / revisions、更新の場合 records を入力順に格納
+    """
+    label = WRITE_LABELS[method]
+    if not reports and read_error is None:
+        logger.warning(f"{label}するレコードがありません")
+        return {"success": True, "message": f"{label}するレコードがありません", "count": 0, "committed": 0, "chunks": []}
+
+    reports = sorted(reports, key=lambda r: r["index"])
+    count = sum(r["count"] for r in reports)
+    failed = [r for r in reports if not r["success"]]
+    committed = count - sum(r["count"] for r in failed)
+
+    if read_error is not None:
+        message = (
+            f"レコードの読み込みに失敗したため送信を中止しました "
+            f"({count}件を送信、{committed}件を{label}済み): {str(read_error)}"
+        )
+        if failed:
+            message += f" (送信に失敗したチャンク: {len(failed)})"
+        logger.error(f"レコード{label}エラー: {message}")
+    elif failed:
+        failed_count = sum(r["count"] for r in failed)
+        message = f"{len(reports)}チャンク中{len(failed)}チャンク ({failed_count}件) の送信に失敗しました"
+        logger.error(f"レコード{label}エラー: {message}")
+    else:
+        message = f"{count}件を{len(reports)}チャンクで送信しました"
+        logger.info(f"{count}件のレコードを{label}しました: {app_name}")
+
+    result = {
+        "success": not failed and read_error is None,
+        "message": message,
+        "count": count,
+        "committed": committed,
+        "chunks": [{k: v for k, v in r.items() if k != "data"} for r in reports],
+    }
+
+    data = [r["data"] for r in reports if r["data"]]
+    if method == "POST":
+        result["data"] = {
+            "ids": [i for d in data for i in d.get("ids", [])],
+            "revisions": [i for d in data for i in d.get("revisions", [])],
+        }
+    elif method == "PUT":
+        result["data"] = {"records": [i for d in data for i in d.get("records", [])]}
+
+    return result
+
+
+class RecordCsvWriter:
+    """
+    kintoneレコードをCSVに少しずつ書き込むライター
+
+    書き込み中のファイルは「.tmp」付きの名前で作成し、commit() で出力ファイルに置き換える。
+    commit() せずに閉じた場合 (例外発生時など) は書き込み中のファイルを削除する。
+    """
+
+    def __init__(self, output_file: str, fieldnames: List[str], encoding: str = 'utf-8',
+                 batch_size: int = CSV_WRITE_BATCH_SIZE):
+        """
+        初期化
+
+        Args:
+            output_file: 出力ファイルパス
+            fieldnames: 出力する列 (フィールドコード) のリスト
+            encoding: エンコーディング
+            batch_size: まとめて書き込む行数
+        """
+        self.output_file = output_file
+        self.temp_file = f"{output_file}.tmp"
+        self.fieldnames = fieldnames
+        self.batch_size = batch_size
+        self.count = 0
+        self._rows = []
+
+        # 出力ディレクトリの確認
+        output_dir = os.path.dirname(output_file)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir, exist_ok=True)
+            logger.info(f"出力ディレクトリを作成しました: {output_dir}")
+
+        self._file = open(self.temp_file, "w", encoding=encoding, newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(fieldnames)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, record: Dict[str, Any]):
+        """レコードを1件追加 (batch_size 件ごとにファイルに書き込む)"""
+        self._rows.append(record_to_row(record, self.fieldnames))
+        if len(self._rows) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        self._writer.writerows(self._rows)
+        self.count += len(self._rows)
+        self._rows = []
+
+    def commit(self) -> int:
+        """
+        書き込みを完了して出力ファイルに置き換える
+
+        Returns:
+            int: 書き込んだレコード数 (0件の場合はファイルを作成しない)
+        """
+        self._flush()
+        self._file.close()
+        if self.count:
+            os.replace(self.temp_file, self.output_file)
+        return self.count
+
+    def close(self):
+        """ファイルを閉じ、置き換えていない書き込み中のファイルを削除"""
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self.temp_file):
+            os.remove(self.temp_file)
+
+
+class RecordSpool:
+    """
+    レコードを一時ファイルに退避しながら、全レコードのフィールドコードの和集合を求める
+
+    CSVの列を指定せずに保存する場合に、全レコードをメモリに載せずに列を決めるために使用する。
+    """
+
+    def __init__(self):
+        self._file = tempfile.TemporaryFile(mode="w+", encoding="utf-8")
+        self._fieldnames = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, record: Dict[str, Any]):
+        """レコードを1件退避"""
+        self._fieldnames.update(dict.fromkeys(record_fieldnames(record)))
+        self._file.write(json.dumps(record, ensure_ascii=False))
+        self._file.write("\n")
+
+    @property
+    def fieldnames(self) -> List[str]:
+        """フィールドコードのリスト (出現順)"""
+        return list(self._fieldnames)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """退避したレコードを先頭から読み込む"""
+        self._file.seek(0)
+        return (json.loads(line) for line in self._file)
+
+    def close(self):
+        self._file.close()
+
+
+def log_saved_csv(output_file: str, count: int) -> bool:
+    """
+    CSVの保存結果をログに出力
+
+    Returns:
+        bool: 保存成功かどうか (0件の場合は失敗)
+    """
+    if not count:
+        logger.warning("保存するレコードがありません")
+        return False
+    logger.info(f"CSVファイルを保存しました: {output_file} ({count}件)")
+    return True
+
+
+class KintoneClientBase:
+    """
+    KintoneClient と AsyncKintoneClient に共通の処理
+
+    API呼び出しを含む処理は、送信する HttpCall・待機する Sleep・取得したレコードを yield する
+    ジェネレータ (処理の流れ) として実装する。各クライアントの _drive が HttpCall を送信して
+    HttpReply を send で返し (通信エラーは TransportError を throw する)、Sleep の間待機し、
+    レコードを呼び出し元に返す。リトライの判定やページングはここにのみ実装する。
+    """
+
+    def __init__(self, domain: str, max_retries: int, backoff_factor: float,
+                 cache: Optional[KintoneMetadataCache], scheduler: Optional[KintoneRequestScheduler], priority: int):
+        """
+        初期化
+
+        Args:
+            domain: kintoneドメイン (例: example.cybozu.com、検証用に http:// も指定可)
+            max_retries: 一時的なエラー (429/5xx/接続エラー) の最大リトライ回数
+            backoff_factor: リトライ間隔の基準秒数 (backoff_factor * 2^n 秒待機)
+            cache: アプリIDとフィールド設定のファイルキャッシュ (Noneの場合はこのオブジェクト内のみ)
+            scheduler: リクエストの流量・1日の上限を制御するスケジューラ (Noneの場合は制御しない)
+            priority: スケジューラでの優先度 (PRIORITY_INTERACTIVE / PRIORITY_BACKGROUND)
+        """
+        self.domain = normalize_domain(domain)
+
+        # APIのベースURL
+        self.base_url = f"{self.domain}/k/v1"
+
+        # アプリID Cache
+        self.app_id_cache = {}
+        self.cache = cache
+
+        # 通信設定
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.scheduler = scheduler
+        self.priority = priority
+
+        # 通信の統計
+        self.stats = {"requests": 0, "retries": 0, "errors": 0, "bytes_sent": 0, "bytes_received": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, **counts: int):
+        """通信の統計を加算"""
+        with self._stats_lock:
+            for key, value in counts.items():
+                self.stats[key] += value
+
+    def _api(self, method: str, path: str, params: Dict[str, Any] = None, payload: Dict[str, Any] = None,
+             app_id: Optional[str] = None, priority: Optional[int] = None,
+             retry_ambiguous: Optional[bool] = None) -> Flow:
+        """
+        APIを呼び出す処理の流れ (戻り値はAPI応答)
+
+        429/5xxや接続エラーの場合は指数バックオフでリトライする。
+        処理されたかどうか分からない失敗 (読み込みタイムアウト、500/502/504) は retry_ambiguous の場合のみ
+        リトライし、それ以外は処理されていないことが確実な場合 (429/503/接続できなかった場合) のみリトライする。
+        リトライを含め、1回の送信ごとにスケジューラの送信枠を確保する。
+
+        Args:
+            method: HTTPメソッド
+            path: APIのパス (例: records.json)
+            params: クエリパラメータ
+            payload: リクエストボディ (JSON)
+            app_id: 対象のアプリID (Noneの場合は params / payload の app)
+            priority: スケジューラでの優先度 (Noneの場合は初期化時の値)
+            retry_ambiguous: 処理されたかどうか分からない失敗もリトライするかどうか
+                             (Noneの場合は POST 以外。POST は二重登録を避けるためリトライしない)
+
+        Raises:
+            KintoneAPIError: リトライしても成功しなかった場合、その日のリクエスト数の上限に達した場合
+        """
+        if retry_ambiguous is None:
+            retry_ambiguous = method != "POST"
+
+        body = None
+        headers = {}
+        if payload is not None:
+            body = json.dumps(payload).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+
+        call = HttpCall(
+            method, f"{self.base_url}/{path}", params, body, headers,
+            app_id or request_app_id(params, payload), self.priority if priority is None else priority,
+        )
+
+        for attempt in range(self.max_retries + 1):
+            can_retry = attempt < self.max_retries
+            self._count(requests=1, bytes_sent=len(body or b""))
+
+            try:
+                reply = yield call
+            except TransportError as e:
+                if can_retry and (retry_ambiguous or not e.sent):
+                    logger.warning(f"kintone API接続エラーのためリトライします ({attempt + 1}/{self.max_retries}): {str(e)}")
+                    self._count(retries=1)
+                    yield Sleep(backoff_delay(self.backoff_factor, attempt))
+                    continue
+                self._count(errors=1)
+                raise KintoneAPIError(f"kintone APIに接続できませんでした: {method} {path}: {str(e)}") from e
+
+            self._count(bytes_received=len(reply.content))
+
+            if 200 <= reply.status < 300:
+                return json.loads(reply.content)
+
+            if can_retry and is_retryable_status(reply.status, retry_ambiguous):
+                logger.warning(
+                    f"kintone APIが一時的なエラーを返したためリトライします ({attempt + 1}/{self.max_retries}): "
+                    f"{reply.status} {method} {path}"
+                )
+                self._count(retries=1)
+                yield Sleep(backoff_delay(self.backoff_factor, attempt, reply.retry_after))
+                continue
+
+            self._count(errors=1)
+            raise api_error(reply.status, method, path, reply.content)
+
+    def _app_id_flow(self, app_name: str) -> Flow:
+        """アプリ名からアプリIDを取得する処理の流れ (戻り値はアプリID、見つからない場合はNone)"""
+        # キャッシュからの取得を試みる
+        if app_name in self.app_id_cache:
+            return self.app_id_cache[app_name]
+
+        if self.cache:
+            app_id = self.cache.get_app_id(app_name)
+            if app_id:
+                self.app_id_cache[app_name] = app_id
+                return app_id
+
+        # アプリ名で絞り込んだアプリ一覧を取得 (部分一致のため完全一致するものを探す)
+        offset = 0
+        while True:
+            params = {"name": app_name, "limit": APPS_PAGE_SIZE, "offset": offset}
+            data = yield from self._api("GET", "apps.json", params=params)
+            apps = data.get("apps", [])
+
+            app_id = find_app_id(apps, app_name)
+            if app_id:
+                # キャッシュに保存
+                self.app_id_cache[app_name] = app_id
+                if self.cache:
+                    self.cache.set_app_id(app_name, app_id)
+                logger.info(f"アプリIDを取得しました: {app_name} (ID: {app_id})")
+                return app_id
+
+            if len(apps) < APPS_PAGE_SIZE:
+                break
+            offset += APPS_PAGE_SIZE
+
+        logger.warning(f"アプリ名に一致するアプリIDが見つかりません: {app_name}")
+        return None
+
+    def _require_app_id_flow(self, app_name: str) -> Flow:
+        """アプリIDを取得する処理の流れ (見つからない場合はKintoneAPIError)"""
+        app_id = yield from self._app_id_flow(app_name)
+        if not app_id:
+            raise KintoneAPIError(f"アプリIDが取得できませんでした: {app_name}")
+        return app_id
+
+    def _form_fields_flow(self, app_name: str) -> Flow:
+        """フォームのフィールド設定を取得する処理の流れ"""
+        app_id = yield from self._require_app_id_flow(app_name)
+
+        properties = self.cache.get_form_fields(app_id) if self.cache else None
+        if properties is None:
+            data = yield from self._api("GET", "app/form/fields.json", params={"app": app_id})
+            properties = data.get("properties", {})
+            if self.cache:
+                self.cache.set_form_fields(app_id, properties)
+        return properties
+
+    def _invalidate_cache(self, app_name: str, error: KintoneAPIError):
+        """アプリが見つからないエラーの場合はキャッシュしたアプリIDを破棄 (アプリの再作成など)"""
+        if error.code == APP_NOT_FOUND_CODE:
+            self.app_id_cache.pop(app_name, None)
+            if self.cache:
+                self.cache.invalidate(app_name)
+
+    def _cursor_flow(self, app_name: str, app_id: str, query: str = "", fields: List[str] = None,
+                     max_records: Optional[int] = None, page_size: int = 500) -> Flow:
+        """
+        カーソルを作成してレコードを1件ずつ yield する処理の流れ
+
+        カーソルの読み込み (GET) はサーバー側で読み込み位置が進むため、応答を受け取れたか分からない失敗
+        (読み込みタイムアウト、500/502/504) をリトライすると次のページが返り、1ページ分のレコードを
+        取りこぼす。このため処理されていないことが確実な場合のみリトライし、それ以外は読み込みを中止する。
+        最後まで読み込まなかった場合 (StopReading、エラー) はカーソルを削除する。
+        """
+        size = min(page_size, 500)
+        if max_records is not None:
+            size = max(1, min(size, max_records))
+
+        # カーソルを作成
+        payload = {"app": app_id, "size": size}
+        if query:
+            payload["query"] = query
+        if fields:
+            payload["fields"] = list(fields)
+
+        try:
+            cursor = yield from self._api("POST", "records/cursor.json", payload=payload)
+        except KintoneAPIError as e:
+            self._invalidate_cache(app_name, e)
+            raise
+        cursor_id = cursor["id"]
+        logger.info(f"カーソルを作成しました: {app_name} (全{cursor.get('totalCount')}件)")
+
+        count = 0
+        finished = False
+        try:
+            while True:
+                try:
+                    data = yield from self._api("GET", "records/cursor.json", params={"id": cursor_id},
+                                                app_id=app_id, retry_ambiguous=False)
+                except KintoneAPIError as e:
+                    raise KintoneAPIError(
+                        f"カーソルの読み込みに失敗したため中止しました ({count}件まで取得済み): {str(e)}",
+                        e.status, e.code,
+                    ) from e
+
+                for record in data.get("records", []):
+                    yield record
+                    count += 1
+                    if max_records is not None and count >= max_records:
+                        return
+
+                if not data.get("next"):
+                    # 最後まで読み込んだカーソルは kintone 側で削除される
+                    finished = True
+                    return
+
+        finally:
+            if not finished:
+                try:
+                    # カーソルが残らないよう、バックグラウンドの同期でも対話的な実行の枠で削除する
+                    yield from self._api("DELETE", "records/cursor.json", payload={"id": cursor_id},
+                                         app_id=app_id, priority=PRIORITY_INTERACTIVE)
+                except KintoneAPIError as e:
+                    logger.warning(f"カーソルの削除に失敗しました: {str(e)}")
+
+            logger.info(f"{count}件のレコードを取得しました: {app_name}")
+
+    def _write_chunks_flow(self, method: str, app_id: str, key: str, first_index: int, start: int,
+                           chunks: List[List[Any]], use_bulk: bool, options: Optional[Dict[str, Any]]) -> Flow:
+        """1リクエスト分のチャンクを送信する処理の流れ (戻り値はチャンクごとの結果)"""
+        try:
+            request_method, path, payload = write_request(method, app_id, key, chunks, use_bulk, options)
+            response = yield from self._api(request_method, path, payload=payload)
+        except KintoneAPIError as e:
+            logger.error(f"チャンクの送信に失敗しました ({method} {start + 1}件目から): {str(e)}")
+            return chunk_reports(first_index, start, chunks, None, use_bulk, str(e))
+        return chunk_reports(first_index, start, chunks, response, use_bulk)
+
+
+class KintoneClient(KintoneClientBase):
     """kintone APIクライアント"""
 
-    def __init__(self, domain: str, api_token: str = None, username: str = None, password: str = None):
+    def __init__(self, domain: str, api_token: str = None, username: str = None, password: str = None,
+                 timeout: Tuple[float, float] = (5.0, 30.0), max_retries: int = 3, backoff_factor: float = 0.5,
+                 pool_maxsize: int = 10, concurrency: int = 4, cache: Optional[KintoneMetadataCache] = None,
+                 scheduler: Optional[KintoneRequestScheduler] = None, priority: int = PRIORITY_INTERACTIVE):
         """
         初期化
 
@@ -29,23 +863,46 @@ class KintoneClient:
             api_token: APIトークン (優先的に使用)
             username: ユーザー名 (APIトークンがない場合)
             password: パスワード (APIトークンがない場合)
+            timeout: (接続タイムアウト, 読み込みタイムアウト) 秒
+            max_retries: 一時的なエラー (429/5xx/接続エラー) の最大リトライ回数
+            backoff_factor: リトライ間隔の基準秒数 (backoff_factor * 2^n 秒待機)
+            pool_maxsize: 保持するコネクション数の上限
+            concurrency: 書き込み時に同時に送信するリクエスト数
+            cache: アプリIDとフィールド設定のファイルキャッシュ (Noneの場合はこのオブジェクト内のみ)
+            scheduler: リクエストの流量・1日の上限を制御するスケジューラ (Noneの場合は制御しない)
+            priority: スケジューラでの優先度 (PRIORITY_INTERACTIVE / PRIORITY_BACKGROUND)
         """
-        self.domain = domain.rstrip('/')
-        if not self.domain.startswith('https://'):
-            self.domain = f"https://{self.domain}"
+        super().__init__(domain, max_retries, backoff_factor, cache, scheduler, priority)
 
         self.api_token = api_token
         self.username = username
         self.password = password
 
-        # APIのベースURL
-        self.base_url = f"{self.domain}/k/v1"
+        # 通信設定
+        self.timeout = timeout
+        self.concurrency = max(1, min(concurrency, pool_maxsize))
 
-        # アプリID Cache
-        self.app_id_cache = {}
+        # コネクションを再利用するセッション
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(self._get_headers())
 
         logger.info(f"kintoneクライアントを初期化しました: {self.domain}")
 
+    def close(self):
+        """セッションを閉じる"""
+        self.session.close()
+        if self.scheduler:
+            self.scheduler.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     def _get_headers(self) -> Dict[str, str]:
         """
         API呼び出し用のヘッダーを取得
@@ -53,325 +910,384 @@ class KintoneClient:
         Returns:
             dict: ヘッダー情報
         """
-        headers = {
-            "Content-Type": "application/json",
-            "X-HTTP-Method-Override": "GET"
-        }
-
-        # API トークン認証
-        if self.api_token:
-            headers["X-Cybozu-API-Token"] = self.api_token
+        return auth_headers(self.api_token, self.username, self.password)
 
-        # Basic 認証
-        elif self.username and self.password:
-            auth = f"{self.username}:{self.password}"
-            encoded_auth = base64.b64encode(auth.encode()).decode()
-            headers["Authorization"] = f"Basic {encoded_auth}"
-
-        else:
-            logger.warning("認証情報が設定されていません")
+    @contextmanager
+    def _slot(self, app_id: Optional[str], priority: int):
+        """スケジューラの送信枠を確保する (スケジューラがない場合は何もしない)"""
+        if self.scheduler is None:
+            yield
+            return
 
-        return headers
+        try:
+            self.scheduler.acquire(app_id, priority)
+        except BudgetExhaustedError as e:
+            self._count(errors=1)
+            raise KintoneAPIError(str(e), code=BUDGET_EXHAUSTED_CODE) from e
+        try:
+            yield
+        finally:
+            self.scheduler.release()
 
-    def get_app_id(self, app_name: str) -> Optional[str]:
+    def _send(self, call: HttpCall) -> HttpReply:
         """
-        アプリ名からアプリIDを取得
+        HTTPリクエストを1回送信
 
-        Args:
-            app_name: アプリ名
-
-        Returns:
-            str or None: アプリID (見つからない場合はNone)
+        Raises:
+            TransportError: 接続エラー・タイムアウトの場合
+            KintoneAPIError: その日のリクエスト数の上限に達した場合
         """
-        # キャッシュからの取得を試みる
-        if app_name in self.app_id_cache:
-            return self.app_id_cache[app_name]
-
-        # アプリ一覧を取得
-        url = f"{self.base_url}/apps.json"
-        headers = self._get_headers()
-
         try:
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
+            with self._slot(call.app_id, call.priority):
+                response = self.session.request(
+                    call.method, call.url, params=call.params, data=call.body, headers=call.headers,
+                    timeout=self.timeout,
+                )
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise TransportError(str(e), sent=not isinstance(e, requests.ConnectTimeout)) from e
+        return HttpReply(response.status_code, response.content, response.headers.get("Retry-After"))
+
+    def _drive(self, flow: Flow, error: Optional[BaseException] = None,
+               result: Optional[List[Any]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        処理の流れを実行し、流れが yield するレコードを返すジェネレータ
 
-            apps = response.json().get("apps", [])
+        読み込みを途中でやめた場合は処理の流れに StopReading を送り、後始末 (カーソルの削除など) を実行させる。
 
-            # アプリ名でフィルタリング
-            for app in apps:
-                if app.get("name") == app_name:
-                    app_id = str(app.get("appId"))
-                    # キャッシュに保存
-                    self.app_id_cache[app_name] = app_id
-                    logger.info(f"アプリIDを取得しました: {app_name} (ID: {app_id})")
-                    return app_id
+        Args:
+            flow: 処理の流れ
+            error: 最初に処理の流れに送る例外
+            result: 処理の流れの戻り値を追加するリスト
+        """
+        reply = None
+        while True:
+            try:
+                step = flow.throw(error) if error is not None else flow.send(reply)
+            except StopIteration as stop:
+                if result is not None:
+                    result.append(stop.value)
+                return
+            reply = error = None
+
+            if isinstance(step, HttpCall):
+                try:
+                    reply = self._send(step)
+                except (TransportError, KintoneAPIError) as e:
+                    error = e
+            elif isinstance(step, Sleep):
+                time.sleep(step.seconds)
+            else:
+                try:
+                    yield step
+                except GeneratorExit:
+                    self._abandon(flow)
+                    raise
+
+    def _abandon(self, flow: Flow):
+        """読み込みを途中でやめた処理の流れの後始末を実行"""
+        try:
+            for _ in self._drive(flow, StopReading()):
+                pass
+        except StopReading:
+            pass
+
+    def _run(self, flow: Flow) -> Any:
+        """レコードを返さない処理の流れを実行し、戻り値を返す"""
+        result = []
+        for _ in self._drive(flow, result=result):
+            pass
+        return result[0]
+
+    def _request(self, method: str, path: str, params: Dict[str, Any] = None,
+                 payload: Dict[str, Any] = None, app_id: Optional[str] = None,
+                 priority: Optional[int] = None) -> Dict[str, Any]:
+        """
+        APIを呼び出す (リトライの条件は KintoneClientBase._api)
 
-            logger.warning(f"アプリ名に一致するアプリIDが見つかりません: {app_name}")
-            return None
+        Returns:
+            dict: API応答
 
-        except Exception as e:
-            logger.exception(f"アプリID取得エラー: {str(e)}")
-            return None
+        Raises:
+            KintoneAPIError: リトライしても成功しなかった場合、その日のリクエスト数の上限に達した場合
+        """
+        return self._run(self._api(method, path, params, payload, app_id, priority))
 
-    def get_records(self, app_name: str, query: str = "", fields: List[str] = None, max_records: int = 500) -> List[Dict[str, Any]]:
+    def get_app_id(self, app_name: str) -> Optional[str]:
         """
-        レコードを取得
+        アプリ名からアプリIDを取得
 
         Args:
             app_name: アプリ名
-            query: クエリ文字列
-            fields: 取得するフィールド名のリスト
-            max_records: 最大取得レコード数
 
         Returns:
-            list: レコードのリスト
+            str or None: アプリID (見つからない場合はNone)
+
+        Raises:
+            KintoneAPIError: API呼び出しに失敗した場合
         """
-        # アプリIDを取得
-        app_id = self.get_app_id(app_name)
-        if not app_id:
-            logger.error(f"アプリIDが取得できませんでした: {app_name}")
-            return []
+        return self._run(self._app_id_flow(app_name))
 
-        # APIエンドポイント
-        url = f"{self.base_url}/records.json"
-        headers = self._get_headers()
+    def get_form_fields(self, app_name: str) -> Dict[str, Any]:
+        """
+        アプリのフォームのフィールド設定を取得
 
-        # クエリパラメータの構築
-        params = {
-            "app": app_id,
-            "totalCount": True
-        }
+        Args:
+            app_name: アプリ名
 
-        if query:
-            params["query"] = query
+        Returns:
+            dict: フィールド設定 ({フィールドコード: {"type": ..., "code": ..., ...}})
 
-        if fields:
-            params["fields"] = fields
+        Raises:
+            KintoneAPIError: API呼び出しに失敗した場合
+        """
+        return self._run(self._form_fields_flow(app_name))
 
-        all_records = []
-        offset = 0
-        limit = min(max_records, 500)  # 1回のリクエストで最大500件
+    def get_record_fieldnames(self, app_name: str) -> List[str]:
+        """
+        フォームのフィールド設定からCSVに出力する列 (フィールドコード) を取得
 
-        try:
-            while True:
-                # オフセットとリミットの設定
-                current_query = f"{query} limit {limit} offset {offset}" if query else f"limit {limit} offset {offset}"
-                params["query"] = current_query
+        Args:
+            app_name: アプリ名
 
-                # API呼び出し
-                response = requests.get(url, headers=headers, params=params)
-                response.raise_for_status()
+        Returns:
+            list: フィールドコードのリスト
 
-                data = response.json()
-                records = data.get("records", [])
+        Raises:
+            KintoneAPIError: API呼び出しに失敗した場合
+        """
+        return form_fieldnames(self.get_form_fields(app_name))
 
-                if not records:
-                    break
+    def iter_records(self, app_name: str, query: str = "", fields: List[str] = None,
+                     max_records: Optional[int] = None, page_size: int = 500) -> Iterator[Dict[str, Any]]:
+        """
+        カーソルAPIを使用してレコードを1件ずつ取得するジェネレータ
 
-                all_records.extend(records)
+        ページ単位で取得したレコードを順に返すため、メモリ使用量はアプリの
+        レコード数によらず1ページ分に収まる。offsetの上限 (10,000件) も受けない。
+        途中で読み込みをやめた場合もカーソルは削除される。
 
-                # 次のページがあるかチェック
-                offset += limit
-                if offset >= data.get("totalCount", 0) or len(all_records) >= max_records:
-                    break
+        Args:
+            app_name: アプリ名
+            query: クエリ文字列 (limit / offset は指定不可)
+            fields: 取得するフィールド名のリスト
+            max_records: 最大取得レコード数 (Noneの場合は全件)
+            page_size: 1回のリクエストで取得する件数 (最大500件)
 
-            logger.info(f"{len(all_records)}件のレコードを取得しました: {app_name}")
-            return all_records
+        Yields:
+            dict: レコード
 
-        except Exception as e:
-            logger.exception(f"レコード取得エラー: {str(e)}")
-            return []
+        Raises:
+            KintoneAPIError: API呼び出しに失敗した場合
+        """
+        app_id = self._run(self._require_app_id_flow(app_name))
+        yield from self._drive(self._cursor_flow(app_name, app_id, query, fields, max_records, page_size))
 
-    def add_records(self, app_name: str, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def get_records(self, app_name: str, query: str = "", fields: List[str] = None,
+                    max_records: Optional[int] = None) -> List[Dict[str, Any]]:
         """
-        レコードを追加
+        レコードを取得
 
         Args:
             app_name: アプリ名
-            records: 追加するレコードのリスト
+            query: クエリ文字列
+            fields: 取得するフィールド名のリスト
+            max_records: 最大取得レコード数 (Noneの場合は全件)
 
         Returns:
-            dict: API応答
-        """
-        if not records:
-            logger.warning("追加するレコードがありません")
-            return {"success": True, "message": "追加するレコードがありません"}
-
-        # アプリIDを取得
-        app_id = self.get_app_id(app_name)
-        if not app_id:
-            logger.error(f"アプリIDが取得できませんでした: {app_name}")
-            return {"success": False, "message": f"アプリIDが取得できませんでした: {app_name}"}
-
-        # APIエンドポイント
-        url = f"{self.base_url}/records.json"
-        headers = self._get_headers()
-
-        # リクエストデータの構築
-        req_data = {
-            "app": app_id,
-            "records": records
-        }
+            list: レコードのリスト
 
+        Raises:
+            KintoneAPIError: API呼び出しに失敗した場合
+        """
         try:
-            # API呼び出し
-            response = requests.post(url, headers=headers, data=json.dumps(req_data))
-            response.raise_for_status()
-
-            result = response.json()
-            logger.info(f"{len(records)}件のレコードを追加しました: {app_name}")
+            return list(self.iter_records(app_name, query, fields, max_records))
 
-            return {"success": True, "data": result}
+        except KintoneAPIError as e:
+            logger.error(f"レコード取得エラー: {str(e)}")
+            raise
 
-        except Exception as e:
-            logger.exception(f"レコード追加エラー: {str(e)}")
-            return {"success": False, "message": str(e)}
-
-    def update_records(self, app_name: str, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def _write_records(self, method: str, app_name: str, key: str, items: Iterable[Any],
+                       use_bulk: bool = False, concurrency: Optional[int] = None,
+                       options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
-        レコードを更新
+        レコードを100件ずつのチャンクに分割して書き込む
+
+        use_bulk の場合は最大20チャンクを bulkRequest.json にまとめ、
+        まとめたチャンクはすべて成功するかすべて失敗する (トランザクション)。
+        チャンク (またはbulkRequest) は最大 concurrency 件まで並列に送信する。
 
         Args:
+            method: HTTPメソッド (POST / PUT / DELETE)
             app_name: アプリ名
-            records: 更新するレコードのリスト (各レコードにはIDと更新項目を含む)
+            key: リクエストボディのキー (records または ids)
+            items: 書き込むレコード (またはレコードID)
+            use_bulk: bulkRequest.json を使用するかどうか
+            concurrency: 同時に送信するリクエスト数 (Noneの場合は初期化時の値)
+            options: リクエストボディに追加する項目
 
         Returns:
-            dict: API応答
+            dict: 処理結果 (success, message, count, committed, chunks, data)
+                  chunks はチャンクごとの結果 (index, start, count, success, message)
+                  レコードの読み込みに失敗した場合は、送信済みのチャンクの結果を含めて失敗を返す
         """
-        if not records:
-            logger.warning("更新するレコードがありません")
-            return {"success": True, "message": "更新するレコードがありません"}
-
         # アプリIDを取得
-        app_id = self.get_app_id(app_name)
-        if not app_id:
-            logger.error(f"アプリIDが取得できませんでした: {app_name}")
-            return {"success": False, "message": f"アプリIDが取得できませんでした: {app_name}"}
-
-        # APIエンドポイント
-        url = f"{self.base_url}/records.json"
-        headers = self._get_headers()
-        headers["X-HTTP-Method-Override"] = "PUT"
-
-        # リクエストデータの構築
-        req_data = {
-            "app": app_id,
-            "records": records
-        }
-
         try:
-            # API呼び出し
-            response = requests.put(url, headers=headers, data=json.dumps(req_data))
-            response.raise_for_status()
-
-            result = response.json()
-            logger.info(f"{len(records)}件のレコードを更新しました: {app_name}")
+            app_id = self._run(self._require_app_id_flow(app_name))
+        except KintoneAPIError as e:
+            logger.error(str(e))
+            return {"success": False, "message": str(e), "count": 0, "committed": 0, "chunks": []}
+
+        concurrency = concurrency or self.concurrency
+        groups = WriteGroups(items, use_bulk)
+        reports = []
+
+        def send(first_index: int, start: int, chunks: List[List[Any]]) -> List[Dict[str, Any]]:
+            return self._run(
+                self._write_chunks_flow(method, app_id, key, first_index, start, chunks, use_bulk, options)
+            )
+
+        # チャンクを順に読み込みながら、送信中のリクエストが concurrency 件を超えないように送信
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            pending = set()
+            for first_index, start, chunks in groups:
+                if len(pending) >= concurrency:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        reports.extend(future.result())
+
+                pending.add(executor.submit(send, first_index, start, chunks))
+
+            for future in pending:
+                reports.extend(future.result())
+
+        return write_result(method, app_name, reports, groups.error)
+
+    def add_records(self, app_name: str, records: Iterable[Dict[str, Any]], use_bulk: bool = False,
+                    concurrency: Optional[int] = None) -> Dict[str, Any]:
+        """
+        レコードを追加 (100件ずつに分割して送信)
 
-            return {"success": True, "data": result}
+        Args:
+            app_name: アプリ名
+            records: 追加するレコード (リストまたはイテレータ)
+            use_bulk: bulkRequest.json で最大20チャンクずつまとめて送信するかどうか
+            concurrency: 同時に送信するリクエスト数
 
-        except Exception as e:
-            logger.exception(f"レコード更新エラー: {str(e)}")
-            return {"success": False, "message": str(e)}
+        Returns:
+            dict: 処理結果 (success, message, count, committed, chunks, data)
+                  data には追加したレコードのIDとリビジョン (ids, revisions) を入力順に格納
+        """
+        return self._write_records("POST", app_name, "records", records, use_bulk, concurrency)
 
-    def delete_records(self, app_name: str, record_ids: List[str]) -> Dict[str, Any]:
+    def update_records(self, app_name: str, records: Iterable[Dict[str, Any]], use_bulk: bool = False,
+                       concurrency: Optional[int] = None, upsert: bool = False) -> Dict[str, Any]:
         """
-        レコードを削除
+        レコードを更新 (100件ずつに分割して送信)
 
         Args:
             app_name: アプリ名
-            record_ids: 削除するレコードIDのリスト
+            records: 更新するレコード (各レコードにはIDまたはupdateKeyと更新項目を含む)
+            use_bulk: bulkRequest.json で最大20チャンクずつまとめて送信するかどうか
+            concurrency: 同時に送信するリクエスト数
+            upsert: updateKeyに一致するレコードがない場合は追加するかどうか
 
         Returns:
-            dict: API応答
+            dict: 処理結果 (success, message, count, committed, chunks, data)
+                  data には更新したレコードのIDとリビジョン (records) を入力順に格納
+                  (upsert の場合は operation に INSERT / UPDATE が入る)
         """
-        if not record_ids:
-            logger.warning("削除するレコードがありません")
-            return {"success": True, "message": "削除するレコードがありません"}
+        options = {"upsert": True} if upsert else None
+        return self._write_records("PUT", app_name, "records", records, use_bulk, concurrency, options)
 
-        # アプリIDを取得
-        app_id = self.get_app_id(app_name)
-        if not app_id:
-            logger.error(f"アプリIDが取得できませんでした: {app_name}")
-            return {"success": False, "message": f"アプリIDが取得できませんでした: {app_name}"}
-
-        # APIエンドポイント
-        url = f"{self.base_url}/records.json"
-        headers = self._get_headers()
-        headers["X-HTTP-Method-Override"] = "DELETE"
-
-        # リクエストデータの構築
-        req_data = {
-            "app": app_id,
-            "ids": record_ids
-        }
-
-        try:
-            # API呼び出し
-            response = requests.delete(url, headers=headers, data=json.dumps(req_data))
-            response.raise_for_status()
+    def delete_records(self, app_name: str, record_ids: Iterable[str], use_bulk: bool = False,
+                       concurrency: Optional[int] = None) -> Dict[str, Any]:
+        """
+        レコードを削除 (100件ずつに分割して送信)
 
-            logger.info(f"{len(record_ids)}件のレコードを削除しました: {app_name}")
-            return {"success": True}
+        Args:
+            app_name: アプリ名
+            record_ids: 削除するレコードID
+            use_bulk: bulkRequest.json で最大20チャンクずつまとめて送信するかどうか
+            concurrency: 同時に送信するリクエスト数
 
-        except Exception as e:
-            logger.exception(f"レコード削除エラー: {str(e)}")
-            return {"success": False, "message": str(e)}
+        Returns:
+            dict: 処理結果 (success, message, count, committed, chunks)
+        """
+        return self._write_records("DELETE", app_name, "ids", record_ids, use_bulk, concurrency)
 
-    def save_as_csv(self, records: List[Dict[str, Any]], output_file: str, encoding: str = 'utf-8') -> bool:
+    def save_as_csv(self, records: Iterable[Dict[str, Any]], output_file: str, encoding: str = 'utf-8',
+                    fieldnames: Optional[List[str]] = None, batch_size: int = CSV_WRITE_BATCH_SIZE) -> bool:
         """
         レコードをCSVとして保存
 
+        レコードは受け取った順に batch_size 行ずつ書き込むため、iter_records と
+        組み合わせると取得しながら書き込みが進み、メモリ使用量は件数によらず一定になる。
+        列は fieldnames (get_record_fieldnames で取得したフォームの定義など) に従う。
+        fieldnames を省略した場合は全レコードのフィールドの和集合を列とし、
+        その間レコードは一時ファイルに退避する。
+        書き込み中のファイルは「.tmp」付きの名前で作成し、完了後に置き換える。
+
         Args:
-            records: レコードのリスト
+            records: レコード (リストまたはイテレータ)
             output_file: 出力ファイルパス
             encoding: エンコーディング
+            fieldnames: 出力する列 (フィールドコード) のリスト
+            batch_size: まとめて書き込む行数
 
         Returns:
             bool: 保存成功かどうか
         """
-        if not records:
-            logger.warning("保存するレコードがありません")
-            return False
+        spool = None
 
         try:
-            # 出力ディレクトリの確認
-            output_dir = os.path.dirname(output_file)
-            if output_dir and not os.path.exists(output_dir):
-                os.makedirs(output_dir, exist_ok=True)
-                logger.info(f"出力ディレクトリを作成しました: {output_dir}")
-
-            # フィールド名を取得
-            first_record = records[0]
-            fieldnames = []
-
-            # 全フィールドを取得
-            for field_name, field_data in first_record.items():
-                # 通常のフィールド
-                if isinstance(field_data, dict) and "value" in field_data:
-                    fieldnames.append(field_name)
-
-            # DataFrameに変換
-            data_list = []
-            for record in records:
-                row_data = {}
-                for field_name in fieldnames:
-                    if field_name in record and "value" in record[field_name]:
-                        row_data[field_name] = record[field_name]["value"]
-                    else:
-                        row_data[field_name] = ""
-                data_list.append(row_data)
-
-            # CSVとして保存
-            df = pd.DataFrame(data_list)
-            df.to_csv(output_file, encoding=encoding, index=False)
-
-            logger.info(f"CSVファイルを保存しました: {output_file}")
-            return True
+            # 列が指定されていない場合は全レコードから求める
+            if fieldnames is None:
+                spool = RecordSpool()
+                for record in records:
+                    spool.write(record)
+                fieldnames, records = spool.fieldnames, iter(spool)
+
+            with RecordCsvWriter(output_file, fieldnames, encoding, batch_size) as writer:
+                for record in records:
+                    writer.write(record)
+                count = writer.commit()
+
+            return log_saved_csv(output_file, count)
 
         except Exception as e:
             logger.exception(f"CSV保存エラー: {str(e)}")
             return False
 
+        finally:
+            if spool is not None:
+                spool.close()
+
+    def iter_csv_records(self, csv_file: str, encoding: str = None,
+                         chunk_size: int = CSV_READ_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+        """
+        CSVファイルを chunk_size 行ずつ読み込み、kintoneレコード形式に変換して1件ずつ返す
+
+        値はCSVに書かれた文字列のまま送信する (数値の再フォーマットは行わない)。
+        add_records などに直接渡すと、ファイル全体をメモリに載せずに送信できる。
+
+        Args:
+            csv_file: CSVファイルパス
+            encoding: エンコーディング (自動検出する場合はNone)
+            chunk_size: 一度に読み込む行数
+
+        Yields:
+            dict: kintoneレコード
+        """
+        count = 0
+        with open_csv_buffer(csv_file, encoding) as (buffer, encoding):
+            logger.info(f"CSVエンコーディング: {encoding}")
+            for chunk in pd.read_csv(buffer, encoding=encoding, dtype=str, chunksize=chunk_size):
+                records = dataframe_to_records(chunk)
+                count += len(records)
+                yield from records
+
+        logger.info(f"{count}件のレコードに変換しました: {csv_file}")
+
     def csv_to_records(self, csv_file: str, encoding: str = None) -> List[Dict[str, Any]]:
         """
         CSVファイルをkintoneレコード形式に変換
@@ -389,38 +1305,8 @@ class KintoneClient:
                 logger.error(f"ファイルが存在しません: {csv_file}")
                 return []
 
-            # エンコーディングを自動検出
-            if not encoding:
-                from utils import detect_csv_encoding
-                encoding = detect_csv_encoding(csv_file)
-                logger.info(f"CSVエンコーディング: {encoding}")
-
-            # CSVを読み込み
-            df = pd.read_csv(csv_file, encoding=encoding)
-
-            # kintoneレコード形式に変換
-            records = []
-            for _, row in df.iterrows():
-                record = {}
-                for col in df.columns:
-                    value = row[col]
-
-                    # NaN値はスキップ
-                    if pd.isna(value):
-                        continue
-
-                    # 日付型判定
-                    if isinstance(value, pd.Timestamp):
-                        value = value.strftime("%Y-%m-%d")
-
-                    # 辞書形式に変換
-                    record[col] = {"value": str(value)}
-
-                records.append(record)
-
-            logger.info(f"{len(records)}件のレコードに変換しました: {csv_file}")
-            return records
+            return list(self.iter_csv_records(csv_file, encoding))
 
         except Exception as e:
             logger.exception(f"CSV変換エラー: {str(e)}")
-            return []
\ No newline at end of file
+            return []
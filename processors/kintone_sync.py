@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+kintone差分同期モジュール
+
+前回の同期で取得した最新の更新日時 (ハイウォーターマーク) 以降に更新されたレコードだけを取得し、
+ローカルのスナップショットにマージする。更新されたレコードに含まれる従業員・月の
+勤怠CSVだけを作り直し、勤怠表 (Excel) を再作成する。
+従業員や日付が変更されたレコードは、変更前の従業員・月の勤怠CSVも作り直す。
+
+取得したレコードは一時ファイルに書き出し、スナップショットのマージと従業員・月ごとの分割は
+CSVを chunk_size 行ずつ読み込んで行う (初回の全件取得でも全レコードをメモリに載せない)。
+
+kintone側で削除されたレコードは検出しない (全件の取得が必要になるため)。
+"""
+import csv
+import json
+import os
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import pandas as pd
+from loguru import logger
+
+from processors.kintone_client import CSV_READ_CHUNK_SIZE, KintoneClient, record_to_row
+from processors.pipeline import run_batch
+from utils import safe_filename
+
+# スナップショットのレコードIDのカラム
+RECORD_ID_FIELD = "$id"
+
+# レコードのリビジョン (更新のたびに増える) のフィールド
+REVISION_FIELD = "$revision"
+
+
+class KintoneSync:
+    """kintoneアプリの差分同期"""
+
+    def __init__(self, client: KintoneClient, app_name: str, work_dir: str,
+                 employee_field: str = "従業員名", date_field: str = "日付", updated_field: str = "更新日時"):
+        """
+        初期化
+
+        Args:
+            client: kintoneクライアント
+            app_name: アプリ名
+            work_dir: 同期状態・スナップショット・勤怠CSVを保存するディレクトリ
+            employee_field: 従業員名のフィールドコード
+            date_field: 日付のフィールドコード
+            updated_field: 更新日時のフィールドコード
+        """
+        self.client = client
+        self.app_name = app_name
+        self.employee_field = employee_field
+        self.date_field = date_field
+        self.updated_field = updated_field
+
+        self.app_dir = os.path.join(work_dir, safe_filename(app_name))
+        self.state_file = os.path.join(self.app_dir, "state.json")
+        self.snapshot_file = os.path.join(self.app_dir, "snapshot.csv")
+        self.changes_file = os.path.join(self.app_dir, "changes.csv")
+        self.csv_dir = os.path.join(self.app_dir, "csv")
+        self.chunk_size = CSV_READ_CHUNK_SIZE
+
+    def load_state(self) -> Dict[str, Any]:
+        """
+        同期状態を読み込む
+
+        Returns:
+            dict: last_updated (最新の更新日時),
+                  revisions_at_mark (その更新日時のレコードの {レコードID: リビジョン}),
+                  pending (前回Excelの作成に失敗した [従業員名, 年月])
+        """
+        state = {"last_updated": None, "revisions_at_mark": {}, "pending": []}
+        if os.path.exists(self.state_file):
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                state.update(json.load(f))
+        # レコードIDのみを保存していた形式の場合は、その更新日時のレコードを取得し直す
+        state.pop("ids_at_mark", None)
+        return state
+
+    def _save_state(self, state: Dict[str, Any]):
+        """同期状態を保存 (一時ファイルに書き込んでから置き換える)"""
+        os.makedirs(self.app_dir, exist_ok=True)
+        temp_file = f"{self.state_file}.tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(temp_file, self.state_file)
+
+    def _build_query(self, state: Dict[str, Any]) -> str:
+        """前回の更新日時以降に更新されたレコードを取得するクエリ"""
+        order = f"order by {self.updated_field} asc"
+        if not state["last_updated"]:
+            return order
+        # 同じ更新日時のレコードを取りこぼさないよう「以上」で取得し、取得済みのものは後で除く
+        return f'{self.updated_field} >= "{state["last_updated"]}" {order}'
+
+    def fetch_changes(self, state: Dict[str, Any]) -> Tuple[int, Optional[str], Dict[str, str]]:
+        """
+        前回の同期以降に更新されたレコードを取得し、一時ファイル (changes_file) に書き出す
+
+        Returns:
+            tuple: (更新されたレコードの件数 (前回取得済みのものを除く),
+                    次回のハイウォーターマーク (更新日時, {レコードID: リビジョン}))
+        """
+        # 更新日時は分単位のため、同じ分の再更新はリビジョンの違いで検出する
+        seen = state["revisions_at_mark"]
+        last_updated, revisions_at_mark = state["last_updated"], dict(seen)
+        count = 0
+        writer = None
+
+        os.makedirs(self.app_dir, exist_ok=True)
+        with open(self.changes_file, "w", encoding="utf-8", newline="") as f:
+            for record in self.client.iter_records(self.app_name, self._build_query(state)):
+                record_id = record.get(RECORD_ID_FIELD, {}).get("value")
+                revision = record.get(REVISION_FIELD, {}).get("value")
+                updated = record.get(self.updated_field, {}).get("value")
+                if updated == state["last_updated"] and revision is not None and seen.get(record_id) == revision:
+                    continue
+
+                if writer is None:
+                    fieldnames = self.client.get_record_fieldnames(self.app_name)
+                    writer = csv.writer(f)
+                    writer.writerow(fieldnames)
+                writer.writerow(record_to_row(record, fieldnames))
+                count += 1
+
+                if not updated:
+                    continue
+                if last_updated is None or updated > last_updated:
+                    last_updated = updated
+                    revisions_at_mark = {record_id: revision}
+                elif updated == last_updated:
+                    revisions_at_mark[record_id] = revision
+
+        return count, last_updated, revisions_at_mark
+
+    def _read_chunks(self, csv_file: str) -> Iterator[pd.DataFrame]:
+        """CSVを chunk_size 行ずつ読み込む (値はすべて文字列)"""
+        if not os.path.exists(csv_file) or os.path.getsize(csv_file) == 0:
+            return
+        # 読み込み後にファイルを置き換えるため、読み終えたら閉じる
+        with pd.read_csv(csv_file, dtype=str, keep_default_na=False, encoding="utf-8",
+                         chunksize=self.chunk_size) as reader:
+            yield from reader
+
+    @staticmethod
+    def _read_header(csv_file: str) -> List[str]:
+        """CSVの列名 (ファイルがない場合は空)"""
+        if not os.path.exists(csv_file) or os.path.getsize(csv_file) == 0:
+            return []
+        return list(pd.read_csv(csv_file, dtype=str, encoding="utf-8", nrows=0).columns)
+
+    def _group_keys(self, rows: pd.DataFrame) -> pd.Series:
+        """行ごとの (従業員名, 年月) (従業員名または日付がない行は None)"""
+        if rows.empty or self.employee_field not in rows or self.date_field not in rows:
+            return pd.Series([None] * len(rows), index=rows.index, dtype=object)
+        # チャンクごとに書式を推定すると結果が変わるため、値ごとに解釈する
+        months = pd.to_datetime(rows[self.date_field], errors="coerce", format="mixed").dt.strftime("%Y%m")
+        keys = [
+            (employee, month) if employee and isinstance(month, str) else None
+            for employee, month in zip(rows[self.employee_field], months)
+        ]
+        return pd.Series(keys, index=rows.index, dtype=object)
+
+    def _touched_keys(self, rows: pd.DataFrame) -> Set[Tuple[str, str]]:
+        """行に含まれる (従業員名, 年月) の組"""
+        return {key for key in self._group_keys(rows) if key is not None}
+
+    def merge_snapshot(self) -> Set[Tuple[str, str]]:
+        """
+        一時ファイルの更新されたレコードをスナップショットにマージ
+
+        スナップショットと更新されたレコードを chunk_size 行ずつ読み込み、
+        更新されたレコードの変更前の行を除いて新しいスナップショットに書き出す。
+
+        Returns:
+            set: 変更のあった (従業員名, 年月) の組
+                 (従業員や日付が変更されたレコードは変更前の組も含む)
+        """
+        change_header = self._read_header(self.changes_file)
+        if not change_header:
+            if os.path.exists(self.changes_file):
+                os.remove(self.changes_file)
+            return set()
+
+        # 同じレコードが複数回取得された場合は最後のものを使用する (レコードIDのみ保持する)
+        last_rows = {}
+        row_number = 0
+        for chunk in self._read_chunks(self.changes_file):
+            for record_id in chunk[RECORD_ID_FIELD]:
+                last_rows[record_id] = row_number
+                row_number += 1
+
+        header = list(dict.fromkeys(self._read_header(self.snapshot_file) + change_header))
+        touched = set()
+        temp_file = f"{self.snapshot_file}.tmp"
+        with open(temp_file, "w", encoding="utf-8", newline="") as f:
+            f.write(pd.DataFrame(columns=header).to_csv(index=False))
+
+            # 変更前の行を除いて書き出し、変更前の従業員・月を記録
+            for chunk in self._read_chunks(self.snapshot_file):
+                replaced = chunk[RECORD_ID_FIELD].isin(last_rows)
+                touched |= self._touched_keys(chunk[replaced])
+                chunk[~replaced].reindex(columns=header, fill_value="").to_csv(f, header=False, index=False)
+
+            row_number = 0
+            for chunk in self._read_chunks(self.changes_file):
+                positions = range(row_number, row_number + len(chunk))
+                row_number += len(chunk)
+                latest = [last_rows[record_id] == position for record_id, position in zip(chunk[RECORD_ID_FIELD], positions)]
+                chunk = chunk[latest]
+                touched |= self._touched_keys(chunk)
+                chunk.reindex(columns=header, fill_value="").to_csv(f, header=False, index=False)
+
+        os.replace(temp_file, self.snapshot_file)
+        os.remove(self.changes_file)
+        return touched
+
+    def _employee_csv_path(self, key: Tuple[str, str]) -> str:
+        """従業員・月の勤怠CSVのパス"""
+        employee, month = key
+        return os.path.join(self.csv_dir, f"勤怠詳細_{month}_{safe_filename(employee)}.csv")
+
+    def write_employee_csvs(self, keys: Set[Tuple[str, str]]) -> List[str]:
+        """
+        従業員・月ごとの勤怠CSV (勤怠詳細_YYYYMM_氏名.csv) をスナップショットから作成
+
+        スナップショットを chunk_size 行ずつ読み込んで対象の行を従業員・月ごとの一時ファイルに追記し、
+        最後に1ファイルずつ日付順に並べ替える (メモリに載せるのは1チャンクと1人・1か月分のみ)。
+
+        Returns:
+            list: 作成したCSVファイルのパス
+        """
+        os.makedirs(self.csv_dir, exist_ok=True)
+        for key in keys:
+            if os.path.exists(f"{self._employee_csv_path(key)}.tmp"):
+                os.remove(f"{self._employee_csv_path(key)}.tmp")
+
+        written = set()
+        for chunk in self._read_chunks(self.snapshot_file):
+            groups = self._group_keys(chunk)
+            targets = groups.map(lambda key: key in keys).astype(bool)
+            for key, rows in chunk[targets].groupby(groups[targets], sort=False):
+                temp_file = f"{self._employee_csv_path(key)}.tmp"
+                rows.to_csv(temp_file, mode="a", header=key not in written, index=False, encoding="utf-8")
+                written.add(key)
+
+        files = []
+        for key in sorted(keys):
+            csv_path = self._employee_csv_path(key)
+            if key not in written:
+                # レコードがすべて別の従業員・月に移動した場合
+                if os.path.exists(csv_path):
+                    os.remove(csv_path)
+                logger.info(f"対象のレコードがなくなりました: {key[0]} {key[1]}")
+                continue
+
+            temp_file = f"{csv_path}.tmp"
+            rows = pd.read_csv(temp_file, dtype=str, keep_default_na=False, encoding="utf-8")
+            rows.sort_values(self.date_field, kind="stable").to_csv(csv_path, index=False, encoding="utf-8")
+            os.remove(temp_file)
+            files.append(csv_path)
+
+        return files
+
+    def sync(self, template_path: str, output_dir: str, default_name: str,
+             max_workers: Optional[int] = None, csv_engine: str = "pandas") -> Dict[str, Any]:
+        """
+        差分同期を実行し、変更のあった従業員・月の勤怠表を再作成
+
+        Args:
+            template_path: テンプレートExcelファイルのパス
+            output_dir: 出力ディレクトリ
+            default_name: 従業員名を取得できない場合の従業員名
+            max_workers: 最大ワーカー数
+            csv_engine: CSV読み込みエンジン
+
+        Returns:
+            dict: 処理結果 (success, message, changed, touched, results)
+        """
+        state = self.load_state()
+        logger.info(f"kintone差分同期を開始します: {self.app_name} (前回: {state['last_updated'] or 'なし'})")
+
+        changed, last_updated, revisions_at_mark = self.fetch_changes(state)
+        touched = self.merge_snapshot()
+
+        # 前回Excelの作成に失敗したものも作り直す
+        touched |= {tuple(key) for key in state["pending"]}
+
+        # スナップショットに反映した時点でハイウォーターマークを進める
+        state["last_updated"], state["revisions_at_mark"] = last_updated, revisions_at_mark
+        state["pending"] = sorted(touched)
+        self._save_state(state)
+
+        files = self.write_employee_csvs(touched) if touched else []
+        results = run_batch(files, template_path, output_dir, default_name, max_workers, csv_engine) if files else []
+
+        # 作成に失敗したものは次回の同期で再作成する
+        failed = {os.path.abspath(r["file"]) for r in results if not r["success"]}
+        state["pending"] = sorted(key for key in touched if os.path.abspath(self._employee_csv_path(key)) in failed)
+        self._save_state(state)
+
+        message = f"{changed}件の更新を取得し、{len(files)}件の勤怠表を再作成しました"
+        if state["pending"]:
+            message += f" (失敗 {len(state['pending'])}件)"
+        logger.info(f"kintone差分同期が完了しました: {message}")
+
+        return {
+            "success": not state["pending"],
+            "message": message,
+            "changed": changed,
+            "touched": sorted(touched),
+            "results": results,
+        }
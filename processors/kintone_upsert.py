@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+kintone差分アップロード (upsert) モジュール
+
+キー (例: 社員番号 + 日付) ごとに前回送信したレコードの内容のハッシュを保存し、
+新しいレコードと内容が変わったレコードだけを送信する。
+同じデータを再送信した場合、書き込みのAPI呼び出しは発生しない。
+
+複合キーの場合は登録済みのレコードとキーで照合するため、日付・数値のキーの値は
+フィールドの種類に合わせて正規化してから比較する (CSVの "2025/1/5" と kintone の "2025-01-05" など)。
+"""
+import hashlib
+import json
+import os
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from processors.kintone_client import KintoneClient, KintoneAPIError
+from utils import safe_filename
+
+# 複合キーの区切り文字
+KEY_SEPARATOR = "\x1f"
+
+# 値をそのまま比較するキーのフィールドの種類
+TEXT_KEY_TYPES = {"SINGLE_LINE_TEXT", "LINK", "DROP_DOWN", "RADIO_BUTTON", "RECORD_NUMBER", "__ID__"}
+
+# 日付のキーとして読み込む書式
+DATE_FORMATS = ("%Y-%m-%d", "%Y/%m/%d", "%Y%m%d")
+
+
+class KeyFieldError(ValueError):
+    """キーのフィールドまたは値を照合に使用できない"""
+
+
+def normalize_date(value: str) -> str:
+    """日付の値を kintone の書式 (YYYY-MM-DD) に揃える"""
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), date_format).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    raise ValueError(f"日付として読み込めません: {value!r}")
+
+
+def normalize_number(value: str) -> str:
+    """数値の値を比較できる書式に揃える ("1.0" と "1"、"1,000" と "1000" を同じ値にする)"""
+    try:
+        number = Decimal(value.strip().replace(",", ""))
+    except InvalidOperation:
+        raise ValueError(f"数値として読み込めません: {value!r}") from None
+    if not number.is_finite():
+        raise ValueError(f"数値として読み込めません: {value!r}")
+    return format(number.normalize(), "f")
+
+
+def key_normalizer(field: str, properties: Dict[str, Any]) -> Callable[[str], str]:
+    """
+    フィールドの種類に合わせてキーの値を正規化する関数を取得
+
+    Args:
+        field: フィールドコード
+        properties: フォームのフィールド設定
+
+    Returns:
+        callable: 値を正規化する関数
+
+    Raises:
+        KeyFieldError: フィールドが存在しない場合、照合に使用できない種類の場合
+    """
+    if field not in properties:
+        raise KeyFieldError(f"キーのフィールドがアプリにありません: {field}")
+
+    field_type = properties[field].get("type")
+    if field_type == "CALC":
+        # 計算フィールドは表示形式で値の書式が決まる
+        calc_format = properties[field].get("format", "NUMBER")
+        field_type = {"NUMBER": "NUMBER", "NUMBER_DIGIT": "NUMBER", "DATE": "DATE"}.get(calc_format)
+        if field_type is None:
+            raise KeyFieldError(f"キーのフィールドの表示形式は照合に使用できません: {field} (CALC, {calc_format})")
+
+    if field_type in TEXT_KEY_TYPES:
+        return str
+    if field_type == "DATE":
+        return normalize_date
+    if field_type == "NUMBER":
+        return normalize_number
+    raise KeyFieldError(f"キーのフィールドの種類は照合に使用できません: {field} ({field_type})")
+
+
+def record_hash(record: Dict[str, Any]) -> str:
+    """レコードの内容のハッシュ"""
+    return hashlib.sha256(json.dumps(record, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class KintoneUpserter:
+    """キーで照合してレコードを追加・更新する"""
+
+    def __init__(self, client: KintoneClient, app_name: str, key_fields: List[str], store_dir: str):
+        """
+        初期化
+
+        キーが1フィールドの場合は、そのフィールドを updateKey として upsert で更新・追加する
+        (kintone側で「値の重複を禁止する」設定が必要)。
+        複数フィールドの場合は、送信済みのレコードIDを保存してIDで更新し、新しいキーは追加する。
+
+        Args:
+            client: kintoneクライアント
+            app_name: アプリ名
+            key_fields: レコードを照合するキーのフィールドコード
+            store_dir: 送信済みレコードのハッシュを保存するディレクトリ
+        """
+        if not key_fields:
+            raise ValueError("キーのフィールドを指定してください")
+
+        self.client = client
+        self.app_name = app_name
+        self.key_fields = list(key_fields)
+        self.store_file = os.path.join(store_dir, f"{safe_filename(app_name)}.json")
+        self._store = None
+        self._normalizers = None
+
+    @property
+    def use_update_key(self) -> bool:
+        """updateKey で更新するかどうか (キーが1フィールドの場合)"""
+        return len(self.key_fields) == 1
+
+    def _load_store(self) -> Dict[str, Dict[str, Any]]:
+        """送信済みレコードの情報を読み込む ({キー: {"id": レコードID, "hash": ハッシュ}})"""
+        if self._store is None:
+            self._store = {}
+            if os.path.exists(self.store_file):
+                with open(self.store_file, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                # キーのフィールドが変わった場合は使用しない
+                if data.get("key_fields") == self.key_fields:
+                    self._store = data.get("records", {})
+        return self._store
+
+    def _save_store(self):
+        """送信済みレコードの情報を保存 (一時ファイルに書き込んでから置き換える)"""
+        os.makedirs(os.path.dirname(self.store_file), exist_ok=True)
+        temp_file = f"{self.store_file}.tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump({"key_fields": self.key_fields, "records": self._store}, f, ensure_ascii=False)
+        os.replace(temp_file, self.store_file)
+
+    def _load_normalizers(self):
+        """
+        キーの値を正規化する関数をフォームのフィールド設定から取得 (複合キーの場合のみ)
+
+        Raises:
+            KeyFieldError: キーのフィールドを照合に使用できない場合
+            KintoneAPIError: フィールド設定の取得に失敗した場合
+        """
+        if self._normalizers is None:
+            if self.use_update_key:
+                # updateKey での照合は kintone 側で行うため、値はそのまま使用する
+                self._normalizers = [str]
+            else:
+                properties = self.client.get_form_fields(self.app_name)
+                self._normalizers = [key_normalizer(field, properties) for field in self.key_fields]
+
+    def record_key(self, record: Dict[str, Any]) -> Optional[str]:
+        """
+        レコードのキー (キーのフィールドが欠けている場合はNone)
+
+        Raises:
+            KeyFieldError: キーの値をフィールドの種類に合わせて読み込めない場合
+        """
+        self._load_normalizers()
+        values = []
+        for field, normalize in zip(self.key_fields, self._normalizers):
+            value = record.get(field, {}).get("value")
+            if value in (None, ""):
+                return None
+            try:
+                values.append(normalize(str(value)))
+            except ValueError as e:
+                raise KeyFieldError(f"キー {field} の値を照合できません: {str(e)}") from None
+        return KEY_SEPARATOR.join(values)
+
+    def _fetch_remote_ids(self) -> Dict[str, str]:
+        """kintoneに登録済みのレコードのキーとIDを取得 (キーのフィールドのみ取得)"""
+        remote = {}
+        for record in self.client.iter_records(self.app_name, fields=["$id", *self.key_fields]):
+            key = self.record_key(record)
+            if key:
+                remote[key] = record["$id"]["value"]
+        logger.info(f"登録済みのレコードを照合しました: {len(remote)}件")
+        return remote
+
+    def classify(self, records: Iterable[Dict[str, Any]]) -> Tuple[List[tuple], List[tuple], int, int]:
+        """
+        レコードを新規・変更・変更なしに分類
+
+        Returns:
+            tuple: (新規 [(キー, ハッシュ, レコード)], 変更 [(キー, ハッシュ, レコード)], 変更なしの件数, キーがない件数)
+        """
+        store = self._load_store()
+        pending = {}
+        unchanged = set()
+        missing_key = 0
+
+        for record in records:
+            key = self.record_key(record)
+            if key is None:
+                missing_key += 1
+                continue
+
+            # 同じキーが複数ある場合は後のものを使用
+            digest = record_hash(record)
+            entry = store.get(key)
+            if entry and entry.get("hash") == digest:
+                pending.pop(key, None)
+                unchanged.add(key)
+            else:
+                unchanged.discard(key)
+                pending[key] = (key, digest, record)
+        unchanged = len(unchanged)
+
+        if self.use_update_key:
+            # upsert で追加・更新するため、新規かどうかを判定する必要はない
+            return [], list(pending.values()), unchanged, missing_key
+
+        # 未送信のキーがある場合のみ、kintoneに登録済みかどうかを確認
+        unknown = [key for key in pending if not store.get(key, {}).get("id")]
+        if unknown:
+            remote = self._fetch_remote_ids()
+            for key in unknown:
+                if key in remote:
+                    store[key] = {"id": remote[key], "hash": None}
+
+        new, changed = [], []
+        for item in pending.values():
+            (changed if store.get(item[0], {}).get("id") else new).append(item)
+        return new, changed, unchanged, missing_key
+
+    def _update_payload(self, key: str, record: Dict[str, Any]) -> Dict[str, Any]:
+        """更新リクエストのレコード"""
+        if self.use_update_key:
+            field = self.key_fields[0]
+            body = {name: value for name, value in record.items() if name != field}
+            return {"updateKey": {"field": field, "value": record[field]["value"]}, "record": body}
+        return {"id": self._store[key]["id"], "record": record}
+
+    def upsert(self, records: Iterable[Dict[str, Any]], use_bulk: bool = False) -> Dict[str, Any]:
+        """
+        新しいレコードを追加し、内容が変わったレコードを更新
+
+        送信に成功したチャンクのレコードのみハッシュを保存するため、
+        失敗したレコードは次回の実行で再送信される。
+
+        Args:
+            records: kintoneレコード形式のレコード (リストまたはイテレータ)
+            use_bulk: bulkRequest.json で最大2,000件ずつ1トランザクションで送信するかどうか
+
+        Returns:
+            dict: 処理結果 (success, message, added, updated, unchanged, skipped, chunks, results)
+                  chunks は更新・追加のチャンクごとの結果 (operation に "更新" または "追加"、
+                  start はそれぞれの送信対象のレコードの中での位置)
+        """
+        # 照合のために全レコードを読み込んでから送信するため、読み込みに失敗した場合は何も送信しない
+        try:
+            new, changed, unchanged, skipped = self.classify(records)
+        except (KintoneAPIError, KeyFieldError) as e:
+            logger.error(f"登録済みレコードの照合に失敗しました: {str(e)}")
+            return {"success": False, "message": str(e), "added": 0, "updated": 0,
+                    "unchanged": 0, "skipped": 0, "chunks": [], "results": []}
+        except Exception as e:
+            logger.exception(f"レコードの読み込みに失敗しました: {str(e)}")
+            return {"success": False, "message": f"レコードの読み込みに失敗したため送信していません: {str(e)}",
+                    "added": 0, "updated": 0, "unchanged": 0, "skipped": 0, "chunks": [], "results": []}
+
+        if skipped:
+            logger.warning(f"キー ({', '.join(self.key_fields)}) が空のレコードを{skipped}件スキップしました")
+
+        results = []
+        chunks = []
+        added = updated = 0
+
+        if changed:
+            # キーが1フィールドの場合は upsert で送信 (kintoneにないレコードは追加される)
+            payloads = [self._update_payload(key, record) for key, _, record in changed]
+            result = self.client.update_records(self.app_name, payloads, use_bulk, upsert=self.use_update_key)
+            results.append(result)
+            chunks.extend({**chunk, "operation": "更新"} for chunk in result["chunks"])
+
+            responses = iter(result.get("data", {}).get("records", []))
+            for chunk in result["chunks"]:
+                if not chunk["success"]:
+                    continue
+                for key, digest, _ in changed[chunk["start"]:chunk["start"] + chunk["count"]]:
+                    response = next(responses, {})
+                    entry = self._store.setdefault(key, {})
+                    entry["id"] = response.get("id", entry.get("id"))
+                    entry["hash"] = digest
+                    if response.get("operation") == "INSERT":
+                        added += 1
+                    else:
+                        updated += 1
+
+        if new:
+            result = self.client.add_records(self.app_name, [record for _, _, record in new], use_bulk)
+            results.append(result)
+            chunks.extend({**chunk, "operation": "追加"} for chunk in result["chunks"])
+
+            ids = iter(result.get("data", {}).get("ids", []))
+            for chunk in result["chunks"]:
+                if not chunk["success"]:
+                    continue
+                for key, digest, _ in new[chunk["start"]:chunk["start"] + chunk["count"]]:
+                    self._store[key] = {"id": next(ids, None), "hash": digest}
+                    added += 1
+
+        if changed or new:
+            self._save_store()
+
+        success = all(r["success"] for r in results)
+        message = f"追加 {added}件, 更新 {updated}件, 変更なし {unchanged}件"
+        if skipped:
+            message += f", キーなし {skipped}件"
+        if not success:
+            failed = len(new) + len(changed) - added - updated
+            message += f", 失敗 {failed}件"
+
+        logger.info(f"kintone差分アップロード: {message}")
+        return {
+            "success": success,
+            "message": message,
+            "added": added,
+            "updated": updated,
+            "unchanged": unchanged,
+            "skipped": skipped,
+            "chunks": chunks,
+            "results": results,
+        }
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+処理済みファイルの台帳モジュール
+
+入力CSVの内容のハッシュ・テンプレートのハッシュ・従業員名の組ごとに作成した勤怠表を記録し、
+同じ内容のファイルの再保存やコピー、監視の再起動で勤怠表を作り直さないようにする。
+勤怠表のサイズと更新日時も記録し、別の入力で上書きされた勤怠表は作成済みとみなさない。
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from loguru import logger
+
+# 台帳のファイル名 (ログディレクトリに作成)
+LEDGER_FILENAME = "processed.sqlite3"
+
+# ハッシュ計算時に一度に読み込むバイト数
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# 台帳のキー (入力のハッシュ, テンプレートのハッシュ, 従業員名)
+LedgerKey = Tuple[str, str, str]
+
+# 作成した勤怠表を確認する列 (以前の台帳にはないため、開くときに追加する)
+OUTPUT_STAT_COLUMNS = ("output_size", "output_mtime_ns")
+
+
+def file_hash(file_path: str) -> str:
+    """
+    ファイルの内容のハッシュ (SHA-256)
+
+    Args:
+        file_path: ファイルパス
+
+    Returns:
+        str: 16進数のハッシュ
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ProcessingLedger:
+    """処理済みファイルの台帳 (SQLite)"""
+
+    def __init__(self, db_path: str):
+        """
+        初期化
+
+        Args:
+            db_path: 台帳のデータベースファイルのパス
+        """
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+
+        # 監視ではワーカープールのスレッドからも記録するため、ロックを取得して使用する
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS processed (
+                input_hash TEXT NOT NULL,
+                template_hash TEXT NOT NULL,
+                employee_name TEXT NOT NULL,
+                output_path TEXT NOT NULL,
+                input_path TEXT NOT NULL,
+                processed_at TEXT NOT NULL,
+                output_size INTEGER,
+                output_mtime_ns INTEGER,
+                PRIMARY KEY (input_hash, template_hash, employee_name)
+            )
+            """
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(processed)")}
+        for column in OUTPUT_STAT_COLUMNS:
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE processed ADD COLUMN {column} INTEGER")
+        self._conn.commit()
+
+        # テンプレートのハッシュ ({(パス, サイズ, 更新日時): ハッシュ})
+        self._template_hashes: Dict[Tuple[str, int, int], str] = {}
+
+    def close(self):
+        """データベースを閉じる"""
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _template_hash(self, template_path: str) -> str:
+        """テンプレートのハッシュ (サイズと更新日時が変わらない間は計算し直さない)"""
+        stat = os.stat(template_path)
+        key = (os.path.abspath(template_path), stat.st_size, stat.st_mtime_ns)
+        if key not in self._template_hashes:
+            self._template_hashes[key] = file_hash(template_path)
+        return self._template_hashes[key]
+
+    def key(self, csv_path: str, template_path: str, employee_name: str) -> LedgerKey:
+        """
+        台帳のキーを計算
+
+        Args:
+            csv_path: 入力CSVファイルのパス
+            template_path: テンプレートExcelファイルのパス
+            employee_name: 従業員名
+
+        Returns:
+            tuple: (入力のハッシュ, テンプレートのハッシュ, 従業員名)
+        """
+        return file_hash(csv_path), self._template_hash(template_path), employee_name
+
+    def lookup(self, key: LedgerKey, output_dir: str) -> Optional[str]:
+        """
+        同じ入力から作成済みの勤怠表を取得
+
+        勤怠表が削除された場合や、出力ディレクトリが異なる場合、
+        記録した後で勤怠表が変更された場合 (別の入力からの上書きなど) は作成済みとみなさない。
+
+        Args:
+            key: 台帳のキー
+            output_dir: 出力ディレクトリ
+
+        Returns:
+            str or None: 作成済みの勤怠表のパス
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT output_path, output_size, output_mtime_ns FROM processed "
+                "WHERE input_hash = ? AND template_hash = ? AND employee_name = ?",
+                key,
+            ).fetchone()
+
+        if row is None:
+            return None
+        output_path, size, mtime_ns = row
+        if os.path.dirname(os.path.abspath(output_path)) != os.path.abspath(output_dir):
+            return None
+
+        try:
+            stat = os.stat(output_path)
+        except OSError:
+            return None
+        if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+            logger.info(f"作成後に変更された勤怠表のため作り直します: {output_path}")
+            return None
+        return output_path
+
+    def check(self, csv_path: str, template_path: str, employee_name: str,
+              output_dir: str) -> Tuple[Optional[LedgerKey], Optional[str]]:
+        """
+        入力が処理済みかどうかを確認
+
+        Returns:
+            tuple: (台帳のキー, 作成済みの勤怠表のパス)
+                   ファイルを読み込めない場合はキーもNone (処理して結果のエラーに任せる)
+        """
+        try:
+            key = self.key(csv_path, template_path, employee_name)
+        except OSError as e:
+            logger.warning(f"ファイルのハッシュを計算できませんでした: {csv_path}: {str(e)}")
+            return None, None
+        return key, self.lookup(key, output_dir)
+
+    def record(self, key: LedgerKey, csv_path: str, output_path: str):
+        """
+        作成した勤怠表を記録
+
+        同じ勤怠表を作成した以前の記録 (別の入力から作成したもの) は削除する。
+
+        Args:
+            key: 台帳のキー
+            csv_path: 入力CSVファイルのパス
+            output_path: 作成した勤怠表のパス
+        """
+        output_path = os.path.abspath(output_path)
+        stat = os.stat(output_path)
+
+        with self._lock:
+            self._conn.execute("DELETE FROM processed WHERE output_path = ?", (output_path,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO processed (input_hash, template_hash, employee_name, output_path, "
+                "input_path, processed_at, output_size, output_mtime_ns) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (*key, output_path, os.path.abspath(csv_path), datetime.now().isoformat(),
+                 stat.st_size, stat.st_mtime_ns),
+            )
+            self._conn.commit()
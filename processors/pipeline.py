@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+変換パイプラインモジュール
+
+CSV読み込み → データ整形 → Excel書き込みを1ファイル単位で実行する。
+プロセスプールから呼び出せるよう、引数と戻り値はすべてpickle可能な値のみとする。
+"""
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+from processors.csv_processor import read_csv, read_year_month, process_data
+from processors.excel_processor import write_to_excel
+from processors.ledger import ProcessingLedger
+from processors.template_cache import get_template_cache
+from utils import extract_employee_name_from_filename
+
+
+def resolve_employee_name(csv_path: str, default_name: str) -> str:
+    """
+    CSVファイル名から従業員名を取得 (取得できない場合はデフォルト名)
+
+    Args:
+        csv_path: CSVファイルのパス
+        default_name: デフォルトの従業員名
+
+    Returns:
+        str: 従業員名
+    """
+    employee_name = extract_employee_name_from_filename(os.path.basename(csv_path))
+    return employee_name or default_name
+
+
+def output_path_for(output_dir: str, year_month: str, employee_name: str) -> str:
+    """
+    勤怠表の出力先
+
+    Args:
+        output_dir: 出力ディレクトリ
+        year_month: 対象年月 (YYYYMM)
+        employee_name: 従業員名
+
+    Returns:
+        str: 出力ファイルのパス
+    """
+    return os.path.join(output_dir, f"勤怠表_{year_month}_{employee_name}.xlsx")
+
+
+def plan_output(csv_path: str, output_dir: str, employee_name: str) -> Optional[str]:
+    """
+    CSVファイルの変換先を求める (日付カラムのみを読み込む)
+
+    Returns:
+        str or None: 出力ファイルのパス (求められない場合はNone、変換時のエラーとして報告する)
+    """
+    try:
+        return output_path_for(output_dir, read_year_month(csv_path), employee_name)
+    except Exception as e:
+        logger.warning(f"出力先を求められませんでした: {csv_path}: {str(e)}")
+        return None
+
+
+def convert_file(csv_path: str, template_path: str, output_dir: str, employee_name: str,
+                 csv_engine: str = "pandas") -> Dict[str, Any]:
+    """
+    CSVファイル1件をExcelの勤怠表に変換
+
+    Args:
+        csv_path: 処理するCSVファイルのパス
+        template_path: テンプレートExcelファイルのパス
+        output_dir: 出力ディレクトリ
+        employee_name: 出力ファイル名に使用する従業員名
+        csv_engine: CSV読み込みエンジン ("pandas" または "pyarrow")
+
+    Returns:
+        dict: 処理結果 (file, success, skipped, output, rows, elapsed, message)
+    """
+    start = time.perf_counter()
+    result = {
+        "file": csv_path,
+        "success": False,
+        "skipped": False,
+        "output": None,
+        "rows": 0,
+        "elapsed": 0.0,
+        "message": "",
+    }
+
+    try:
+        # CSVデータを読み込み
+        df = read_csv(csv_path, engine=csv_engine)
+        result["rows"] = len(df)
+
+        # CSVから月情報を取得
+        year_month = df["日付"].min().strftime("%Y%m")
+
+        # データの整形
+        df_processed = process_data(df)
+
+        # 出力ファイル名を作成
+        output_path = output_path_for(output_dir, year_month, employee_name)
+
+        # Excelに書き込み
+        write_to_excel(template_path, output_path, df_processed, csv_path)
+
+        result["success"] = True
+        result["output"] = output_path
+
+    except Exception as e:
+        logger.exception(f"ファイルの変換に失敗しました: {csv_path}: {str(e)}")
+        result["message"] = str(e)
+
+    finally:
+        result["elapsed"] = time.perf_counter() - start
+
+    return result
+
+
+def skipped_result(csv_path: str, output_path: str) -> Dict[str, Any]:
+    """
+    台帳により変換をスキップしたファイルの処理結果
+
+    Args:
+        csv_path: 入力CSVファイルのパス
+        output_path: 同じ内容の入力から作成済みの勤怠表のパス
+
+    Returns:
+        dict: 処理結果 (convert_file の戻り値と同じ形式)
+    """
+    return {
+        "file": csv_path,
+        "success": True,
+        "skipped": True,
+        "output": output_path,
+        "rows": 0,
+        "elapsed": 0.0,
+        "message": "変更がないためスキップしました",
+    }
+
+
+def failed_result(csv_path: str, message: str) -> Dict[str, Any]:
+    """
+    変換しなかった (またはワーカーが異常終了した) ファイルの処理結果
+
+    Args:
+        csv_path: 入力CSVファイルのパス
+        message: エラーメッセージ
+
+    Returns:
+        dict: 処理結果 (convert_file の戻り値と同じ形式)
+    """
+    return {
+        "file": csv_path,
+        "success": False,
+        "skipped": False,
+        "output": None,
+        "rows": 0,
+        "elapsed": 0.0,
+        "message": message,
+    }
+
+
+def find_output_conflicts(outputs: Dict[str, Optional[str]]) -> Dict[str, List[str]]:
+    """
+    同じ勤怠表に出力する入力を求める
+
+    同じ従業員・月のCSVが複数ある場合や、従業員名をファイル名から取得できずに
+    デフォルト名を使用した場合は、並列に変換すると同じファイルを書き合い結果が定まらない。
+
+    Args:
+        outputs: {入力CSVファイルのパス: 出力ファイルのパス (不明な場合はNone)}
+
+    Returns:
+        dict: {入力CSVファイルのパス: 同じ勤怠表に出力する入力のリスト (自身を含む、入力順)}
+    """
+    groups = defaultdict(list)
+    for csv_path, output_path in outputs.items():
+        if output_path:
+            groups[os.path.normcase(os.path.abspath(output_path))].append(csv_path)
+
+    return {csv_path: group for group in groups.values() if len(group) > 1 for csv_path in group}
+
+
+def _warm_up() -> int:
+    """ワーカープロセスの起動確認用 (モジュールの読み込みを済ませておく)"""
+    return os.getpid()
+
+
+def _init_worker(templates: List[str]):
+    """ワーカープロセスの初期化 (テンプレートを解析してプロセス共有のキャッシュに入れておく)"""
+    cache = get_template_cache()
+    cache.max_entries = max(cache.max_entries, len(templates))
+    for template_path in templates:
+        try:
+            cache.preload(template_path)
+        except Exception as e:
+            # 読み込めないテンプレートは変換時のエラーとして報告する
+            logger.warning(f"テンプレートを読み込めませんでした: {template_path}: {str(e)}")
+
+
+def create_worker_pool(max_workers: Optional[int] = None, templates: Optional[List[str]] = None) -> ProcessPoolExecutor:
+    """
+    変換処理用のプロセスプールを作成し、ワーカーを起動しておく
+
+    ワーカーはpandas/openpyxlなどを読み込んだ状態で待機するため、
+    ファイルごとのインタプリタ起動やモジュール読み込みが不要になる。
+
+    Args:
+        max_workers: 最大ワーカー数 (Noneの場合はCPU数)
+        templates: 各ワーカーで解析しておくテンプレートのパス (テンプレートキャッシュの上限もこの数以上にする)
+
+    Returns:
+        ProcessPoolExecutor: 起動済みのプロセスプール
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    if templates:
+        executor = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(list(templates),))
+    else:
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+
+    # ワーカーを事前に起動
+    warm_ups = [executor.submit(_warm_up) for _ in range(max_workers)]
+    for future in warm_ups:
+        future.result()
+
+    logger.info(f"変換ワーカーを起動しました: {max_workers}プロセス")
+    return executor
+
+
+def run_batch(
+    files: List[str],
+    template_path: str,
+    output_dir: str,
+    default_name: str,
+    max_workers: Optional[int] = None,
+    csv_engine: str = "pandas",
+    ledger: Optional[ProcessingLedger] = None,
+    force: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    複数のCSVファイルをプロセスプールで並列に変換
+
+    同じ勤怠表 (同じ従業員・月) に出力する入力が複数ある場合は、どれも変換せずに失敗として報告する
+    (台帳でスキップしたファイルを含む)。
+
+    Args:
+        files: 処理するCSVファイルのリスト
+        template_path: テンプレートExcelファイルのパス
+        output_dir: 出力ディレクトリ
+        default_name: ファイル名から従業員名を取得できない場合の従業員名
+        max_workers: 最大ワーカー数 (Noneの場合はCPU数)
+        csv_engine: CSV読み込みエンジン ("pandas" または "pyarrow")
+        ledger: 処理済みファイルの台帳 (指定した場合は同じ内容の入力から作成済みのものをスキップ)
+        force: 台帳に関わらずすべて変換するかどうか (変換結果は台帳に記録する)
+
+    Returns:
+        list: ファイルごとの処理結果 (入力順)
+    """
+    if not files:
+        return []
+
+    results = {}
+    keys = {}
+    targets = []
+    outputs = {}
+    for csv_path in files:
+        employee_name = resolve_employee_name(csv_path, default_name)
+        if ledger is None:
+            targets.append((csv_path, employee_name))
+            continue
+
+        key, output_path = ledger.check(csv_path, template_path, employee_name, output_dir)
+        if output_path and not force:
+            results[csv_path] = skipped_result(csv_path, output_path)
+            outputs[csv_path] = output_path
+            continue
+        keys[csv_path] = key
+        targets.append((csv_path, employee_name))
+
+    if len(targets) < len(files):
+        logger.info(f"変更のないファイルをスキップしました: {len(files) - len(targets)}件")
+    if not targets:
+        return [results[csv_path] for csv_path in files]
+
+    max_workers = max_workers or os.cpu_count() or 1
+    logger.info(f"一括変換を開始します: {len(targets)}件, ワーカー数: {max_workers}")
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # 出力先を求め、同じ勤怠表に出力する入力はどれも変換しない (書き込みが競合し結果が定まらないため)
+        paths = [csv_path for csv_path, _ in targets]
+        names = [employee_name for _, employee_name in targets]
+        outputs.update(zip(paths, executor.map(plan_output, paths, [output_dir] * len(paths), names)))
+        conflicts = find_output_conflicts(outputs)
+        for csv_path, group in conflicts.items():
+            message = (
+                f"同じ勤怠表 ({os.path.basename(outputs[csv_path])}) に出力する入力が複数あるため変換しませんでした: "
+                f"{', '.join(os.path.basename(path) for path in group)}"
+            )
+            logger.error(message)
+            results[csv_path] = failed_result(csv_path, message)
+
+        futures = {
+            executor.submit(
+                convert_file,
+                csv_path,
+                template_path,
+                output_dir,
+                employee_name,
+                csv_engine,
+            ): csv_path
+            for csv_path, employee_name in targets
+            if csv_path not in conflicts
+        }
+
+        for future in as_completed(futures):
+            csv_path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # ワーカープロセス自体の異常終了など
+                logger.exception(f"ワーカーでエラーが発生しました: {csv_path}: {str(e)}")
+                result = failed_result(csv_path, str(e))
+
+            results[csv_path] = result
+            status = "成功" if result["success"] else "失敗"
+            logger.info(f"{status}: {os.path.basename(csv_path)} ({result['elapsed']:.2f}秒)")
+
+            if result["success"] and keys.get(csv_path):
+                ledger.record(keys[csv_path], csv_path, result["output"])
+
+    succeeded = sum(1 for r in results.values() if r["success"] and not r["skipped"])
+    failed = sum(1 for r in results.values() if not r["success"])
+    logger.info(f"一括変換が完了しました: 成功 {succeeded}件, 失敗 {failed}件 (出力先の重複 {len(conflicts)}件)")
+
+    return [results[csv_path] for csv_path in files]
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+テンプレートExcelキャッシュモジュール
+
+テンプレートの解析 (openpyxl.load_workbook) は変換処理の中で最も重いため、
+解析済みのブックをプロセス内で保持して使い回す。
+書き込み後は「勤務表」シートのセル値を解析直後の状態に戻してから次の利用者に渡す。
+"""
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+import openpyxl
+from openpyxl.workbook.workbook import Workbook
+from loguru import logger
+
+# テンプレートの書き込み対象シート
+TEMPLATE_SHEET_NAME = "勤務表"
+
+
+class TemplateCache:
+    """解析済みテンプレートExcelのキャッシュ"""
+
+    def __init__(self, max_entries: int = 4, sheet_name: str = TEMPLATE_SHEET_NAME):
+        """
+        初期化
+
+        Args:
+            max_entries: 保持するテンプレートの最大数 (超えた場合は古いものから破棄)
+            sheet_name: 書き込み対象のシート名
+        """
+        self.max_entries = max_entries
+        self.sheet_name = sheet_name
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def _load_entry(self, path: str, stat: os.stat_result, data: bytes, digest: str) -> Dict[str, Any]:
+        """
+        テンプレートを解析してキャッシュエントリを作成
+
+        Raises:
+            ValueError: 書き込み対象のシートが存在しない場合
+        """
+        logger.info(f"テンプレートを読み込んでいます: {path}")
+        wb = openpyxl.load_workbook(io.BytesIO(data))
+
+        # 書き込み対象シートの存在確認
+        if self.sheet_name not in wb.sheetnames:
+            logger.error(f"テンプレートに「{self.sheet_name}」シートがありません")
+            raise ValueError(f"テンプレートに「{self.sheet_name}」シートがありません")
+
+        return {
+            "mtime": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "hash": digest,
+            "data": data,
+            "workbook": wb,
+            "snapshot": self._snapshot(wb[self.sheet_name]),
+            "in_use": False,
+        }
+
+    @staticmethod
+    def _snapshot(sheet) -> Dict[str, Any]:
+        """シートのセル値を記録"""
+        return {cell.coordinate: cell.value for row in sheet.iter_rows() for cell in row}
+
+    def _restore(self, entry: Dict[str, Any]):
+        """書き込み対象シートのセル値を解析直後の状態に戻す"""
+        snapshot = entry["snapshot"]
+        sheet = entry["workbook"][self.sheet_name]
+        for row in sheet.iter_rows():
+            for cell in row:
+                original = snapshot.get(cell.coordinate)
+                if cell.value != original:
+                    cell.value = original
+
+    def _get_entry(self, template_path: str) -> Dict[str, Any]:
+        """
+        テンプレートのキャッシュエントリを取得 (必要に応じて読み込み)
+
+        パス + 更新日時 + サイズが一致すればファイルを読まずにキャッシュを使用する。
+        更新日時が変わっていても内容のハッシュが同じであれば再解析しない。
+        """
+        path = os.path.abspath(template_path)
+        stat = os.stat(path)
+
+        entry = self._entries.get(path)
+        if entry and entry["mtime"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+            self._entries.move_to_end(path)
+            self.stats["hits"] += 1
+            return entry
+
+        with open(path, "rb") as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+
+        if entry and entry["hash"] == digest:
+            # 内容は同じなので更新日時のみ更新
+            entry["mtime"] = stat.st_mtime_ns
+            entry["size"] = stat.st_size
+            self._entries.move_to_end(path)
+            self.stats["hits"] += 1
+            return entry
+
+        self.stats["misses"] += 1
+        entry = self._load_entry(path, stat, data, digest)
+        self._entries[path] = entry
+        self._entries.move_to_end(path)
+
+        # 上限を超えた分を破棄
+        while len(self._entries) > self.max_entries:
+            evicted_path, _ = self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+            logger.debug(f"テンプレートキャッシュから破棄しました: {evicted_path}")
+
+        return entry
+
+    def preload(self, template_path: str):
+        """
+        テンプレートを解析してキャッシュしておく (最初の変換で解析を待たないようにする)
+
+        Args:
+            template_path: テンプレートExcelファイルのパス
+        """
+        with self._lock:
+            self._get_entry(template_path)
+
+    @contextmanager
+    def checkout(self, template_path: str) -> Iterator[Workbook]:
+        """
+        テンプレートのブックを借り受ける
+
+        withブロックの中では「勤務表」シートのセル値のみを変更すること。
+        ブロックを抜けるとセル値は元に戻される。
+        同じテンプレートが他のスレッドで使用中の場合は、キャッシュ済みのバイト列から
+        別のブックを作成して渡す (ディスクからは読み直さない)。
+
+        Args:
+            template_path: テンプレートExcelファイルのパス
+
+        Yields:
+            Workbook: テンプレートのブック
+        """
+        with self._lock:
+            entry = self._get_entry(template_path)
+            leased = not entry["in_use"]
+            if leased:
+                entry["in_use"] = True
+            data = entry["data"]
+
+        if not leased:
+            yield openpyxl.load_workbook(io.BytesIO(data))
+            return
+
+        try:
+            yield entry["workbook"]
+        finally:
+            with self._lock:
+                self._restore(entry)
+                entry["in_use"] = False
+
+    def clear(self):
+        """キャッシュを破棄"""
+        with self._lock:
+            self._entries.clear()
+
+
+# プロセス内で共有するキャッシュ
+_default_cache: Optional[TemplateCache] = None
+
+
+def get_template_cache() -> TemplateCache:
+    """プロセス内で共有するテンプレートキャッシュを取得"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = TemplateCache()
+    return _default_cache
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+kintone APIリクエストのスケジューラのテスト
+"""
+import json
+import threading
+
+from processors import kintone_budget
+from processors.kintone_budget import KintoneRequestScheduler
+
+
+def scheduler(state_dir) -> KintoneRequestScheduler:
+    return KintoneRequestScheduler(str(state_dir), "example.cybozu.com", rate=0)
+
+
+def send(scheduler: KintoneRequestScheduler, app_id: str, count: int):
+    for _ in range(count):
+        with scheduler.slot(app_id):
+            pass
+
+
+def test_concurrent_processes_do_not_lose_counts(tmp_path):
+    first, second = scheduler(tmp_path), scheduler(tmp_path)
+
+    # 2つのプロセスが交互に保存しても、互いの加算を上書きしない
+    send(first, "10", 3)
+    send(second, "10", 2)
+    first.flush()
+    second.flush()
+    send(first, "10", 1)
+    first.flush()
+
+    assert scheduler(tmp_path).usage()["apps"] == {"10": 6}
+    assert first.remaining("10") == kintone_budget.DEFAULT_DAILY_LIMIT - 6
+
+
+def test_usage_includes_legacy_state_file(tmp_path):
+    legacy = tmp_path / "kintone_budget_example.cybozu.com.json"
+    today = KintoneRequestScheduler._today()
+    legacy.write_text(json.dumps({"date": today, "apps": {"10": 4}}), encoding="utf-8")
+
+    budget = scheduler(tmp_path)
+    send(budget, "10", 1)
+
+    assert budget.usage()["apps"] == {"10": 5}
+
+
+def test_release_flushes_in_background_thread(tmp_path, monkeypatch):
+    monkeypatch.setattr(kintone_budget, "FLUSH_INTERVAL", 0)
+    budget = scheduler(tmp_path)
+    flushed = threading.Event()
+    threads = []
+
+    def flush():
+        threads.append(threading.current_thread())
+        flushed.set()
+
+    monkeypatch.setattr(budget, "flush", flush)
+    send(budget, "10", 1)
+
+    assert flushed.wait(5)
+    assert threads[0] is not threading.main_thread()
@@ -0,0 +1,389 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+kintoneクライアントのテスト
+
+KintoneClient (requests) と AsyncKintoneClient (httpx) が同じ処理の流れ
+(リトライ、アプリ一覧のページング、カーソルの読み込み、チャンクの書き込み) を
+実行することを、kintone APIのスタブで確認する。
+"""
+import asyncio
+import csv
+import json
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+from processors.kintone_async import AsyncKintoneClient
+from processors.kintone_client import APPS_PAGE_SIZE, KintoneAPIError, KintoneClient
+from processors.kintone_upsert import KintoneUpserter, KeyFieldError
+
+CURSOR_PATH = "/k/v1/records/cursor.json"
+
+# failures に指定すると、リクエストを処理した後で応答を返さない (読み込みタイムアウト)
+LOST_RESPONSE = "lost"
+
+
+class LostResponse(Exception):
+    """スタブがリクエストを処理した後、応答が届かなかった"""
+
+
+class FakeKintone:
+    """kintone APIのスタブ (アプリ一覧・カーソル・レコード追加)"""
+
+    def __init__(self, records: int = 250, other_apps: int = 0):
+        self.records = [
+            {"$id": {"type": "__ID__", "value": str(i)}, "名前": {"type": "SINGLE_LINE_TEXT", "value": f"n{i}"}}
+            for i in range(1, records + 1)
+        ]
+        # 名前で絞り込むと部分一致するアプリが先に並ぶ (完全一致するアプリは最後)
+        self.apps = [{"appId": str(100 + i), "name": f"勤怠アプリ{i}"} for i in range(other_apps)]
+        self.apps.append({"appId": "10", "name": "勤怠アプリ"})
+        self.fields = {"名前": {"type": "SINGLE_LINE_TEXT", "code": "名前"}}
+        self.cursors = {}
+        self.calls = []
+        # 次の呼び出しから順に返すエラー (HTTPステータス または LOST_RESPONSE)
+        self.failures = []
+        self.next_id = 1000
+
+    def count(self, method: str, path: str) -> int:
+        return sum(1 for call in self.calls if call == (method, path))
+
+    def handle(self, method: str, path: str, params: dict, body: dict):
+        self.calls.append((method, path))
+        failure = self.failures.pop(0) if self.failures else None
+        if failure is None:
+            return self.dispatch(method, path, params, body)
+        if failure == LOST_RESPONSE:
+            self.dispatch(method, path, params, body)
+            raise LostResponse()
+        return failure, {"code": "CB_UN01", "message": "一時的なエラー"}
+
+    def dispatch(self, method: str, path: str, params: dict, body: dict):
+        if path == "/k/v1/apps.json":
+            apps = [app for app in self.apps if params.get("name", "") in app["name"]]
+            offset, limit = int(params.get("offset", 0)), int(params.get("limit", APPS_PAGE_SIZE))
+            return 200, {"apps": apps[offset:offset + limit]}
+
+        if path == "/k/v1/app/form/fields.json":
+            return 200, {"properties": self.fields}
+
+        if path == CURSOR_PATH and method == "POST":
+            cursor_id = str(len(self.cursors) + 1)
+            self.cursors[cursor_id] = [0, body["size"]]
+            return 200, {"id": cursor_id, "totalCount": str(len(self.records))}
+
+        if path == CURSOR_PATH and method == "GET":
+            position, size = self.cursors[params["id"]]
+            self.cursors[params["id"]][0] += size
+            has_next = position + size < len(self.records)
+            if not has_next:
+                del self.cursors[params["id"]]
+            return 200, {"records": self.records[position:position + size], "next": has_next}
+
+        if path == CURSOR_PATH and method == "DELETE":
+            del self.cursors[body["id"]]
+            return 200, {}
+
+        if path == "/k/v1/records.json" and method == "POST":
+            ids = [str(self.next_id + i) for i in range(len(body["records"]))]
+            self.next_id += len(ids)
+            return 200, {"ids": ids, "revisions": ["1"] * len(ids)}
+
+        return 404, {"code": "GAIA_RE01", "message": f"not found: {path}"}
+
+
+class FakeAdapter(BaseAdapter):
+    """requests のセッションからスタブを呼び出すアダプター"""
+
+    def __init__(self, fake: FakeKintone):
+        super().__init__()
+        self.fake = fake
+
+    def send(self, request, **kwargs):
+        url = urlparse(request.url)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        body = json.loads(request.body) if request.body else None
+        try:
+            status, data = self.fake.handle(request.method, url.path, params, body)
+        except LostResponse:
+            raise requests.ReadTimeout("read timed out", request=request)
+
+        response = requests.Response()
+        response.status_code = status
+        response._content = json.dumps(data).encode("utf-8")
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def sync_client(fake: FakeKintone) -> KintoneClient:
+    client = KintoneClient("example.cybozu.com", api_token="token", backoff_factor=0)
+    client.session.mount("https://", FakeAdapter(fake))
+    return client
+
+
+def async_client(fake: FakeKintone) -> AsyncKintoneClient:
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content) if request.content else None
+        try:
+            status, data = fake.handle(request.method, request.url.path, dict(request.url.params), body)
+        except LostResponse:
+            raise httpx.ReadTimeout("read timed out", request=request)
+        return httpx.Response(status, json=data)
+
+    return AsyncKintoneClient("example.cybozu.com", api_token="token", backoff_factor=0,
+                              transport=httpx.MockTransport(handler))
+
+
+def test_get_app_id_paginates_and_caches():
+    fake = FakeKintone(other_apps=APPS_PAGE_SIZE + 20)
+    client = sync_client(fake)
+
+    assert client.get_app_id("勤怠アプリ") == "10"
+    assert client.get_app_id("勤怠アプリ") == "10"
+    assert fake.count("GET", "/k/v1/apps.json") == 2
+
+
+def test_async_get_app_id_paginates():
+    fake = FakeKintone(other_apps=APPS_PAGE_SIZE + 20)
+
+    async def run():
+        async with async_client(fake) as client:
+            return await client.get_app_id("勤怠アプリ")
+
+    assert asyncio.run(run()) == "10"
+    assert fake.count("GET", "/k/v1/apps.json") == 2
+
+
+def test_get_records_retries_temporary_errors():
+    fake = FakeKintone()
+    client = sync_client(fake)
+    client.get_app_id("勤怠アプリ")
+    fake.failures = [503, 429]
+
+    records = client.get_records("勤怠アプリ")
+
+    assert len(records) == 250
+    assert client.stats["retries"] == 2
+
+
+def test_add_records_does_not_retry_ambiguous_post_errors():
+    fake = FakeKintone()
+    client = sync_client(fake)
+    client.get_app_id("勤怠アプリ")
+    fake.failures = [500]
+
+    result = client.add_records("勤怠アプリ", [{"名前": {"value": str(i)}} for i in range(150)])
+
+    # 500を受け取ったチャンクは処理されたか分からないため再送しない (二重登録を避ける)
+    # (チャンクは並列に送信するため、どちらのチャンクが500を受け取るかは決まらない)
+    assert not result["success"]
+    assert fake.count("POST", "/k/v1/records.json") == 2
+    assert sorted(chunk["success"] for chunk in result["chunks"]) == [False, True]
+
+
+def test_iter_records_deletes_cursor_when_stopped_early():
+    fake = FakeKintone()
+    client = sync_client(fake)
+
+    records = client.iter_records("勤怠アプリ", page_size=100)
+    for _, _ in zip(range(150), records):
+        pass
+    records.close()
+
+    assert fake.cursors == {}
+    assert fake.count("DELETE", CURSOR_PATH) == 1
+
+
+def test_async_iter_records_deletes_cursor_when_stopped_early():
+    fake = FakeKintone()
+
+    async def run():
+        async with async_client(fake) as client:
+            records = client.iter_records("勤怠アプリ", page_size=100)
+            count = 0
+            async for _ in records:
+                count += 1
+                if count == 150:
+                    break
+            await records.aclose()
+
+    asyncio.run(run())
+
+    assert fake.cursors == {}
+    assert fake.count("DELETE", CURSOR_PATH) == 1
+
+
+def test_async_get_records_and_add_records():
+    fake = FakeKintone()
+
+    async def run():
+        async with async_client(fake) as client:
+            fake.failures = [503]
+            records = await client.get_records("勤怠アプリ")
+            result = await client.add_records("勤怠アプリ", [{"名前": {"value": str(i)}} for i in range(250)])
+            return records, result, client.stats
+
+    records, result, stats = asyncio.run(run())
+
+    assert len(records) == 250
+    assert stats["retries"] == 1
+    assert result["success"] and result["count"] == 250
+    assert [chunk["count"] for chunk in result["chunks"]] == [100, 100, 50]
+
+
+def test_save_as_csv_collects_fieldnames_from_all_records(tmp_path):
+    fake = FakeKintone(records=3)
+    fake.records[2]["備考"] = {"type": "MULTI_LINE_TEXT", "value": "最後だけ"}
+    sync_file, async_file = tmp_path / "sync.csv", tmp_path / "async.csv"
+
+    client = sync_client(fake)
+    assert client.save_as_csv(client.iter_records("勤怠アプリ"), str(sync_file))
+
+    async def run():
+        async with async_client(fake) as client:
+            return await client.save_as_csv(client.iter_records("勤怠アプリ"), str(async_file))
+
+    assert asyncio.run(run())
+
+    for output in (sync_file, async_file):
+        with open(output, encoding="utf-8", newline="") as f:
+            rows = list(csv.reader(f))
+        assert rows[0] == ["$id", "名前", "備考"]
+        assert rows[3] == ["3", "n3", "最後だけ"]
+
+
+def test_cursor_read_is_not_retried_after_lost_response():
+    fake = FakeKintone()
+    client = sync_client(fake)
+
+    records = client.iter_records("勤怠アプリ", page_size=100)
+    next(records)
+    # 2ページ目の応答が届かない (再送すると3ページ目が返り、2ページ目を取りこぼす)
+    fake.failures = [LOST_RESPONSE]
+    with pytest.raises(KintoneAPIError):
+        list(records)
+
+    assert fake.count("GET", CURSOR_PATH) == 2
+    assert fake.count("DELETE", CURSOR_PATH) == 1
+    assert fake.cursors == {}
+
+
+def test_async_cursor_read_is_not_retried_after_ambiguous_errors():
+    fake = FakeKintone()
+
+    async def read(failure):
+        async with async_client(fake) as client:
+            records = client.iter_records("勤怠アプリ", page_size=100)
+            received = [await records.__anext__()]
+            fake.failures = [failure]
+            try:
+                async for record in records:
+                    received.append(record)
+            finally:
+                await records.aclose()
+            return received
+
+    for failure in (LOST_RESPONSE, 500, 502, 504):
+        with pytest.raises(KintoneAPIError):
+            asyncio.run(read(failure))
+        assert fake.cursors == {}
+
+    # 処理されていないことが確実なエラーはリトライして全件を取得する
+    assert len(asyncio.run(read(503))) == 250
+
+
+def write_malformed_csv(path, rows: int):
+    """rows 行の後に列数が合わない行があるCSVを作成"""
+    lines = ["名前,備考"] + [f"n{i},備考{i}" for i in range(rows)] + ["n,備考,余分な列"]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def test_add_records_reports_committed_rows_when_csv_is_malformed(tmp_path):
+    fake = FakeKintone()
+    client = sync_client(fake)
+    csv_file = tmp_path / "push.csv"
+    write_malformed_csv(csv_file, 250)
+
+    result = client.add_records("勤怠アプリ", client.iter_csv_records(str(csv_file), chunk_size=100))
+
+    # 読み込めた2チャンク分は送信済みとして報告する (途中の行で例外を送出しない)
+    assert not result["success"]
+    assert result["count"] == 200 and result["committed"] == 200
+    assert [chunk["success"] for chunk in result["chunks"]] == [True, True]
+    assert fake.count("POST", "/k/v1/records.json") == 2
+
+
+def test_async_add_records_reports_committed_rows_when_input_fails():
+    fake = FakeKintone()
+
+    def records():
+        for i in range(150):
+            yield {"名前": {"value": str(i)}}
+        raise ValueError("壊れた行")
+
+    async def run():
+        async with async_client(fake) as client:
+            return await client.add_records("勤怠アプリ", records())
+
+    result = asyncio.run(run())
+
+    assert not result["success"]
+    assert result["committed"] == 100
+    assert "壊れた行" in result["message"]
+
+
+def test_upsert_sends_nothing_when_csv_is_malformed(tmp_path):
+    fake = FakeKintone()
+    client = sync_client(fake)
+    csv_file = tmp_path / "push.csv"
+    write_malformed_csv(csv_file, 250)
+
+    upserter = KintoneUpserter(client, "勤怠アプリ", ["名前"], str(tmp_path / "cache"))
+    result = upserter.upsert(client.iter_csv_records(str(csv_file), chunk_size=100))
+
+    assert not result["success"]
+    assert [call for call in fake.calls if call[1] == "/k/v1/records.json"] == []
+
+
+def test_upsert_matches_multi_key_by_field_type(tmp_path):
+    fake = FakeKintone(records=2)
+    fake.fields.update({
+        "日付": {"type": "DATE", "code": "日付"},
+        "時間": {"type": "CALC", "code": "時間", "format": "NUMBER"},
+    })
+    fake.records[0].update({"日付": {"type": "DATE", "value": "2025-01-05"}, "時間": {"type": "CALC", "value": "1"}})
+    fake.records[1].update({"日付": {"type": "DATE", "value": "2025-01-06"}, "時間": {"type": "CALC", "value": "1000"}})
+    client = sync_client(fake)
+    upserter = KintoneUpserter(client, "勤怠アプリ", ["名前", "日付", "時間"], str(tmp_path / "cache"))
+
+    # CSVの書式 ("2025/1/5"、"1.0"、"1,000") でも登録済みのレコードと照合する
+    new, changed, _, _ = upserter.classify([
+        {"名前": {"value": "n1"}, "日付": {"value": "2025/1/5"}, "時間": {"value": "1.0"}},
+        {"名前": {"value": "n2"}, "日付": {"value": "2025/01/06"}, "時間": {"value": "1,000"}},
+        {"名前": {"value": "n3"}, "日付": {"value": "2025/1/7"}, "時間": {"value": "1"}},
+    ])
+
+    assert [upserter._store[key]["id"] for key, _, _ in changed] == ["1", "2"]
+    assert [record["名前"]["value"] for _, _, record in new] == ["n3"]
+
+
+def test_upsert_rejects_unsupported_key_field_type(tmp_path):
+    fake = FakeKintone(records=1)
+    fake.fields["日時"] = {"type": "DATETIME", "code": "日時"}
+    client = sync_client(fake)
+    upserter = KintoneUpserter(client, "勤怠アプリ", ["名前", "日時"], str(tmp_path / "cache"))
+
+    with pytest.raises(KeyFieldError):
+        upserter.classify([{"名前": {"value": "n1"}, "日時": {"value": "2025-01-05T09:00:00Z"}}])
+
+    result = upserter.upsert([{"名前": {"value": "n1"}, "日時": {"value": "2025-01-05T09:00:00Z"}}])
+    assert not result["success"] and "DATETIME" in result["message"]
+    assert [call for call in fake.calls if call[1] == "/k/v1/records.json"] == []
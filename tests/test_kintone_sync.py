@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+kintone差分同期のテスト
+"""
+import pandas as pd
+
+from processors.kintone_sync import KintoneSync
+
+FIELDNAMES = ["$id", "$revision", "従業員名", "日付", "更新日時"]
+
+
+class FakeClient:
+    """更新日時のクエリに従ってレコードを返すkintoneクライアント"""
+
+    def __init__(self, records):
+        self.records = records
+
+    def get_record_fieldnames(self, app_name):
+        return FIELDNAMES
+
+    def iter_records(self, app_name, query=""):
+        since = query.split('"')[1] if '"' in query else ""
+        for record in sorted(self.records, key=lambda r: r["更新日時"]["value"]):
+            if record["更新日時"]["value"] >= since:
+                yield record
+
+
+def record(record_id: int, employee: str, date: str, updated: str, revision: str = "1"):
+    return {
+        "$id": {"value": str(record_id)}, "$revision": {"value": revision},
+        "従業員名": {"value": employee}, "日付": {"value": date}, "更新日時": {"value": updated},
+    }
+
+
+def test_delta_pull_rewrites_groups_records_moved_out_of(tmp_path):
+    records = [record(i, "山田" if i <= 5 else "佐藤", f"2025-01-{i:02d}", "2025-03-01T00:00:00Z") for i in range(1, 11)]
+    client = FakeClient(records)
+    syncer = KintoneSync(client, "勤怠アプリ", str(tmp_path))
+    # 数行ずつ読み込んで、チャンクをまたぐ場合も確認する
+    syncer.chunk_size = 3
+
+    state = syncer.load_state()
+    changed, _, _ = syncer.fetch_changes(state)
+    touched = syncer.merge_snapshot()
+    assert changed == 10
+    assert touched == {("山田", "202501"), ("佐藤", "202501")}
+    syncer.write_employee_csvs(touched)
+
+    # 山田のレコードを佐藤の2月に移動
+    state["last_updated"] = "2025-03-01T00:00:00Z"
+    state["revisions_at_mark"] = {str(i): "1" for i in range(1, 11)}
+    records[2] = record(3, "佐藤", "2025/2/3", "2025-03-02T00:00:00Z", revision="2")
+
+    changed, last_updated, _ = syncer.fetch_changes(state)
+    touched = syncer.merge_snapshot()
+    assert (changed, last_updated) == (1, "2025-03-02T00:00:00Z")
+    assert touched == {("山田", "202501"), ("佐藤", "202502")}
+
+    files = syncer.write_employee_csvs(touched)
+    yamada = pd.read_csv(tmp_path / "勤怠アプリ" / "csv" / "勤怠詳細_202501_山田.csv", dtype=str)
+    sato = pd.read_csv(tmp_path / "勤怠アプリ" / "csv" / "勤怠詳細_202502_佐藤.csv", dtype=str)
+    assert len(files) == 2
+    assert list(yamada["$id"]) == ["1", "2", "4", "5"]
+    assert list(sato["$id"]) == ["3"]
+
+    snapshot = pd.read_csv(tmp_path / "勤怠アプリ" / "snapshot.csv", dtype=str)
+    assert sorted(snapshot["$id"], key=int) == [str(i) for i in range(1, 11)]
+    assert not (tmp_path / "勤怠アプリ" / "changes.csv").exists()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+処理済みファイルの台帳のテスト
+"""
+import os
+import sqlite3
+
+from processors.ledger import ProcessingLedger
+
+
+def write(path, text: str):
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def test_lookup_ignores_output_overwritten_by_other_input(tmp_path):
+    template = write(tmp_path / "template.xlsx", "template")
+    v1 = write(tmp_path / "v1.csv", "日付\n2025/01/01\n")
+    v2 = write(tmp_path / "v2.csv", "日付\n2025/01/02\n")
+    output = tmp_path / "勤怠表_202501_A.xlsx"
+
+    with ProcessingLedger(str(tmp_path / "ledger.sqlite3")) as ledger:
+        key1, existing = ledger.check(v1, template, "A", str(tmp_path))
+        assert existing is None
+        write(output, "v1の勤怠表")
+        ledger.record(key1, v1, str(output))
+        assert ledger.lookup(key1, str(tmp_path)) == str(output)
+
+        # 編集したCSVで同じ勤怠表を上書き
+        key2, _ = ledger.check(v2, template, "A", str(tmp_path))
+        write(output, "v2の勤怠表 (内容が変わった)")
+        ledger.record(key2, v2, str(output))
+
+        # v1を再投入しても、勤怠表はv2の内容のためスキップしない
+        assert ledger.lookup(key1, str(tmp_path)) is None
+        assert ledger.lookup(key2, str(tmp_path)) == str(output)
+
+
+def test_lookup_ignores_output_modified_after_recording(tmp_path):
+    template = write(tmp_path / "template.xlsx", "template")
+    csv_file = write(tmp_path / "a.csv", "日付\n2025/01/01\n")
+    output = tmp_path / "勤怠表_202501_A.xlsx"
+
+    with ProcessingLedger(str(tmp_path / "ledger.sqlite3")) as ledger:
+        key, _ = ledger.check(csv_file, template, "A", str(tmp_path))
+        write(output, "作成した勤怠表")
+        ledger.record(key, csv_file, str(output))
+
+        write(output, "手作業で変更した勤怠表")
+        stat = os.stat(output)
+        os.utime(output, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+        assert ledger.lookup(key, str(tmp_path)) is None
+
+
+def test_opens_ledger_without_output_stat_columns(tmp_path):
+    db_path = str(tmp_path / "ledger.sqlite3")
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE processed (input_hash TEXT NOT NULL, template_hash TEXT NOT NULL, "
+        "employee_name TEXT NOT NULL, output_path TEXT NOT NULL, input_path TEXT NOT NULL, "
+        "processed_at TEXT NOT NULL, PRIMARY KEY (input_hash, template_hash, employee_name))"
+    )
+    output = write(tmp_path / "out.xlsx", "以前の勤怠表")
+    conn.execute("INSERT INTO processed VALUES ('h', 't', 'A', ?, 'a.csv', '2025-01-01')", (output,))
+    conn.commit()
+    conn.close()
+
+    # 以前の台帳の記録は確認できないため作り直す
+    with ProcessingLedger(db_path) as ledger:
+        assert ledger.lookup(("h", "t", "A"), str(tmp_path)) is None
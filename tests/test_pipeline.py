@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+一括変換パイプラインのテスト
+"""
+import openpyxl
+
+from processors.pipeline import find_output_conflicts, run_batch
+
+CSV_HEADER = "日付,始業時刻,終業時刻,総勤務時間,法定内残業,時間外労働,深夜労働,勤怠種別\n"
+
+
+def write_csv(path, month: str, start: str = "9:00") -> str:
+    rows = [f"{month}/{day:02d},{start},18:00,8:00,0:00,0:30,0:00,通常勤務\n" for day in range(1, 6)]
+    path.write_text(CSV_HEADER + "".join(rows), encoding="utf-8")
+    return str(path)
+
+
+def write_template(path) -> str:
+    wb = openpyxl.Workbook()
+    wb.active.title = "勤務表"
+    wb.save(path)
+    return str(path)
+
+
+def test_find_output_conflicts_groups_inputs_by_output():
+    outputs = {
+        "a.csv": "out/勤怠表_202501_A.xlsx",
+        "b.csv": "out/勤怠表_202501_B.xlsx",
+        "c.csv": "out/./勤怠表_202501_A.xlsx",
+        "d.csv": None,
+    }
+
+    assert find_output_conflicts(outputs) == {"a.csv": ["a.csv", "c.csv"], "c.csv": ["a.csv", "c.csv"]}
+
+
+def test_run_batch_does_not_convert_inputs_with_the_same_output(tmp_path):
+    template = write_template(tmp_path / "template.xlsx")
+    output_dir = tmp_path / "output"
+    files = [
+        write_csv(tmp_path / "勤怠詳細_202501_A.csv", "2025/01"),
+        # 同じ従業員・月のCSV (書式の異なるファイル名)
+        write_csv(tmp_path / "勤怠詳細_A_2025_01.csv", "2025/01", start="10:00"),
+        write_csv(tmp_path / "勤怠詳細_202501_B.csv", "2025/01"),
+        write_csv(tmp_path / "勤怠詳細_202502_A.csv", "2025/02"),
+    ]
+
+    results = run_batch(files, template, str(output_dir), "既定", max_workers=2)
+
+    assert [result["success"] for result in results] == [False, False, True, True]
+    for result in results[:2]:
+        assert "勤怠表_202501_A.xlsx" in result["message"]
+    assert not (output_dir / "勤怠表_202501_A.xlsx").exists()
+    assert (output_dir / "勤怠表_202501_B.xlsx").exists()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+CLIの起動時間のテスト
+
+info や check を速く起動できるよう、main の読み込み時や info の実行時に
+重い処理モジュール (pandas/openpyxl/pyarrow、kintone連携の requests/httpx) を
+読み込まないこと、info が1秒を大きく下回って終わることを確認する。
+"""
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# main の読み込み時に読み込まれてはいけないモジュール
+HEAVY_MODULES = [
+    "pandas", "openpyxl", "pyarrow",
+    "requests", "httpx", "processors.kintone_client", "processors.kintone_async",
+]
+
+# info の実行時間の上限 (秒)。通常は0.5秒程度で、遅いCI環境でも余裕を持たせる
+INFO_TIME_LIMIT = 3.0
+
+
+# サブプロセスが読み込まれた重いモジュールを出力する行の先頭
+LOADED_MARKER = "loaded:"
+
+# 読み込まれた重いモジュールをカンマ区切りで出力するコード
+PRINT_LOADED = f"print({LOADED_MARKER!r} + ','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n"
+
+
+def loaded_heavy_modules(stdout: str) -> str:
+    """サブプロセスが出力した、読み込まれた重いモジュール"""
+    lines = [line for line in stdout.splitlines() if line.startswith(LOADED_MARKER)]
+    assert lines, stdout
+    return lines[-1][len(LOADED_MARKER):]
+
+
+def test_import_main_defers_heavy_modules():
+    code = (
+        "import sys\n"
+        "import main\n"
+        + PRINT_LOADED
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, timeout=60
+    )
+
+    assert result.returncode == 0, result.stderr
+    loaded = loaded_heavy_modules(result.stdout)
+    assert loaded == "", f"main の読み込み時に読み込まれたモジュール: {loaded}"
+
+
+def test_info_command_is_fast_and_defers_heavy_modules():
+    code = (
+        "import runpy, sys\n"
+        "sys.argv = ['main.py', 'info']\n"
+        "try:\n"
+        "    runpy.run_path('main.py', run_name='__main__')\n"
+        "except SystemExit as e:\n"
+        "    assert not e.code, e.code\n"
+        + PRINT_LOADED
+    )
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, timeout=60
+    )
+    elapsed = time.perf_counter() - started
+
+    assert result.returncode == 0, result.stderr
+    loaded = loaded_heavy_modules(result.stdout)
+    assert loaded == "", f"info の実行時に読み込まれたモジュール: {loaded}"
+    assert elapsed < INFO_TIME_LIMIT, f"info の実行に{elapsed:.2f}秒かかりました"
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ファイル監視のイベントハンドラのテスト
+"""
+import threading
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+from watcher import FileHandler, WatchRoute
+
+
+class SlowLedger:
+    """ハッシュの計算に時間がかかる台帳 (release するまで check が終わらない)"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.threads = []
+
+    def check(self, csv_path, template_path, employee_name, output_dir):
+        self.threads.append(threading.current_thread().name)
+        self.release.wait(5)
+        return ("hash", "template", employee_name), None
+
+    def record(self, key, csv_path, output_path):
+        pass
+
+
+class RecordingExecutor:
+    """変換を実行せずに、投入されたファイルを記録するワーカープール"""
+
+    def __init__(self):
+        self.submitted = threading.Event()
+
+    def submit(self, func, file_path, *args):
+        future = Future()
+        future.set_result({"file": file_path, "success": True, "output": "out.xlsx", "elapsed": 0.0, "message": ""})
+        self.submitted.set()
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+
+def test_dispatch_does_not_check_ledger_on_queue_thread(tmp_path):
+    config = SimpleNamespace(MAX_WORKERS=1, TEMPLATE_PATH="template.xlsx", OUTPUT_DIR=str(tmp_path / "output"),
+                             EMPLOYEE_NAME="既定", CSV_ENGINE="c")
+    ledger, executor = SlowLedger(), RecordingExecutor()
+    handler = FileHandler([WatchRoute(str(tmp_path), ["*.csv"])], config=config, executor=executor, ledger=ledger)
+    try:
+        # 台帳の確認が終わらなくても、キューのスレッドはすぐに戻る
+        handler._dispatch(str(tmp_path / "勤怠詳細_202501_A.csv"), 0.0)
+        assert not executor.submitted.is_set()
+
+        ledger.release.set()
+        assert executor.submitted.wait(5)
+        assert ledger.threads[0].startswith("ledger-check")
+    finally:
+        ledger.release.set()
+        handler.close()
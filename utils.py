@@ -4,12 +4,16 @@
 汎用ユーティリティ関数
 """
 import os
+import io
 import glob
+import mmap
+import codecs
 import shutil
 import sys
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, Iterable, List, Optional, Sequence
 
 from loguru import logger
 from rich.console import Console
@@ -120,21 +124,151 @@ def safe_filename(filename: str) -> str:
     return filename
 
 
-def detect_csv_encoding(file_path: str, encodings=('utf-8', 'shift-jis', 'euc-jp', 'iso-2022-jp')) -> str:
-    """CSVファイルのエンコーディングを検出"""
-    for encoding in encodings:
+# エンコーディング判定に使用するサンプルサイズ (バイト)
+ENCODING_SAMPLE_SIZE = 64 * 1024
+
+# エンコーディング判定の候補
+CSV_ENCODINGS = ('utf-8', 'shift-jis', 'euc-jp', 'iso-2022-jp')
+
+# BOMとエンコーディングの対応
+_BOM_ENCODINGS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+# 入力元 (ディレクトリ) ごとに検出したエンコーディング
+_encoding_cache: Dict[str, str] = {}
+
+
+def _encoding_candidates(encodings: Sequence[str], source_key: Optional[str]) -> List[str]:
+    """
+    判定するエンコーディングの順序を決定
+
+    同じ入力元で前回検出したエンコーディングを優先する。
+    ただし誤判定が起きにくい utf-8 は常に先頭で判定する。
+    """
+    candidates = list(encodings)
+    cached = _encoding_cache.get(source_key) if source_key else None
+    if cached in candidates and cached != 'utf-8':
+        candidates.remove(cached)
+        position = 1 if candidates and candidates[0] == 'utf-8' else 0
+        candidates.insert(position, cached)
+    return candidates
+
+
+def detect_encoding_from_chunks(chunks: Iterable[bytes], encodings: Sequence[str] = CSV_ENCODINGS,
+                                source_key: Optional[str] = None, name: str = '') -> str:
+    """
+    バイト列のチャンクからエンコーディングを検出
+
+    BOMがあればBOMから判定し、なければ最初に非ASCII文字を含むチャンクだけを
+    各エンコーディングでデコードして判定する。先頭からASCII文字のみが続く間は
+    次のチャンクを読み進めるため、ファイル全体を確認するのはその場合に限られる。
+
+    Args:
+        chunks: バイト列のチャンク (先頭から順に)
+        encodings: 判定するエンコーディングの候補
+        source_key: 入力元のキー (前回の検出結果を優先するために使用)
+        name: ログ出力用のファイル名
+
+    Returns:
+        str: エンコーディング
+    """
+    chunks = iter(chunks)
+    sample = next(chunks, b'')
+
+    # BOMによる判定
+    for bom, encoding in _BOM_ENCODINGS:
+        if sample.startswith(bom):
+            return encoding
+
+    # ASCII文字のみのチャンクは判定材料にならないため読み飛ばす
+    next_chunk = next(chunks, None)
+    while sample.isascii() and b'\x1b' not in sample and next_chunk is not None:
+        sample, next_chunk = next_chunk, next(chunks, None)
+
+    if sample.isascii():
+        # エスケープシーケンスを含む場合はISO-2022-JP
+        if b'\x1b$' in sample and 'iso-2022-jp' in encodings:
+            encoding = 'iso-2022-jp'
+        else:
+            encoding = encodings[0]
+        if source_key:
+            _encoding_cache[source_key] = encoding
+        return encoding
+
+    # サンプルをデコードして判定 (チャンク末尾で途切れた文字は許容する)
+    is_last = next_chunk is None
+    for encoding in _encoding_candidates(encodings, source_key):
         try:
-            with open(file_path, 'r', encoding=encoding) as f:
-                f.read()
-                return encoding
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=is_last)
         except UnicodeDecodeError:
             continue
 
+        if source_key:
+            _encoding_cache[source_key] = encoding
+        return encoding
+
     # デフォルトのエンコーディングを返す
-    logger.warning(f"エンコーディングを検出できませんでした: {file_path}, デフォルトの utf-8 を使用します")
+    logger.warning(f"エンコーディングを検出できませんでした: {name}, デフォルトの utf-8 を使用します")
     return 'utf-8'
 
 
+def detect_csv_encoding(file_path: str, encodings=CSV_ENCODINGS) -> str:
+    """CSVファイルのエンコーディングを検出"""
+    source_key = os.path.dirname(os.path.abspath(file_path))
+
+    with open(file_path, 'rb') as f:
+        chunks = iter(lambda: f.read(ENCODING_SAMPLE_SIZE), b'')
+        return detect_encoding_from_chunks(chunks, encodings, source_key, name=file_path)
+
+
+# メモリマップで読み込むファイルサイズの閾値 (バイト)
+MMAP_THRESHOLD = 32 * 1024 * 1024
+
+
+@contextmanager
+def open_csv_buffer(file_path: str, encoding: Optional[str] = None, encodings=CSV_ENCODINGS,
+                    mmap_threshold: int = MMAP_THRESHOLD):
+    """
+    CSVファイルを一度だけ読み込み、読み込み済みのバッファとエンコーディングを返す
+
+    ファイルの内容はエンコーディングの判定とCSVの解析で共有するため、
+    ディスク (ネットワーク共有) からの読み込みは1回で済む。
+    大きなファイルはメモリマップで開き、必要な部分だけを読み込む。
+
+    Args:
+        file_path: CSVファイルのパス
+        encoding: エンコーディング (自動検出する場合はNone)
+        encodings: 自動検出するエンコーディングの候補
+        mmap_threshold: メモリマップを使用するファイルサイズ
+
+    Yields:
+        tuple: (pandas.read_csv などに渡せるバッファ, エンコーディング)
+    """
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        mapped = size >= mmap_threshold
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if mapped else f.read()
+
+    try:
+        if not encoding:
+            chunks = (data[i:i + ENCODING_SAMPLE_SIZE] for i in range(0, len(data), ENCODING_SAMPLE_SIZE))
+            source_key = os.path.dirname(os.path.abspath(file_path))
+            encoding = detect_encoding_from_chunks(chunks, encodings, source_key, name=file_path)
+
+        if mapped:
+            # メモリマップはデコードしながら読み進める
+            yield codecs.getreader(encoding)(data), encoding
+        else:
+            yield io.BytesIO(data), encoding
+
+    finally:
+        if mapped:
+            data.close()
+
+
 def format_time_str(seconds: float) -> str:
     """秒数を時間表記 (HH:MM) に変換"""
     hours = int(seconds // 3600)
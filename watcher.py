@@ -2,206 +2,922 @@
 # -*- coding: utf-8 -*-
 """
 ファイル監視処理モジュール
+
+監視スレッド (watchdog) ではイベントをキューに積むだけにし、
+ファイルの書き込み完了の確認はキューのスレッドで、台帳の確認 (ファイルのハッシュ) は確認用のスレッドで、
+変換はワーカープールで行う。
+起動時は前回の監視終了時のファイル一覧と比較し、停止中に追加・変更されたファイルだけを処理する。
+複数の部署の監視ディレクトリを振り分け表 (WatchRoute) で指定し、1つのプロセスで監視できる。
 """
+import hashlib
+import json
 import os
+import threading
 import time
-import subprocess
+from collections import deque
+from fnmatch import fnmatch
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
 from datetime import datetime, timedelta
-from typing import Optional, List, Dict
+from typing import Any, Callable, Optional, List, Dict, Iterable, Tuple
 
 import watchdog.events
 import watchdog.observers
+from watchdog.observers.api import DEFAULT_EMITTER_TIMEOUT, DEFAULT_OBSERVER_TIMEOUT, BaseObserver, EventEmitter
 from loguru import logger
 from rich.console import Console
 
-from config import init_config
-from utils import find_latest_file, extract_employee_name_from_filename
+from config import Config, init_config
+from processors.ledger import ProcessingLedger, LEDGER_FILENAME
+from processors.pipeline import convert_file, create_worker_pool
+from utils import find_latest_file, extract_employee_name_from_filename, safe_filename
 
 console = Console()
 
+# 最後のイベントからこの秒数イベントがなく、サイズ・更新日時が変わらなければ書き込み完了とみなす
+DEBOUNCE_SECONDS = 0.5
 
-class FileHandler(watchdog.events.PatternMatchingEventHandler):
-    """ファイル変更イベントハンドラ"""
+# 書き込みが終わらない場合でも処理を開始するまでの秒数
+READY_TIMEOUT = 10.0
 
-    def __init__(self, patterns=None, ignore_patterns=None, ignore_directories=True, case_sensitive=False, config=None):
-        super().__init__(patterns, ignore_patterns, ignore_directories, case_sensitive)
-        self.config = config or init_config()
-        self.processing_files = set()  # 処理中のファイル
+# 監視中にファイル一覧を保存する間隔 (秒)
+SNAPSHOT_SAVE_INTERVAL = 60
 
-    def on_created(self, event):
-        """ファイル作成イベント"""
-        if event.is_directory:
-            return
+# ポーリング監視で、すべてのファイルの更新日時を確認し直す周期 (秒)
+# (ファイルの上書きはディレクトリの更新日時を変えないため、ポーリングごとに一部のディレクトリを順に読み直す)
+FULL_SCAN_INTERVAL = 60
 
-        file_path = event.src_path
+# ポーリング監視で、作成・変更されたファイルを続けて確認する回数 (書き込み中の変更を検出する)
+HOT_FILE_POLLS = 3
 
-        # すでに処理中のファイルはスキップ
-        if file_path in self.processing_files:
-            return
 
-        # 一時ファイルは無視
-        if file_path.endswith('.tmp') or '~$' in file_path or file_path.startswith('.'):
-            return
+def is_temporary_file(file_path: str) -> bool:
+    """一時ファイル (Excelのロックファイルなど) かどうか"""
+    name = os.path.basename(file_path)
+    return name.endswith('.tmp') or name.startswith('~$') or name.startswith('.')
 
-        # ファイルが完全に書き込まれるまで少し待機
-        self._wait_for_file_ready(file_path)
 
-        # 処理中フラグを立てる
-        self.processing_files.add(file_path)
+@dataclass
+class WatchRoute:
+    """
+    監視ディレクトリの振り分け設定
 
-        try:
-            logger.info(f"新しいファイルを検出しました: {file_path}")
-            console.print(f"[bold green]新しいファイルを検出:[/] {os.path.basename(file_path)}")
+    directory 以下の patterns にマッチするファイルを、employee_name / template_path / output_dir で変換する。
+    省略した項目は設定値 (watch_patterns, employee_name, template_path, output_dir) を使用する。
+    employee_name はファイル名から従業員名を取得できない場合に使用する。
+    """
+    directory: str
+    patterns: List[str] = field(default_factory=list)
+    employee_name: Optional[str] = None
+    template_path: Optional[str] = None
+    output_dir: Optional[str] = None
+
+    def __post_init__(self):
+        self.directory = os.path.abspath(self.directory)
+
+    def matches(self, file_path: str) -> bool:
+        """ファイルがこの振り分けの対象かどうか"""
+        prefix = os.path.normcase(os.path.join(self.directory, ""))
+        if not os.path.normcase(os.path.abspath(file_path)).startswith(prefix):
+            return False
+        return any(fnmatch(os.path.basename(file_path), pattern) for pattern in self.patterns)
 
-            # 従業員名を取得
-            employee_name = extract_employee_name_from_filename(os.path.basename(file_path))
-            if not employee_name:
-                employee_name = self.config.EMPLOYEE_NAME
 
-            # テンプレートパス
-            template_path = self.config.TEMPLATE_PATH
+def load_routes(entries: Iterable[Dict[str, Any]], config: Config) -> List[WatchRoute]:
+    """
+    設定値 watch_routes から振り分け表を作成
 
-            # 処理を実行
-            self._process_file(file_path, template_path, employee_name)
+    Args:
+        entries: 振り分けの設定 ({"directory", "patterns", "employee_name", "template_path", "output_dir"})
+        config: 設定 (省略した項目の値)
 
-        except Exception as e:
-            logger.exception(f"ファイル処理エラー: {str(e)}")
-            console.print(f"[bold red]エラー:[/] {str(e)}")
+    Returns:
+        list: 振り分け表
 
-        finally:
-            # 処理中フラグを解除
-            self.processing_files.discard(file_path)
+    Raises:
+        ValueError: directory がない場合
+    """
+    routes = []
+    for index, entry in enumerate(entries, 1):
+        if not entry.get("directory"):
+            raise ValueError(f"watch_routes の{index}件目に directory がありません")
+        patterns = entry.get("patterns") or config.WATCH_PATTERNS
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        routes.append(WatchRoute(
+            directory=entry["directory"],
+            patterns=list(patterns),
+            employee_name=entry.get("employee_name") or config.EMPLOYEE_NAME,
+            template_path=entry.get("template_path") or str(config.TEMPLATE_PATH),
+            output_dir=entry.get("output_dir") or config.OUTPUT_DIR,
+        ))
+    return routes
+
+
+def watch_roots(routes: List[WatchRoute]) -> List[str]:
+    """
+    監視するディレクトリ (他のディレクトリの下にあるものは親の監視に含める)
 
-    def on_modified(self, event):
-        """ファイル変更イベント"""
-        # 作成イベントと重複するので何もしない
-        pass
+    Args:
+        routes: 振り分け表
 
-    def on_moved(self, event):
-        """ファイル移動イベント"""
-        if event.is_directory:
-            return
+    Returns:
+        list: 監視するディレクトリ
+    """
+    roots = []
+    for directory in sorted({route.directory for route in routes}, key=len):
+        if not any(os.path.normcase(directory).startswith(os.path.normcase(os.path.join(root, ""))) for root in roots):
+            roots.append(directory)
+    return roots
 
-        # 移動先がパターンにマッチするかチェック
-        for pattern in self.patterns:
-            if watchdog.events.match_path(pattern, event.dest_path):
-                # 移動先ファイルを処理
-                self.on_created(watchdog.events.FileCreatedEvent(event.dest_path))
-                break
 
-    def _wait_for_file_ready(self, file_path: str, timeout: int = 10, check_interval: float = 0.5):
+def scan_directory(directory: str) -> Dict[str, Tuple[int, int]]:
+    """
+    ディレクトリ以下のファイルのサイズと更新日時を取得 (一時ファイルを除く)
+
+    Args:
+        directory: ディレクトリ (絶対パス)
+
+    Returns:
+        dict: {ディレクトリからの相対パス: (サイズ, 更新日時 ns)}
+    """
+    entries = {}
+    prefix = len(os.path.join(directory, ""))
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                            continue
+                        if is_temporary_file(entry.name):
+                            continue
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries[entry.path[prefix:]] = (stat.st_size, stat.st_mtime_ns)
+        except OSError as e:
+            logger.warning(f"ディレクトリを読み込めませんでした: {current}: {str(e)}")
+    return entries
+
+
+class DirectorySnapshot:
+    """
+    監視ディレクトリのファイル一覧 (パス・サイズ・更新日時) の保存
+
+    処理したファイルを一覧に加えていき、監視の終了時に保存する。
+    次の起動時に現在のファイル一覧と比較し、停止中に追加・変更されたファイルを求める。
+    """
+
+    def __init__(self, directory: str, state_dir: str):
         """
-        ファイルが完全に書き込まれるまで待機
+        初期化
 
         Args:
-            file_path: ファイルパス
-            timeout: タイムアウト時間（秒）
-            check_interval: チェック間隔（秒）
+            directory: 監視するディレクトリ
+            state_dir: ファイル一覧を保存するディレクトリ
         """
-        start_time = time.time()
+        self.directory = os.path.abspath(directory)
+        digest = hashlib.sha1(self.directory.encode("utf-8")).hexdigest()[:8]
+        name = safe_filename(os.path.basename(self.directory))
+        self.state_file = os.path.join(state_dir, f"watch_{name}_{digest}.json")
 
-        while True:
-            # タイムアウトチェック
-            if time.time() - start_time > timeout:
-                logger.warning(f"ファイル待機タイムアウト: {file_path}")
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[int, int]] = {}
+        self._dirty = False
+
+    def _load(self) -> Optional[Dict[str, Tuple[int, int]]]:
+        """保存したファイル一覧を読み込む (ない場合はNone)"""
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"ファイル一覧を読み込めませんでした: {self.state_file}: {str(e)}")
+            return None
+        return {path: tuple(sig) for path, sig in data.get("files", {}).items()}
+
+    def save(self):
+        """ファイル一覧を保存 (変更がない場合は何もしない)"""
+        with self._lock:
+            if not self._dirty:
                 return
+            data = {"directory": self.directory, "files": dict(self._entries)}
+            self._dirty = False
+
+        os.makedirs(os.path.dirname(self.state_file) or ".", exist_ok=True)
+        temp_file = f"{self.state_file}.tmp"
+        try:
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(temp_file, self.state_file)
+        except OSError as e:
+            logger.warning(f"ファイル一覧を保存できませんでした: {self.state_file}: {str(e)}")
+
+    def catch_up(self, matches: Callable[[str], bool]) -> Optional[List[str]]:
+        """
+        前回の一覧と比較して、追加・変更されたファイルを求める
+
+        追加・変更されたファイルは処理が終わるまで一覧に含めないため、
+        処理の途中で停止した場合も次回の起動時にもう一度処理する。
+
+        Args:
+            matches: 処理するファイルかどうかを判定する関数 (引数はファイルのパス)
+
+        Returns:
+            list or None: 追加・変更されたファイルのパス (前回の一覧がない場合はNone)
+        """
+        previous = self._load()
+        current = scan_directory(self.directory)
+
+        changed = []
+        if previous is not None:
+            for path, signature in current.items():
+                if previous.get(path) != signature and matches(os.path.join(self.directory, path)):
+                    changed.append(path)
+            for path in changed:
+                del current[path]
+
+        with self._lock:
+            # 比較中に処理が終わったファイルはそちらを優先
+            current.update(self._entries)
+            self._entries = current
+            self._dirty = True
+        self.save()
+
+        if previous is None:
+            return None
+        return [os.path.join(self.directory, path) for path in sorted(changed)]
+
+    def update(self, file_path: str):
+        """処理したファイルを一覧に加える"""
+        path = os.path.relpath(os.path.abspath(file_path), self.directory)
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return
+        with self._lock:
+            self._entries[path] = (stat.st_size, stat.st_mtime_ns)
+            self._dirty = True
+
+
+class IncrementalPollingEmitter(EventEmitter):
+    """
+    ディレクトリの更新日時で変更を絞り込むポーリング
+
+    ディレクトリごとのファイル一覧をメモリに保持し、ポーリングごとにディレクトリだけを stat する。
+    更新日時が変わったディレクトリ (ファイルの追加・削除・リネームがあったもの) のみ読み直すため、
+    1回のポーリングの時間はファイル数ではなくディレクトリ数と変更の量で決まる。
+    ファイルの上書きはディレクトリの更新日時を変えないため、作成直後のファイルは
+    HOT_FILE_POLLS 回続けて確認する。既存のファイルの上書きは、ポーリングごとに一部のディレクトリを
+    順に読み直すことで FULL_SCAN_INTERVAL 以内に検出する。
+    """
+
+    def __init__(self, event_queue, watch, timeout: float = DEFAULT_EMITTER_TIMEOUT, **kwargs):
+        super().__init__(event_queue, watch, timeout=timeout, **kwargs)
+        self._dirs: Dict[str, int] = {}  # ディレクトリ → 更新日時
+        self._files: Dict[str, Dict[str, Tuple[int, int]]] = {}  # ディレクトリ → {ファイル: (サイズ, 更新日時)}
+        self._hot: Dict[str, int] = {}  # 続けて確認するファイル → 残りの回数
+        self._full_scan_polls = max(1, int(FULL_SCAN_INTERVAL / max(timeout, 0.1)))
+        self._sweep: List[str] = []  # 順に読み直す残りのディレクトリ
+        self.stats = {"polls": 0, "dir_scans": 0, "last_poll": 0.0}
+
+    def on_thread_start(self):
+        self._scan_tree(self.watch.path, emit=False)
+
+    @staticmethod
+    def _read_dir(path: str) -> Tuple[int, Dict[str, Tuple[int, int]], List[str]]:
+        """ディレクトリの更新日時、ファイル一覧、サブディレクトリを読み込む"""
+        mtime = os.stat(path).st_mtime_ns
+        files, subdirs = {}, []
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    else:
+                        stat = entry.stat()
+                        files[entry.path] = (stat.st_size, stat.st_mtime_ns)
+                except OSError:
+                    continue
+        return mtime, files, subdirs
+
+    def _scan_tree(self, path: str, emit: bool):
+        """ディレクトリ以下を読み込んで一覧に加える (emit の場合は作成イベントを送る)"""
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            try:
+                mtime, files, subdirs = self._read_dir(current)
+            except OSError:
+                continue
+            self.stats["dir_scans"] += 1
+            self._dirs[current] = mtime
+            self._files[current] = files
+            if emit:
+                self.queue_event(watchdog.events.DirCreatedEvent(current))
+                for file_path in files:
+                    self.queue_event(watchdog.events.FileCreatedEvent(file_path))
+                    self._hot[file_path] = HOT_FILE_POLLS
+            if self.watch.is_recursive:
+                stack.extend(subdirs)
+
+    def _remove_tree(self, path: str):
+        """削除されたディレクトリ以下を一覧から除き、削除イベントを送る"""
+        prefix = os.path.join(path, "")
+        for directory in [d for d in self._dirs if d == path or d.startswith(prefix)]:
+            for file_path in self._files.pop(directory, {}):
+                self._hot.pop(file_path, None)
+                self.queue_event(watchdog.events.FileDeletedEvent(file_path))
+            del self._dirs[directory]
+            self.queue_event(watchdog.events.DirDeletedEvent(directory))
+
+    def _rescan_dir(self, path: str):
+        """更新日時が変わったディレクトリを読み直し、前回との差分のイベントを送る"""
+        try:
+            mtime, files, subdirs = self._read_dir(path)
+        except FileNotFoundError:
+            self._remove_tree(path)
+            return
+        except OSError:
+            return
+        self.stats["dir_scans"] += 1
+
+        previous = self._files.get(path, {})
+        for file_path in previous.keys() - files.keys():
+            self._hot.pop(file_path, None)
+            self.queue_event(watchdog.events.FileDeletedEvent(file_path))
+        for file_path, signature in files.items():
+            if file_path not in previous:
+                self.queue_event(watchdog.events.FileCreatedEvent(file_path))
+                self._hot[file_path] = HOT_FILE_POLLS
+            elif previous[file_path] != signature:
+                self.queue_event(watchdog.events.FileModifiedEvent(file_path))
+                self._hot[file_path] = HOT_FILE_POLLS
+
+        self._dirs[path] = mtime
+        self._files[path] = files
+
+        if self.watch.is_recursive:
+            prefix = os.path.join(path, "")
+            known = {d for d in self._dirs if d.startswith(prefix) and os.path.dirname(d) == path}
+            for subdir in set(subdirs) - known:
+                self._scan_tree(subdir, emit=True)
+            for subdir in known - set(subdirs):
+                self._remove_tree(subdir)
+
+    def _check_hot_files(self):
+        """作成・変更されたばかりのファイルを確認 (書き込み中の変更を検出する)"""
+        for file_path, remaining in list(self._hot.items()):
+            directory = os.path.dirname(file_path)
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                self._hot.pop(file_path, None)
+                continue
+
+            signature = (stat.st_size, stat.st_mtime_ns)
+            files = self._files.get(directory)
+            if files is not None and files.get(file_path) != signature:
+                files[file_path] = signature
+                self.queue_event(watchdog.events.FileModifiedEvent(file_path))
+                self._hot[file_path] = HOT_FILE_POLLS
+            elif remaining <= 1:
+                del self._hot[file_path]
+            else:
+                self._hot[file_path] = remaining - 1
+
+    def queue_events(self, timeout: float):
+        # ポーリングの間隔だけ待機
+        if self.stopped_event.wait(timeout):
+            return
+        if not self.should_keep_running():
+            return
+
+        started = time.perf_counter()
 
+        if not os.path.isdir(self.watch.path):
+            self.queue_event(watchdog.events.DirDeletedEvent(self.watch.path))
+            self.stop()
+            return
+
+        # 上書きの検出のため、FULL_SCAN_INTERVAL で一巡するように今回読み直すディレクトリ
+        if not self._sweep:
+            self._sweep = sorted(self._dirs)
+        count = -(-len(self._dirs) // self._full_scan_polls)
+        sweep = set(self._sweep[:count])
+        del self._sweep[:count]
+
+        for directory in list(self._dirs):
+            if directory not in self._dirs:
+                # 親ディレクトリの削除で一覧から除かれた
+                continue
             try:
-                # ファイルサイズが変化しているかチェック
-                current_size = os.path.getsize(file_path)
-                time.sleep(check_interval)
-                new_size = os.path.getsize(file_path)
+                mtime = os.stat(directory).st_mtime_ns
+            except FileNotFoundError:
+                self._remove_tree(directory)
+                continue
+            except OSError:
+                continue
+            if directory in sweep or mtime != self._dirs[directory]:
+                self._rescan_dir(directory)
 
-                # ファイルサイズが安定していれば完了
-                if current_size == new_size:
-                    return
+        self._check_hot_files()
+
+        self.stats["polls"] += 1
+        self.stats["last_poll"] = time.perf_counter() - started
+
+
+class IncrementalPollingObserver(BaseObserver):
+    """IncrementalPollingEmitter を使用するオブザーバー (timeout がポーリングの間隔)"""
 
-            except (FileNotFoundError, PermissionError):
-                # ファイルがまだ存在しない、またはアクセスできない場合は待機
-                time.sleep(check_interval)
+    def __init__(self, timeout: float = DEFAULT_OBSERVER_TIMEOUT):
+        super().__init__(IncrementalPollingEmitter, timeout=timeout)
+
+
+def create_observer(mode: str = "native", interval: float = DEFAULT_OBSERVER_TIMEOUT) -> BaseObserver:
+    """
+    オブザーバーを作成
+
+    Args:
+        mode: "native" (OSのファイル変更通知) または "polling" (ネットワークドライブ向けのポーリング)
+        interval: ポーリングの間隔 (秒)
+
+    Returns:
+        BaseObserver: オブザーバー
+    """
+    if mode == "polling":
+        logger.info(f"ポーリングで監視します (間隔: {interval}秒)")
+        return IncrementalPollingObserver(timeout=interval)
+    if mode != "native":
+        logger.warning(f"不明な監視方式のためOSの変更通知を使用します: {mode}")
+    return watchdog.observers.Observer()
+
+
+class DebouncedFileQueue:
+    """
+    ファイルのイベントをパスごとにまとめ、書き込みが終わったファイルを順に処理に回すキュー
 
-    def _process_file(self, file_path: str, template_path: str, employee_name: str):
+    イベントを受けたパスは、イベントが DEBOUNCE_SECONDS 途切れた後にサイズと更新日時を確認し、
+    前回の確認から変わっていなければ dispatch を呼び出す。
+    処理中 (dispatch してから done が呼ばれるまで) のファイルは max_in_flight 件までとし、
+    残りは待たせる。処理中に変更されたファイルは処理の完了後にもう一度キューに入れる。
+    """
+
+    def __init__(self, dispatch: Callable[[str, float], None], max_in_flight: int,
+                 debounce: float = DEBOUNCE_SECONDS, timeout: float = READY_TIMEOUT):
         """
-        ファイルを処理
+        初期化
 
         Args:
-            file_path: 処理するファイルパス
-            template_path: テンプレートパス
-            employee_name: 従業員名
+            dispatch: 書き込みが終わったファイルを処理に回す関数 (パス, 検出時刻 time.time())
+            max_in_flight: 同時に処理するファイル数の上限
+            debounce: イベントが途切れてから確認するまでの秒数、および確認の間隔
+            timeout: 書き込みが終わらない場合でも処理を開始するまでの秒数
+        """
+        self._dispatch = dispatch
+        self.max_in_flight = max(1, max_in_flight)
+        self.debounce = debounce
+        self.timeout = timeout
+
+        self._cond = threading.Condition()
+        self._pending = {}  # パス → 状態 (検出時刻、最後のイベント、前回のサイズ・更新日時)
+        self._ready = deque()  # 書き込みが終わり、処理を待っているファイル (パス, 検出時刻)
+        self._in_flight = set()  # 処理中のファイル
+        self._changed = {}  # 処理中に変更されたファイル → 検出時刻
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="file-event-queue", daemon=True)
+
+    def start(self):
+        """キューのスレッドを開始"""
+        self._thread.start()
+
+    def stop(self):
+        """キューのスレッドを停止 (書き込み待ちのファイルは処理しない)"""
+        with self._cond:
+            self._stopped = True
+            waiting = len(self._pending) + len(self._ready)
+            self._cond.notify_all()
+        self._thread.join()
+        if waiting:
+            logger.warning(f"処理されずに残ったファイルがあります: {waiting}件")
+
+    def push(self, file_path: str) -> bool:
         """
-        # 実行スクリプトのパスを取得
-        script_path = Path(__file__).resolve().parent / "main.py"
-
-        # コマンドの構築
-        command = [
-            "python",
-            str(script_path),
-            "run",
-            "--file", file_path,
-            "--template", template_path,
-            "--name", employee_name
+        ファイルのイベントを追加
+
+        Returns:
+            bool: 新しく検出したファイルかどうか (書き込み待ち・処理中のファイルの場合はFalse)
+        """
+        now = time.monotonic()
+        with self._cond:
+            if file_path in self._in_flight:
+                self._changed.setdefault(file_path, time.time())
+                return False
+
+            entry = self._pending.get(file_path)
+            if entry:
+                entry["last_event"] = now
+                return False
+            if any(path == file_path for path, _ in self._ready):
+                return False
+
+            self._pending[file_path] = {"detected": time.time(), "first_event": now, "last_event": now, "stat": None}
+            self._cond.notify_all()
+            return True
+
+    def discard(self, file_path: str):
+        """書き込み待ちのファイルを取り除く (移動・削除された場合)"""
+        with self._cond:
+            self._pending.pop(file_path, None)
+
+    def done(self, file_path: str):
+        """ファイルの処理が完了した (処理中に変更されていればもう一度キューに入れる)"""
+        now = time.monotonic()
+        with self._cond:
+            self._in_flight.discard(file_path)
+            detected = self._changed.pop(file_path, None)
+            if detected is not None:
+                self._pending[file_path] = {"detected": detected, "first_event": now, "last_event": now, "stat": None}
+            self._cond.notify_all()
+
+    @property
+    def size(self) -> int:
+        """書き込み待ち・処理待ち・処理中のファイル数"""
+        with self._cond:
+            return len(self._pending) + len(self._ready) + len(self._in_flight)
+
+    def _due(self, now: float) -> List[str]:
+        """サイズ・更新日時を確認する時期になったファイル"""
+        return [
+            path for path, entry in self._pending.items()
+            if now - max(entry["last_event"], entry.get("checked", 0.0)) >= self.debounce
         ]
 
-        # サブプロセスとして実行
-        logger.info(f"処理コマンド: {' '.join(command)}")
+    def _next_wait(self, now: float) -> Optional[float]:
+        """次にファイルを確認するまでの秒数 (確認するファイルがない場合はNone)"""
+        if not self._pending:
+            return None
+        soonest = min(max(e["last_event"], e.get("checked", 0.0)) for e in self._pending.values())
+        return max(0.0, soonest + self.debounce - now)
 
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    now = time.monotonic()
+                    due = self._due(now)
+                    if due or (self._ready and len(self._in_flight) < self.max_in_flight):
+                        break
+                    self._cond.wait(self._next_wait(now))
+                if self._stopped:
+                    return
+
+            # ネットワークドライブでは stat に時間がかかるため、ロックの外で確認する
+            stats = {path: self._stat(path) for path in due}
+
+            with self._cond:
+                now = time.monotonic()
+                for path, stat in stats.items():
+                    self._check(path, stat, now)
+
+                dispatch = []
+                while self._ready and len(self._in_flight) < self.max_in_flight:
+                    path, detected = self._ready.popleft()
+                    self._in_flight.add(path)
+                    dispatch.append((path, detected))
+
+            for path, detected in dispatch:
+                try:
+                    self._dispatch(path, detected)
+                except Exception as e:
+                    logger.exception(f"ファイルを処理に回せませんでした: {path}: {str(e)}")
+                    self.done(path)
+
+    @staticmethod
+    def _stat(file_path: str) -> Optional[Any]:
+        """サイズと更新日時 (ファイルがない場合はNone、アクセスできない場合は空)"""
         try:
-            result = subprocess.run(command, check=True, capture_output=True, text=True)
-            logger.info(f"処理完了: {result.stdout}")
-            console.print(f"[bold green]処理完了:[/] {os.path.basename(file_path)}")
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return None
+        except OSError:
+            return ()
+        return (stat.st_size, stat.st_mtime_ns)
+
+    def _check(self, path: str, stat: Optional[Any], now: float):
+        """確認したサイズ・更新日時から書き込みが終わったかどうかを判定 (ロックを取得して呼び出す)"""
+        entry = self._pending.get(path)
+        if entry is None:
+            return
+        if now - entry["last_event"] < self.debounce:
+            # 確認中に新しいイベントがあった
+            return
+
+        if stat is None:
+            # 一時ファイルの削除やリネームなど
+            del self._pending[path]
+            return
 
-            # 標準出力からファイルパスを抽出
-            output_file = self._extract_output_path(result.stdout)
-            if output_file and os.path.exists(output_file):
-                console.print(f"[bold]出力ファイル:[/] {os.path.basename(output_file)}")
+        if stat and stat == entry["stat"]:
+            del self._pending[path]
+            self._ready.append((path, entry["detected"]))
+        elif now - entry["first_event"] >= self.timeout:
+            logger.warning(f"ファイル待機タイムアウト: {path}")
+            del self._pending[path]
+            self._ready.append((path, entry["detected"]))
+        else:
+            entry["stat"] = stat
+            entry["checked"] = now
 
-            return True
 
-        except subprocess.CalledProcessError as e:
-            logger.error(f"処理エラー: {e.stderr}")
-            console.print(f"[bold red]処理エラー:[/] {e.stderr}")
-            return False
+class FileHandler(watchdog.events.PatternMatchingEventHandler):
+    """
+    ファイル変更イベントハンドラ
 
-    def _extract_output_path(self, output: str) -> Optional[str]:
+    すべての監視ディレクトリのイベントを1つのキューとワーカープールで処理し、
+    ファイルごとに振り分け表から変換の設定を選ぶ。
+    """
+
+    def __init__(self, routes: List[WatchRoute], ignore_patterns=None, ignore_directories=True, case_sensitive=False,
+                 config=None, executor: Optional[Executor] = None, max_in_flight: Optional[int] = None,
+                 ledger: Optional[ProcessingLedger] = None, force: bool = False,
+                 snapshots: Optional[List[DirectorySnapshot]] = None):
+        # 下の階層のディレクトリの振り分けを先に確認する (同じ階層は指定順)
+        self.routes = sorted(routes, key=lambda route: -len(route.directory))
+        patterns = list(dict.fromkeys(pattern for route in routes for pattern in route.patterns))
+        super().__init__(
+            patterns=patterns,
+            ignore_patterns=ignore_patterns,
+            ignore_directories=ignore_directories,
+            case_sensitive=case_sensitive,
+        )
+        self._config = config  # 指定がなければイベントごとに最新の設定を参照
+
+        # 処理済みファイルの台帳 (同じ内容のファイルは変換しない、force の場合は記録のみ)
+        # CSVとテンプレートのハッシュの計算に時間がかかるため、台帳の確認はキューのスレッドとは別のスレッドで行う
+        self.ledger = ledger
+        self.force = force
+        self._checker = None
+        if ledger:
+            self._checker = ThreadPoolExecutor(max_workers=max(1, self.config.MAX_WORKERS),
+                                               thread_name_prefix="ledger-check")
+
+        # 処理したファイルを記録する監視ディレクトリごとのファイル一覧 (次回の起動時の比較用)
+        self.snapshots = sorted(snapshots or [], key=lambda snapshot: -len(snapshot.directory))
+
+        # 変換処理を行うワーカープール (指定がなければ自前で起動)
+        self._owns_executor = executor is None
+        self.executor = executor or create_worker_pool(self.config.MAX_WORKERS)
+
+        # 書き込みが終わったファイルをワーカープールに回すキュー
+        # (ワーカーが空き次第次のファイルを処理できるよう、ワーカー数の2倍まで送っておく)
+        self.queue = DebouncedFileQueue(self._dispatch, max_in_flight or self.config.MAX_WORKERS * 2)
+        self.queue.start()
+
+        # 検出から出力までの秒数
+        self.latencies = []
+        self._latency_lock = threading.Lock()
+
+    @property
+    def config(self):
+        """
+        設定を取得
+
+        init_config() は設定ファイルが更新された場合のみ読み直すため、
+        長時間の監視中でも設定の変更が反映される。
         """
-        標準出力から出力ファイルパスを抽出
+        return self._config or init_config()
+
+    def close(self):
+        """キューを停止し、処理中のファイルの完了を待つ (自前で起動したワーカープールは停止)"""
+        self.queue.stop()
+        if self._checker:
+            self._checker.shutdown(wait=True)
+        if self._owns_executor:
+            self.executor.shutdown(wait=True)
+
+    def route_for(self, file_path: str) -> Optional[WatchRoute]:
+        """ファイルの振り分け (対象外の場合はNone)"""
+        for route in self.routes:
+            if route.matches(file_path):
+                return route
+        return None
+
+    def enqueue(self, file_path: str):
+        """ファイルをキューに追加 (一時ファイルと振り分けの対象外のファイルは無視)"""
+        if is_temporary_file(file_path) or self.route_for(file_path) is None:
+            return
+
+        if self.queue.push(file_path):
+            logger.info(f"新しいファイルを検出しました: {file_path}")
+            console.print(f"[bold green]新しいファイルを検出:[/] {os.path.basename(file_path)}")
+
+    def on_created(self, event):
+        """ファイル作成イベント"""
+        if event.is_directory:
+            return
+        self.enqueue(event.src_path)
+
+    def on_modified(self, event):
+        """ファイル変更イベント (書き込み中のファイルは書き込みが終わるまで待つ)"""
+        if event.is_directory:
+            return
+        self.enqueue(event.src_path)
+
+    def on_moved(self, event):
+        """ファイル移動イベント"""
+        if event.is_directory:
+            return
+
+        # 一時ファイルからのリネームなど、移動元は処理しない
+        self.queue.discard(event.src_path)
+
+        # 移動先が振り分けの対象であれば処理
+        self.enqueue(event.dest_path)
+
+    def _dispatch(self, file_path: str, detected_at: float):
+        """
+        書き込みが終わったファイルを変換に回す (キューのスレッドから呼び出され、完了を待たない)
+
+        台帳を使用する場合は、台帳の確認と変換の開始を確認用のスレッドで行う。
 
         Args:
-            output: 標準出力テキスト
+            file_path: 処理するファイルパス
+            detected_at: ファイルを検出した時刻
+        """
+        config = self.config
+        route = self.route_for(file_path)
+        if route is None:
+            self._finish(file_path)
+            return
+        template_path = route.template_path or str(config.TEMPLATE_PATH)
+        output_dir = route.output_dir or config.OUTPUT_DIR
+
+        # 従業員名を取得
+        employee_name = extract_employee_name_from_filename(os.path.basename(file_path))
+        if not employee_name:
+            employee_name = route.employee_name or config.EMPLOYEE_NAME
+
+        if self._checker:
+            self._checker.submit(self._check_ledger, file_path, detected_at, template_path, output_dir,
+                                 employee_name, config.CSV_ENGINE)
+        else:
+            self._submit(file_path, detected_at, template_path, output_dir, employee_name, config.CSV_ENGINE)
+
+    def _check_ledger(self, file_path: str, detected_at: float, template_path: str, output_dir: str,
+                      employee_name: str, csv_engine: str):
+        """
+        同じ内容のファイルから作成済みの勤怠表があればスキップし、なければ変換に回す (確認用のスレッド)
 
-        Returns:
-            str or None: 抽出したファイルパス
+        Args:
+            file_path: 処理するファイルパス
+            detected_at: ファイルを検出した時刻
+            template_path: テンプレートファイルのパス
+            output_dir: 出力ディレクトリ
+            employee_name: 従業員名
+            csv_engine: CSVの読み込みエンジン
         """
-        import re
+        try:
+            key, existing = self.ledger.check(file_path, template_path, employee_name, output_dir)
+            if existing and not self.force:
+                logger.info(f"変更がないためスキップしました: {file_path} -> {existing}")
+                console.print(f"[bold yellow]スキップ:[/] {os.path.basename(file_path)} (作成済み: {os.path.basename(existing)})")
+                self._finish(file_path)
+                return
+            self._submit(file_path, detected_at, template_path, output_dir, employee_name, csv_engine, key)
+        except Exception as e:
+            logger.exception(f"ファイルを処理に回せませんでした: {file_path}: {str(e)}")
+            self._finish(file_path, handled=False)
+
+    def _submit(self, file_path: str, detected_at: float, template_path: str, output_dir: str,
+                employee_name: str, csv_engine: str, key: Optional[tuple] = None):
+        """ファイルをワーカープールで変換 (完了を待たない)"""
+        logger.info(f"処理を開始します: {file_path} (従業員名: {employee_name})")
+
+        future = self.executor.submit(
+            convert_file,
+            file_path,
+            template_path,
+            output_dir,
+            employee_name,
+            csv_engine,
+        )
+        future.add_done_callback(lambda f: self._on_done(file_path, detected_at, f, key))
+
+    def _on_done(self, file_path: str, detected_at: float, future: Future, key: Optional[tuple] = None):
+        """
+        変換の完了時の処理 (ワーカープールのスレッドから呼び出される)
 
-        # パターン: '✅ 勤怠表を作成しました: {path}'
-        match = re.search(r'勤怠表を作成しました: (.+?)$', output, re.MULTILINE)
-        if match:
-            return match.group(1).strip()
+        Args:
+            file_path: 処理したファイルパス
+            detected_at: ファイルを検出した時刻
+            future: 変換処理の Future (processors.pipeline.convert_file の戻り値)
+            key: 台帳のキー (成功した場合に記録する)
+        """
+        result = None
+        try:
+            result = future.result()
+        except Exception as e:
+            # ワーカープロセス自体の異常終了など
+            logger.exception(f"ファイル処理エラー: {str(e)}")
+            result = {"file": file_path, "success": False, "output": None, "elapsed": 0.0, "message": str(e)}
+        finally:
+            # 失敗したファイルはファイル一覧に加えず、次回の起動時にもう一度処理する
+            self._finish(file_path, handled=bool(result and result["success"]))
+
+        latency = time.time() - detected_at
+        with self._latency_lock:
+            self.latencies.append(latency)
+
+        if result["success"] and key and self.ledger:
+            self.ledger.record(key, file_path, result["output"])
+
+        if result["success"]:
+            logger.info(
+                f"処理完了: {file_path} -> {result['output']} "
+                f"(検出から {latency:.2f}秒, 変換 {result['elapsed']:.2f}秒)"
+            )
+            console.print(f"[bold green]処理完了:[/] {os.path.basename(file_path)} (検出から {latency:.2f}秒)")
+            console.print(f"[bold]出力ファイル:[/] {os.path.basename(result['output'])}")
+        else:
+            logger.error(f"処理エラー: {file_path}: {result['message']}")
+            console.print(f"[bold red]処理エラー:[/] {result['message']}")
+
+    def _finish(self, file_path: str, handled: bool = True):
+        """
+        ファイルの処理が終わった (キューから外し、変換またはスキップした場合はファイル一覧に加える)
 
-        return None
+        Args:
+            file_path: 処理したファイルパス
+            handled: 変換に成功したか、作成済みのためスキップしたかどうか
+        """
+        if not handled:
+            self.queue.done(file_path)
+            return
+        for snapshot in self.snapshots:
+            if os.path.normcase(os.path.abspath(file_path)).startswith(
+                    os.path.normcase(os.path.join(snapshot.directory, ""))):
+                snapshot.update(file_path)
+                break
+        self.queue.done(file_path)
 
+    def latency_summary(self) -> Dict[str, float]:
+        """
+        検出から出力までの秒数の集計
 
-def start_watching(directory: str, pattern: str = "*.csv", duration_hours: int = 8):
+        Returns:
+            dict: count, mean, p50, p95, max (処理したファイルがない場合は count のみ)
+        """
+        with self._latency_lock:
+            values = sorted(self.latencies)
+        if not values:
+            return {"count": 0}
+        return {
+            "count": len(values),
+            "mean": sum(values) / len(values),
+            "p50": values[len(values) // 2],
+            "p95": values[min(len(values) - 1, int(len(values) * 0.95))],
+            "max": values[-1],
+        }
+
+
+def start_watching(directory: Optional[str] = None, patterns: Optional[List[str]] = None, duration_hours: int = 8,
+                   force: bool = False, observer_mode: Optional[str] = None, interval: Optional[float] = None,
+                   routes: Optional[List[WatchRoute]] = None):
     """
     指定されたディレクトリを監視
 
+    振り分け表を指定した場合は、すべての監視ディレクトリを1つのオブザーバーと
+    ワーカープールで監視し、ファイルごとに振り分けの設定で変換する。
+
     Args:
-        directory: 監視するディレクトリ
-        pattern: ファイルパターン
+        directory: 監視するディレクトリ (routes を指定した場合は使用しない、Noneの場合は設定値 input_dir)
+        patterns: ファイルパターン (文字列も可、Noneの場合は設定値 watch_patterns)
         duration_hours: 監視を継続する時間（時間）。デフォルトは8時間（業務時間）
+        force: 同じ内容のファイルから作成済みの勤怠表があっても作り直すかどうか
+        observer_mode: 監視方式 "native" / "polling" (Noneの場合は設定値 watch_observer)
+        interval: ポーリングの間隔 (秒、Noneの場合は設定値 watch_interval)
+        routes: 監視ディレクトリの振り分け表
     """
     # 初期化
     config = init_config()
-
-    # ディレクトリの絶対パスを取得
-    directory = os.path.abspath(directory)
+    if not routes:
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        routes = load_routes([{"directory": directory or config.INPUT_DIR, "patterns": patterns}], config)
 
     # ディレクトリが存在しない場合は作成
-    if not os.path.exists(directory):
-        os.makedirs(directory, exist_ok=True)
-        logger.info(f"監視ディレクトリを作成しました: {directory}")
+    roots = watch_roots(routes)
+    for root in roots:
+        if not os.path.exists(root):
+            os.makedirs(root, exist_ok=True)
+            logger.info(f"監視ディレクトリを作成しました: {root}")
 
     # 終了時刻の計算
     end_time = None
@@ -210,37 +926,43 @@ def start_watching(directory: str, pattern: str = "*.csv", duration_hours: int =
         logger.info(f"監視時間: {duration_hours}時間 (終了予定: {end_time.strftime('%H:%M:%S')})")
         console.print(f"[bold]監視時間:[/] {duration_hours}時間 (終了予定: {end_time.strftime('%H:%M:%S')})")
 
-    # 既存のファイルを確認
-    existing_files = []
-    for root, _, files in os.walk(directory):
-        for file in files:
-            if watchdog.events.match_path(pattern, file):
-                existing_files.append(os.path.join(root, file))
-
-    if existing_files:
-        console.print(f"[bold yellow]既存のファイルが{len(existing_files)}件見つかりました[/]")
-        for file in existing_files:
-            console.print(f"  - {os.path.basename(file)}")
-
-        # 既存ファイルを処理するかどうか確認
-        process_existing = input("既存のファイルを処理しますか？ (y/n): ").strip().lower() == 'y'
+    # 変換ワーカーを起動 (すべての監視ディレクトリで共有し、各ワーカーでテンプレートを解析しておく)
+    templates = list(dict.fromkeys(route.template_path for route in routes))
+    executor = create_worker_pool(config.MAX_WORKERS, templates=templates)
 
-        if process_existing:
-            handler = FileHandler(patterns=[pattern], config=config)
-            for file in existing_files:
-                handler.on_created(watchdog.events.FileCreatedEvent(file))
+    # イベントハンドラの設定 (処理済みファイルの台帳は再起動後も引き継ぐ)
+    ledger = ProcessingLedger(os.path.join(config.LOG_DIR, LEDGER_FILENAME))
+    snapshots = [DirectorySnapshot(root, config.CACHE_DIR) for root in roots]
+    event_handler = FileHandler(routes, executor=executor, ledger=ledger, force=force, snapshots=snapshots)
 
-    # イベントハンドラの設定
-    event_handler = FileHandler(patterns=[pattern], config=config)
-    observer = watchdog.observers.Observer()
-    observer.schedule(event_handler, directory, recursive=True)
+    observer = create_observer(observer_mode or config.WATCH_OBSERVER, interval or config.WATCH_INTERVAL)
+    for root in roots:
+        observer.schedule(event_handler, root, recursive=True)
 
-    # 監視開始
+    # 監視開始 (一覧との比較中に追加されたファイルも取りこぼさないよう、先に監視を開始する)
     observer.start()
-    logger.info(f"ディレクトリの監視を開始しました: {directory}, パターン: {pattern}")
-    console.print(f"[bold green]監視開始:[/] {directory} ({pattern})")
+    for route in routes:
+        pattern = ", ".join(route.patterns)
+        logger.info(f"ディレクトリの監視を開始しました: {route.directory}, パターン: {pattern}, 出力先: {route.output_dir}")
+        console.print(f"[bold green]監視開始:[/] {route.directory} ({pattern}) -> {route.output_dir}")
     console.print("監視を停止するには Ctrl+C を押してください")
 
+    # 停止中に追加・変更されたファイルを処理 (初回は現在のファイル一覧を記録するのみ)
+    for snapshot in snapshots:
+        started = time.perf_counter()
+        changed_files = snapshot.catch_up(lambda path: event_handler.route_for(path) is not None)
+        elapsed = time.perf_counter() - started
+        if changed_files is None:
+            logger.info(f"ファイル一覧を記録しました (既存のファイルは処理しません): {snapshot.directory}, {elapsed:.2f}秒")
+            console.print(f"[bold yellow]初回の起動のため、既存のファイルは処理せずに一覧を記録しました:[/] {snapshot.directory}")
+            continue
+        logger.info(f"停止中に追加・変更されたファイル: {snapshot.directory}, {len(changed_files)}件 ({elapsed:.2f}秒)")
+        if changed_files:
+            console.print(f"[bold yellow]停止中に追加・変更されたファイルを処理します: {len(changed_files)}件[/] ({snapshot.directory})")
+        for file in changed_files:
+            event_handler.enqueue(file)
+
+    last_saved = time.monotonic()
     try:
         while True:
             # 終了時間のチェック
@@ -249,11 +971,31 @@ def start_watching(directory: str, pattern: str = "*.csv", duration_hours: int =
                 console.print(f"[bold yellow]指定された監視時間({duration_hours}時間)が経過したため終了します[/]")
                 break
 
+            # 強制終了に備えてファイル一覧を定期的に保存
+            if time.monotonic() - last_saved >= SNAPSHOT_SAVE_INTERVAL:
+                for snapshot in snapshots:
+                    snapshot.save()
+                last_saved = time.monotonic()
+
             time.sleep(1)
     except KeyboardInterrupt:
+        pass
+    finally:
         observer.stop()
 
     observer.join()
+    event_handler.close()
+    executor.shutdown(wait=True)
+    ledger.close()
+    for snapshot in snapshots:
+        snapshot.save()
+
+    summary = event_handler.latency_summary()
+    if summary["count"]:
+        logger.info(
+            f"検出から出力までの秒数: {summary['count']}件, 平均 {summary['mean']:.2f}秒, "
+            f"中央値 {summary['p50']:.2f}秒, 95% {summary['p95']:.2f}秒, 最大 {summary['max']:.2f}秒"
+        )
     logger.info("監視を停止しました")
     console.print("[bold yellow]監視を停止しました[/]")
 
@@ -265,4 +1007,4 @@ if __name__ == "__main__":
     setup_logging()
 
     # デフォルトは input ディレクトリを監視（8時間 = 業務時間）
-    start_watching("input", "*.csv", 8)
\ No newline at end of file
+    start_watching("input", ["*.csv"], 8)